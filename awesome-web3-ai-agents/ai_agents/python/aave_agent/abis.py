@@ -0,0 +1,106 @@
+"""
+ABIs
+-------------------
+What:
+ツールで使うコントラクトのABIをまとめて定義します。モジュールの読み込み時に1度だけ読み込まれます。
+
+This script holds every ABI used by the tools so that they are parsed once at import time instead of being
+re-declared inside each tool call.
+
+Variables:
+    aave_lending_pool_address
+    aave_lending_pool_abi
+    erc20_abi
+"""
+
+import json
+# Built in python imports
+import os
+
+# aave's pool address on the blockchain (kept here so that scripts can use it without importing tools.py)
+# AAVEのプールのアドレス
+aave_lending_pool_address = "0x6Ae43d3271ff6888e7Fc43Fd7321a503ff738951"
+
+# Load AAVE Lending Pool ABI - the ABI allows us to know what functions are available
+# AAVE Lending Pool ABIの読み込み
+current_dir = os.path.dirname(os.path.abspath(__file__))
+abi_path = os.path.join(current_dir, 'aave_lending_pool_abi_testnet.json')
+with open(abi_path, 'r') as abi_file:
+    aave_lending_pool_abi = json.load(abi_file)
+
+# Minimal ERC20 ABI covering every token function the tools use
+# ツールで使うERC20の関数だけを定義した最小限のABI
+erc20_abi = [
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "_spender", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "approve",
+        "outputs": [{"name": "", "type": "bool"}],
+        "payable": False,
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [
+            {"name": "_owner", "type": "address"},
+            {"name": "_spender", "type": "address"}
+        ],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "_owner", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "totalSupply",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "symbol",
+        "outputs": [{"name": "", "type": "string"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "name",
+        "outputs": [{"name": "", "type": "string"}],
+        "type": "function"
+    },
+    # EIP-2612 permit (only implemented by some tokens, see allowances.py)
+    {
+        "constant": True,
+        "inputs": [{"name": "owner", "type": "address"}],
+        "name": "nonces",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "DOMAIN_SEPARATOR",
+        "outputs": [{"name": "", "type": "bytes32"}],
+        "type": "function"
+    }
+]
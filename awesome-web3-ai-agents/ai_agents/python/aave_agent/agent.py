@@ -0,0 +1,146 @@
+"""
+Agent
+-------------------
+What:
+AAVEエージェントのLangGraphグラフを組み立てます。グラフはエージェントレジストリに (APIキー, モデル, ツール) ごとに
+キャッシュされ、Streamlitの再実行やユーザー間で使い回されます。
+
+This script builds the LLM client, binds the tools and compiles the LangGraph graph of the AAVE agent. main.py
+gets the graph through get_graph(), which returns the cached graph for the API key (see agent_registry.py).
+Everything that differs per user (wallet address in the system prompt, chat thread) is passed in the run config:
+
+    config = {"configurable": {"thread_id": ..., "system_prompt": ...}}
+
+Functions:
+    get_graph
+"""
+
+# Python Built In Libraries
+from typing import (  # used to set additional metadata for a variable
+    Annotated, List)
+
+from agent_registry import get_agent_registry
+# Tools - async implementations so that ToolNode runs the tool calls of a turn in parallel
+from async_tools import (borrow_crypto, get_lending_history, get_portfolio,
+                         get_token_balance, get_transaction_status,
+                         lend_crypto)
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_groq import ChatGroq
+# Langchain / Langraph
+from langgraph.checkpoint.memory import \
+    MemorySaver  # keeps the graph state of every chat thread between turns
+from langgraph.graph import \
+    START  # type of node (a python function which has some kind of logic) which takes user input and sends it into the graph
+from langgraph.graph import \
+    StateGraph  # data structure which represents the current snapshot of an application
+from langgraph.graph.message import \
+    add_messages  # appends messages to the end of the attribute it was assigned to
+from langgraph.prebuilt import \
+    ToolNode  # a pre-built component and node whichs runs the tools called in the last AIMessage
+from langgraph.prebuilt import \
+    tools_condition  # a pre-built component and node which uses the conditional_edge to route to the ToolNode if the last message has tool calls. Otherwise, route to the end.
+from memory import get_prompt_metrics, memory_from_env
+from agent_common.tool_output import ToolOutputCompactor, get_full_tool_output
+from typing_extensions import \
+    TypedDict  # a type that allows you to define dictionaries with specific key-value types
+
+MODEL = "llama3-70b-8192"
+
+# Initialize Tools
+# 使うツールを初期化する。
+tools = [
+    get_token_balance, get_portfolio, lend_crypto, borrow_crypto, get_transaction_status, get_lending_history,
+    get_full_tool_output,
+]
+
+# One checkpointer for the process, shared by every graph, each chat has its own thread in it
+# チェックポインターはプロセス全体で1つだけ作成する
+checkpointer = MemorySaver()
+prompt_metrics = get_prompt_metrics()
+
+
+# State Management
+class State(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    summary: str  # running summary of the messages dropped by the memory policy
+
+
+# LangGraphのグラフを組み立てるメソッド
+def build_graph(groq_api_key: str, model: str = MODEL):
+    """
+    Build the LLM client and compile the agent graph.
+
+    Args:
+        groq_api_key (str): The Groq API key
+        model (str): The Groq model name
+
+    Returns:
+        CompiledStateGraph: The compiled graph using the shared checkpointer
+    """
+    llm = ChatGroq(model=model, api_key=groq_api_key)
+    llm_with_tools = llm.bind_tools(tools=tools)
+
+    # Graph Builder Setup
+    graph_builder = StateGraph(State)
+
+    # Memory policy applied at the start of every turn (see memory.py)
+    # LLMに送る会話履歴を制限するメモリーポリシー
+    memory = memory_from_env(llm)
+
+    # Chatbot Function
+    # chatbot 関数（グラフは ainvoke で実行するため非同期で定義する）
+    async def chatbot(state: State, config: RunnableConfig):
+        # The system prompt is not stored in the thread, it is put in front of the kept messages on every call
+        messages = memory.prompt(config["configurable"]["system_prompt"], state)
+
+        # Get response from LLM with the conversation kept by the memory policy
+        # AIに推論を実行させる。
+        response = await llm_with_tools.ainvoke(messages)
+        prompt_metrics.record(config["configurable"]["thread_id"], messages, response)
+
+        return {"messages": [response]}
+
+    # Node Configuration
+    # AI Agent用のワークフローを作成する。
+    # With ainvoke, ToolNode gathers every tool call of a turn concurrently
+    tools_node = ToolNode(tools=tools)
+    # ツールの出力をトークン予算に収まるように圧縮するノード（元の出力はサイドストアに保存する）
+    compact_node = ToolOutputCompactor({"get_portfolio": 400, "get_lending_history": 400})
+    graph_builder.add_node("memory", memory)
+    graph_builder.add_node("chatbot", chatbot)
+    graph_builder.add_node("tools", tools_node)
+    graph_builder.add_node("compact", compact_node)
+
+    # Edge Configuration
+    graph_builder.add_conditional_edges(
+        "chatbot",
+        tools_condition,
+    )
+    graph_builder.add_edge("tools", "compact")
+    graph_builder.add_edge("compact", "chatbot")
+    graph_builder.add_edge(START, "memory")
+    graph_builder.add_edge("memory", "chatbot")
+
+    # Compile Graph
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+# キャッシュされたグラフを取得するメソッド
+def get_graph(groq_api_key: str, model: str = MODEL):
+    """
+    Get the compiled graph for the API key and model, built once per process.
+
+    Args:
+        groq_api_key (str): The Groq API key
+        model (str): The Groq model name
+
+    Returns:
+        CompiledStateGraph: The cached compiled graph
+    """
+    return get_agent_registry().get(
+        groq_api_key,
+        model,
+        [agent_tool.name for agent_tool in tools],
+        lambda: build_graph(groq_api_key, model),
+    )
@@ -0,0 +1,211 @@
+"""
+Agent Registry
+-------------------
+What:
+LLMクライアントとコンパイル済みのLangGraphグラフをプロセス全体で共有するレジストリです。
+Streamlitは操作のたびにスクリプトを先頭から再実行しますが、グラフは (APIキー, モデル, ツール) ごとに1度だけ作成されます。
+また、非同期のグラフを実行するためのイベントループもプロセス全体で1つだけ起動して使い回します。
+
+Streamlit re-executes main.py on every interaction. The registry builds the ChatGroq client, binds the tools and
+compiles the graph once per (API key, model, tool set) and hands the same objects to every rerun and user.
+run_async() executes coroutines on one long-lived event loop, so the async HTTP clients cached by the LLM client
+and AsyncWeb3 keep their connections instead of being tied to a new asyncio.run() loop per turn.
+
+Environment:
+    AGENT_REGISTRY_SIZE: Maximum number of cached agents (default 32)
+
+Functions:
+    get_agent_registry
+    run_async
+    stream_async
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+# Built in python imports
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import (Any, AsyncIterator, Callable, Coroutine, Dict, Iterable,
+                    Iterator, Optional, Tuple)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_SIZE = 32
+
+
+class AgentRegistry:
+    """
+    LRU cache of built agents keyed by (API key fingerprint, model, tool names).
+
+    The API key itself is never stored in the key, only its sha256 fingerprint.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_REGISTRY_SIZE):
+        self.max_size = max_size
+        self._agents: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[Tuple, threading.Lock] = {}
+        self._counters = {'hits': 0, 'builds': 0, 'build_seconds': 0.0}
+
+    @staticmethod
+    def key(api_key: str, model: str, tool_names: Iterable[str]) -> Tuple:
+        return (hashlib.sha256(api_key.encode()).hexdigest(), model, tuple(sorted(tool_names)))
+
+    def get(self, api_key: str, model: str, tool_names: Iterable[str], build: Callable[[], Any]) -> Any:
+        """
+        Get the agent for the API key, model and tool set, building it on first use.
+
+        Args:
+            api_key (str): The LLM API key
+            model (str): The model name
+            tool_names (Iterable[str]): Names of the tools bound to the agent
+            build (Callable[[], Any]): Builds the agent (LLM client, tools, compiled graph) on a cache miss
+
+        Returns:
+            Any: The cached agent
+        """
+        key = self.key(api_key, model, tool_names)
+        with self._lock:
+            if key in self._agents:
+                self._agents.move_to_end(key)
+                self._counters['hits'] += 1
+                return self._agents[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Concurrent first requests for the same agent build it only once
+        with build_lock:
+            with self._lock:
+                if key in self._agents:
+                    self._counters['hits'] += 1
+                    return self._agents[key]
+            start = time.perf_counter()
+            agent = build()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._agents[key] = agent
+                self._build_locks.pop(key, None)
+                self._counters['builds'] += 1
+                self._counters['build_seconds'] += elapsed
+                while len(self._agents) > self.max_size:
+                    self._agents.popitem(last=False)
+        logger.info("Built agent for model %s with tools %s in %.1f ms", model, sorted(tool_names), elapsed * 1000)
+        return agent
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of cached agents, registry hits, builds and total build time."""
+        with self._lock:
+            return dict(self._counters, agents=len(self._agents))
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_agent_registry: Optional[AgentRegistry] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_registry_lock = threading.Lock()
+
+
+# 共有のエージェントレジストリを取得するメソッド
+def get_agent_registry() -> AgentRegistry:
+    """
+    Get the process-wide agent registry.
+
+    Returns:
+        AgentRegistry: The shared registry
+    """
+    global _agent_registry
+    if _agent_registry is None:
+        with _registry_lock:
+            if _agent_registry is None:
+                _agent_registry = AgentRegistry(int(os.getenv("AGENT_REGISTRY_SIZE", DEFAULT_REGISTRY_SIZE)))
+    return _agent_registry
+
+
+# 共有のイベントループを取得するメソッド（初回はバックグラウンドスレッドで起動する）
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    global _event_loop
+    if _event_loop is None:
+        with _registry_lock:
+            if _event_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+                _event_loop = loop
+    return _event_loop
+
+
+async def _run_in_context(coroutine: Coroutine, context: contextvars.Context) -> Any:
+    # The task runs in the loop thread's context, copy the caller's context variables (e.g. the chat session)
+    for variable, value in context.items():
+        variable.set(value)
+    return await coroutine
+
+
+# コルーチンを共有のイベントループで実行し、結果を待つメソッド
+def run_async(coroutine: Coroutine) -> Any:
+    """
+    Run a coroutine on the shared event loop and wait for its result, a drop-in replacement for asyncio.run().
+
+    Context variables of the caller are visible inside the coroutine.
+
+    Args:
+        coroutine (Coroutine): The coroutine to run, e.g. graph.ainvoke(...)
+
+    Returns:
+        Any: The coroutine's result
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        _run_in_context(coroutine, contextvars.copy_context()),
+        _get_event_loop(),
+    )
+    return future.result()
+
+
+# Marks the end of a stream in the hand-over queue
+_STREAM_END = object()
+
+
+async def _drain(stream: AsyncIterator, items: "queue.Queue") -> None:
+    try:
+        async for item in stream:
+            items.put(item)
+    except BaseException as error:
+        items.put(error)
+        raise
+    finally:
+        items.put(_STREAM_END)
+
+
+# 非同期ストリームを共有のイベントループで実行し、同期のイテレーターとして受け取るメソッド
+def stream_async(stream: AsyncIterator) -> Iterator:
+    """
+    Consume an async iterator on the shared event loop and yield its items in the calling thread.
+
+    The whole stream runs as one task (context variables set inside it stay valid between items), the items are
+    handed over through a queue. If the caller stops early, e.g. on a Streamlit rerun, the task is cancelled.
+
+    Args:
+        stream (AsyncIterator): The async iterator, e.g. graph.astream(...)
+
+    Yields:
+        Any: The items of the stream, exceptions raised by the stream are re-raised here
+    """
+    items: "queue.Queue" = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        _run_in_context(_drain(stream, items), contextvars.copy_context()),
+        _get_event_loop(),
+    )
+    try:
+        while True:
+            item = items.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
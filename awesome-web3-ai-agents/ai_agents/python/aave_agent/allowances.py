@@ -0,0 +1,219 @@
+"""
+Allowances
+-------------------
+What:
+ERC20のallowance（承認済みの額）をキャッシュし、既に十分な承認がある場合はapproveトランザクションを省略できるようにします。
+トークンがEIP-2612のpermitに対応している場合は、署名だけで承認を行い supplyWithPermit で1トランザクションにまとめます。
+
+lend_crypto used to send an approve transaction before every supply. This script reads allowance(owner, spender)
+through a short-lived cache that is invalidated whenever our own transactions change the allowance, so the approval
+can be skipped when it already covers the amount. For tokens implementing EIP-2612 it can also sign a permit so
+that approve + supply become a single supplyWithPermit transaction.
+
+Environment:
+    ALLOWANCE_CACHE_TTL: Seconds a cached allowance is trusted (default 300)
+    USE_PERMIT: "true" to use EIP-2612 permit + supplyWithPermit when the token supports it (default false)
+    PERMIT_DEADLINE: Seconds a signed permit stays valid (default 1800)
+
+Functions:
+    get_allowance_cache
+"""
+
+import logging
+# Built in python imports
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from abis import erc20_abi
+from contract_cache import get_contract_cache
+from eth_abi import encode
+from eth_account.signers.local import LocalAccount
+from eth_utils import keccak
+from rpc_batch import ReadBatch
+from rpc_pool import get_web3
+from token_registry import get_token_registry
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALLOWANCE_TTL = 300
+DEFAULT_PERMIT_DEADLINE = 1800
+
+use_permit = os.getenv("USE_PERMIT", "false").lower() == "true"
+
+EIP712_DOMAIN_TYPEHASH = keccak(
+    text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+)
+# Token versions tried when matching the token's DOMAIN_SEPARATOR
+PERMIT_VERSIONS = ("1", "2")
+
+
+class AllowanceCache:
+    """
+    TTL cache of ERC20 allowances keyed by (token, owner, spender), plus EIP-2612 permit signing.
+    """
+
+    def __init__(self, web3: Web3, ttl: float = DEFAULT_ALLOWANCE_TTL):
+        self.web3 = web3
+        self.ttl = ttl
+        self._allowances: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+        # token -> permit version matching its DOMAIN_SEPARATOR, None if the token does not support permit
+        self._permit_versions: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str, owner: str, spender: str) -> Tuple[str, str, str]:
+        return (Web3.to_checksum_address(token), Web3.to_checksum_address(owner), Web3.to_checksum_address(spender))
+
+    def get(self, token: str, owner: str, spender: str) -> int:
+        """
+        Get the allowance of spender over owner's tokens, reading the chain only on a cache miss.
+
+        Args:
+            token (str): The token address
+            owner (str): The token holder
+            spender (str): The approved contract, e.g. the AAVE pool
+
+        Returns:
+            int: The allowance in token base units
+        """
+        key = self._key(token, owner, spender)
+        with self._lock:
+            cached = self._allowances.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+        token_contract = get_contract_cache().get(key[0], erc20_abi)
+        allowance = token_contract.functions.allowance(key[1], key[2]).call()
+        with self._lock:
+            self._allowances[key] = (allowance, time.monotonic())
+        logger.debug("Allowance of %s over %s's %s: %s", key[2], key[1], key[0], allowance)
+        return allowance
+
+    def invalidate(self, token: str, owner: str, spender: str) -> None:
+        """
+        Forget a cached allowance. Call this whenever one of our transactions approves or spends it.
+        """
+        with self._lock:
+            self._allowances.pop(self._key(token, owner, spender), None)
+
+    # トークンのDOMAIN_SEPARATORと一致するpermitのバージョンを探すメソッド
+    def _permit_version(self, token: str, domain_separator: bytes, chain_id: int) -> Optional[str]:
+        name = get_token_registry().get(token)['name']
+        if name is None:
+            return None
+        for version in PERMIT_VERSIONS:
+            expected = keccak(encode(
+                ['bytes32', 'bytes32', 'bytes32', 'uint256', 'address'],
+                [EIP712_DOMAIN_TYPEHASH, keccak(text=name), keccak(text=version), chain_id, token],
+            ))
+            if expected == domain_separator:
+                return version
+        return None
+
+    def sign_permit(self, token: str, account: LocalAccount, spender: str, value: int) -> Optional[Dict]:
+        """
+        Sign an EIP-2612 permit for spender, if the token supports it.
+
+        Args:
+            token (str): The token address
+            account (LocalAccount): The token holder signing the permit
+            spender (str): The contract allowed to spend, e.g. the AAVE pool
+            value (int): The amount in token base units
+
+        Returns:
+            Optional[Dict]: deadline, v, r and s of the permit, None if the token does not support permit
+        """
+        token = Web3.to_checksum_address(token)
+        if self.supports_permit(token) is False:
+            return None
+        token_contract = get_contract_cache().get(token, erc20_abi)
+        batch = ReadBatch(self.web3)
+        batch.add_call(token_contract.functions.nonces(account.address))
+        batch.add_call(token_contract.functions.DOMAIN_SEPARATOR())
+        try:
+            permit_nonce, domain_separator = batch.execute()
+        except Exception as e:
+            logger.info("Token %s does not support permit: %s", token, e)
+            with self._lock:
+                self._permit_versions[token] = None
+            return None
+
+        chain_id = get_token_registry().chain_id
+        with self._lock:
+            known = token in self._permit_versions
+            version = self._permit_versions.get(token)
+        if not known:
+            version = self._permit_version(token, domain_separator, chain_id)
+            with self._lock:
+                self._permit_versions[token] = version
+        if version is None:
+            logger.info("Could not match the permit domain of %s, falling back to approve", token)
+            return None
+
+        deadline = int(time.time()) + int(os.getenv("PERMIT_DEADLINE", DEFAULT_PERMIT_DEADLINE))
+        signed = account.sign_typed_data(
+            domain_data={
+                'name': get_token_registry().get(token)['name'],
+                'version': version,
+                'chainId': chain_id,
+                'verifyingContract': token,
+            },
+            message_types={
+                'Permit': [
+                    {'name': 'owner', 'type': 'address'},
+                    {'name': 'spender', 'type': 'address'},
+                    {'name': 'value', 'type': 'uint256'},
+                    {'name': 'nonce', 'type': 'uint256'},
+                    {'name': 'deadline', 'type': 'uint256'},
+                ],
+            },
+            message_data={
+                'owner': account.address,
+                'spender': Web3.to_checksum_address(spender),
+                'value': value,
+                'nonce': permit_nonce,
+                'deadline': deadline,
+            },
+        )
+        return {
+            'deadline': deadline,
+            'v': signed.v,
+            'r': signed.r.to_bytes(32, 'big'),
+            's': signed.s.to_bytes(32, 'big'),
+        }
+
+    def supports_permit(self, token: str) -> Optional[bool]:
+        """Whether the token is known to support permit, None if it has not been checked yet."""
+        with self._lock:
+            if Web3.to_checksum_address(token) not in self._permit_versions:
+                return None
+            return self._permit_versions[Web3.to_checksum_address(token)] is not None
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_allowance_cache: Optional[AllowanceCache] = None
+_allowance_cache_lock = threading.Lock()
+
+
+# 共有のallowanceキャッシュを取得するメソッド
+def get_allowance_cache() -> AllowanceCache:
+    """
+    Get the process-wide allowance cache bound to the shared Web3 instance.
+
+    Returns:
+        AllowanceCache: The shared allowance cache
+    """
+    global _allowance_cache
+    if _allowance_cache is None:
+        with _allowance_cache_lock:
+            if _allowance_cache is None:
+                _allowance_cache = AllowanceCache(
+                    get_web3(),
+                    ttl=float(os.getenv("ALLOWANCE_CACHE_TTL", DEFAULT_ALLOWANCE_TTL)),
+                )
+    return _allowance_cache
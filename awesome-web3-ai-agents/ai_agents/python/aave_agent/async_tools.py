@@ -0,0 +1,406 @@
+"""
+Async Tools
+-------------------
+What:
+tools.py のツールをAsyncWeb3上で非同期に実装したものです。LangGraphのToolNodeを ainvoke で実行すると、
+1ターンで複数のツール呼び出しがあっても並列に実行され、イベントループもブロックされません。
+
+Every tool in tools.py blocks on Web3.HTTPProvider. This script implements the same tools as coroutines on
+AsyncWeb3 and exports LangChain tools that carry both implementations under the same names and argument schemas:
+invoke() still runs the sync version from tools.py, ainvoke() runs the async one. When the graph runs with
+ainvoke, ToolNode gathers the tool calls of one turn, so several calls run concurrently.
+
+The nonce manager, fee oracle, allowance cache and token registry are shared with the sync tools so that both
+never hand out the same nonce. Their occasional chain reads (cache misses) run in a worker thread via
+asyncio.to_thread; the reads and sends specific to a tool call go through AsyncWeb3.
+
+Functions:
+    lend_crypto
+    borrow_crypto
+    get_token_balance
+    get_portfolio
+    get_transaction_status
+    get_lending_history
+    aget_user_account_data
+"""
+
+import asyncio
+import logging
+# Built in python imports
+from typing import Dict, List, Union
+
+import tools
+from abis import aave_lending_pool_abi, aave_lending_pool_address, erc20_abi
+from allowances import get_allowance_cache, use_permit
+from contract_cache import get_async_contract_cache
+from fee_oracle import get_fee_oracle
+from langchain_core.tools import BaseTool, StructuredTool
+from log_config import LazyHex
+from nonce_manager import get_nonce_manager
+from rpc_pool import get_async_web3
+from simulation import get_simulator, simulation_enabled
+from token_registry import get_token_registry
+from agent_common.tracing import get_tracer
+from tx_tracker import get_receipt_watcher, wait_for_receipts
+
+"""
+Initial Setup -> GLOBAL VARIABLES
+"""
+# AsyncWeb3 shares the endpoints and their health with the sync pool (see rpc_pool.py)
+# AsyncWeb3は同期版と同じエンドポイントを使う
+async_web3 = get_async_web3()
+async_contracts = get_async_contract_cache()
+
+# Shared with the sync tools (see tools.py)
+# 同期版のツールと共有するキャッシュ
+token_registry = get_token_registry()
+nonce_manager = get_nonce_manager()
+fee_oracle = get_fee_oracle()
+allowance_cache = get_allowance_cache()
+receipt_watcher = get_receipt_watcher()
+simulator = get_simulator()
+logger = logging.getLogger(__name__)
+
+
+# 署名済みトランザクションを送信し、失敗した場合は使われなかったナンスを返却するメソッド
+async def _send(signed_tx, address: str, unused_nonces: List[int]) -> bytes:
+    try:
+        return await async_web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+    except Exception as e:
+        logger.error("Failed to send raw transaction %s", LazyHex(signed_tx.hash))
+        logger.debug("Raw transaction: %s", LazyHex(signed_tx.raw_transaction))
+        await asyncio.to_thread(nonce_manager.release, address, unused_nonces)
+        raise e
+
+
+# コントラクト関数からEIP-1559トランザクションを作成するメソッド（ナンスは署名の直前に _sign で設定する）
+async def _build(account, contract_function, sync_function, fallback_gas: int) -> dict:
+    # The fee oracle estimates with the sync function (same calldata), a cache hit does not touch the chain
+    params = await asyncio.to_thread(fee_oracle.transaction_params, sync_function, account.address, fallback_gas)
+    return await contract_function.build_transaction({
+        'from': account.address,
+        'chainId': 11155111,                       # Sepolia testnet chain ID
+        'type': 2,                                 # EIP-1559 transaction type
+        **params
+    })
+
+
+# ナンスを確保してトランザクションに設定し、署名するメソッド
+async def _sign(account, *txs: dict) -> list:
+    # Nonces are reserved only after the build and the simulation, right before signing, so that a failure in
+    # those steps never leaves a gap that later transactions would queue behind
+    nonces = await asyncio.to_thread(nonce_manager.allocate, account.address, len(txs))
+    logger.debug("Allocated nonce(s): %s", nonces)
+    try:
+        signed = []
+        for tx, nonce in zip(txs, nonces):
+            tx['nonce'] = nonce
+            signed.append(account.sign_transaction(tx))
+        return signed
+    except Exception:
+        # Nothing was sent, give the reserved nonces back
+        await asyncio.to_thread(nonce_manager.release, account.address, nonces)
+        raise
+
+
+# 署名前にシミュレーションし、リバートする場合は理由を返すメソッド（see simulation.py）
+async def _preflight(label: str, tx: dict, approve_tx: dict = None) -> Union[str, None]:
+    if not simulation_enabled:
+        return None
+    with get_tracer().span("tx.simulate", label=label):
+        problem, gas = await asyncio.to_thread(simulator.preflight, tx, approve_tx)
+    if problem:
+        logger.warning("%s rejected before sending: %s", label.capitalize(), problem)
+        return f"Rejected before sending: {problem}"
+    if gas is not None:
+        # Estimated on top of the approval, replaces the fallback gas limit
+        tx['gas'] = int(gas * fee_oracle.gas_margin)
+    return None
+
+
+# AAVEプラットフォームに暗号通貨を貸し出す非同期メソッド
+async def _lend_crypto(amount: float, asset_address: str) -> Union[str, None]:
+    """Async implementation of tools.lend_crypto, see its docstring for the flow."""
+    logger.info("Attempting to lend %s of asset at %s (async)", amount, asset_address)
+
+    if tools._private_key is None:
+        logger.error("Private key not set. Please set private key before attempting transactions.")
+        return None
+
+    try:
+        # 凍結・停止中のリザーブや供給上限を超える貸し出しは送信前に拒否する（see reserve_index.py）
+        problem = await asyncio.to_thread(tools.reserve_index.check_supply, asset_address, amount)
+        if problem:
+            logger.warning("Supply rejected before sending: %s", problem)
+            return f"Rejected before sending: {problem}"
+
+        lending_pool = async_contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        token_contract = async_contracts.get(asset_address, erc20_abi)
+        sync_pool = tools.contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        sync_token = tools.contracts.get(asset_address, erc20_abi)
+
+        account = async_web3.eth.account.from_key(tools._private_key)
+        token_decimals = await asyncio.to_thread(token_registry.get_decimals, asset_address)
+        amount_in_wei = int(amount * 10**token_decimals)
+        logger.debug("Amount in token base units: %s", amount_in_wei)
+
+        # 既存のallowanceで足りる場合はapproveを省略し、permitが使える場合は署名で代用する。
+        current_allowance = await asyncio.to_thread(
+            allowance_cache.get, asset_address, account.address, aave_lending_pool_address
+        )
+        permit = None
+        needs_approve = current_allowance < amount_in_wei
+        if needs_approve and use_permit:
+            permit = await asyncio.to_thread(
+                allowance_cache.sign_permit, asset_address, account, aave_lending_pool_address, amount_in_wei
+            )
+            needs_approve = permit is None
+
+        approve_tx = None
+        if needs_approve:
+            approve_args = (aave_lending_pool_address, amount_in_wei)
+            approve_tx = await _build(
+                account,
+                token_contract.functions.approve(*approve_args),
+                sync_token.functions.approve(*approve_args),
+                fallback_gas=100000,
+            )
+
+        # AAVEへの貸し出しトランザクションを作成する。
+        if permit is not None:
+            supply_fn = 'supplyWithPermit'
+            supply_args = (asset_address, amount_in_wei, account.address, 0,
+                           permit['deadline'], permit['v'], permit['r'], permit['s'])
+        else:
+            supply_fn = 'supply'
+            supply_args = (asset_address, amount_in_wei, account.address, 0)
+        supply_tx = await _build(
+            account,
+            lending_pool.functions[supply_fn](*supply_args),
+            sync_pool.functions[supply_fn](*supply_args),
+            fallback_gas=700000,
+        )
+
+        # 署名する前にシミュレーションし、リバートする場合は送信しない
+        problem = await _preflight("supply", supply_tx, approve_tx)
+        if problem:
+            return problem
+
+        # The supply takes the nonce right after the approval (if any)
+        if approve_tx is not None:
+            signed_approve, signed_supply = await _sign(account, approve_tx, supply_tx)
+        else:
+            signed_supply, = await _sign(account, supply_tx)
+
+        tx_hash_approve = None
+        if approve_tx is not None:
+            try:
+                # Both nonces are unused when the approval can not be sent
+                tx_hash_approve = await _send(signed_approve, account.address, [approve_tx['nonce'], supply_tx['nonce']])
+            finally:
+                allowance_cache.invalidate(asset_address, account.address, aave_lending_pool_address)
+            logger.info("Approval Transaction Hash: %s", async_web3.to_hex(tx_hash_approve))
+
+        try:
+            tx_hash = await _send(signed_supply, account.address, [supply_tx['nonce']])
+        finally:
+            allowance_cache.invalidate(asset_address, account.address, aave_lending_pool_address)
+        logger.info("Supply Transaction Hash: %s", async_web3.to_hex(tx_hash))
+
+        if not wait_for_receipts:
+            if tx_hash_approve is not None:
+                receipt_watcher.track(async_web3.to_hex(tx_hash_approve), f"approve {amount} of {asset_address}", account.address)
+            receipt_watcher.track(async_web3.to_hex(tx_hash), f"supply {amount} of {asset_address}", account.address)
+            return async_web3.to_hex(tx_hash)
+
+        with get_tracer().span("tx.wait_receipt", label="supply"):
+            receipt = await async_web3.eth.wait_for_transaction_receipt(tx_hash)
+        if tx_hash_approve is not None:
+            # The approval has the lower nonce, so it is mined in the same block or earlier
+            with get_tracer().span("tx.wait_receipt", label="approve"):
+                approve_receipt = await async_web3.eth.wait_for_transaction_receipt(tx_hash_approve)
+            logger.info("Approval transaction mined in block %s, status %s", approve_receipt['blockNumber'], approve_receipt['status'])
+        logger.info("Supply transaction mined in block %s, status %s", receipt['blockNumber'], receipt['status'])
+        return async_web3.to_hex(tx_hash)
+    except Exception as e:
+        logger.error("An error occurred during the lending process: %s (%s)", e, type(e).__name__)
+        return None
+
+
+# AAVEプロトコルの「ユーザーアカウントデータ」を非同期で取得するメソッド
+async def aget_user_account_data(account_address: str) -> dict:
+    """
+    Async version of tools.get_user_account_data.
+
+    Parameters:
+    account_address (str): The Ethereum address of the user
+
+    Returns:
+    dict: User account data (see tools.get_user_account_data), None if the read fails
+    """
+    try:
+        lending_pool = async_contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        account_data = await lending_pool.functions.getUserAccountData(account_address).call()
+        return tools._format_account_data(account_data)
+    except Exception as e:
+        logger.error("Error getting user account data: %s", e)
+        return None
+
+
+# AAVEプロトコルから暗号通貨を借り入れる非同期メソッド
+async def _borrow_crypto(amount: float, asset_address: str, interest_rate_mode: int = 2) -> Union[str, None]:
+    """Async implementation of tools.borrow_crypto, see its docstring for the flow."""
+    logger.info("Attempting to borrow %s of asset at %s with interest rate mode %s (async)", amount, asset_address, interest_rate_mode)
+
+    if tools._private_key is None:
+        logger.error("Private key not set. Please set private key before attempting transactions.")
+        return None
+
+    try:
+        # 凍結・停止中のリザーブや借入上限・流動性を超える借り入れは送信前に拒否する
+        problem = await asyncio.to_thread(tools.reserve_index.check_borrow, asset_address, amount, interest_rate_mode)
+        if problem:
+            logger.warning("Borrow rejected before sending: %s", problem)
+            return f"Rejected before sending: {problem}"
+
+        lending_pool = async_contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        sync_pool = tools.contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        account = async_web3.eth.account.from_key(tools._private_key)
+
+        # 借入可能額とトークンの桁数を同時に取得する。
+        account_data, token_decimals = await asyncio.gather(
+            aget_user_account_data(account.address),
+            asyncio.to_thread(token_registry.get_decimals, asset_address),
+        )
+        if account_data is None:
+            logger.error("Unable to read account state from Ethereum")
+            return None
+        logger.debug("Account data: %s", account_data)
+
+        if account_data['totalCollateralBase'] == 0:
+            logger.error("No collateral supplied. Please supply collateral before borrowing.")
+            return None
+
+        if account_data['availableBorrowsBase'] == 0:
+            logger.error("No borrowing power available. Please supply more collateral.")
+            return None
+
+        amount_in_wei = int(amount * 10**token_decimals)
+        logger.debug("Amount in token base units: %s", amount_in_wei)
+
+        borrow_args = (asset_address, amount_in_wei, interest_rate_mode, 0, account.address)
+        borrow_tx = await _build(
+            account,
+            lending_pool.functions.borrow(*borrow_args),
+            sync_pool.functions.borrow(*borrow_args),
+            fallback_gas=500000,
+        )
+
+        # 署名する前にシミュレーションし、リバートする場合は送信しない
+        problem = await _preflight("borrow", borrow_tx)
+        if problem:
+            return problem
+
+        signed_borrow, = await _sign(account, borrow_tx)
+        tx_hash = await _send(signed_borrow, account.address, [borrow_tx['nonce']])
+        logger.info("Borrow Transaction Hash: %s", async_web3.to_hex(tx_hash))
+
+        if not wait_for_receipts:
+            receipt_watcher.track(async_web3.to_hex(tx_hash), f"borrow {amount} of {asset_address}", account.address)
+            return async_web3.to_hex(tx_hash)
+
+        with get_tracer().span("tx.wait_receipt", label="borrow"):
+            receipt = await async_web3.eth.wait_for_transaction_receipt(tx_hash)
+        logger.info("Borrow transaction mined in block %s, status %s", receipt['blockNumber'], receipt['status'])
+        return async_web3.to_hex(tx_hash)
+    except Exception as e:
+        logger.error("An error occurred during the borrowing process: %s (%s)", e, type(e).__name__)
+        return None
+
+
+# トークンの残高を非同期で取得するメソッド
+async def _get_token_balance(token_address: str, user_address: str = None) -> Union[float, None]:
+    """Async implementation of tools.get_token_balance."""
+    try:
+        if not user_address:
+            if tools._private_key is None:
+                logger.error("Private key not set. Please set private key before checking balance.")
+                return None
+            user_address = async_web3.eth.account.from_key(tools._private_key).address
+
+        token_contract = async_contracts.get(token_address, erc20_abi)
+        # 桁数（キャッシュ）と残高を同時に取得する。
+        decimals, balance_wei = await asyncio.gather(
+            asyncio.to_thread(token_registry.get_decimals, token_address),
+            token_contract.functions.balanceOf(user_address).call(),
+        )
+        balance = balance_wei / (10 ** decimals)
+        logger.debug("Balance of %s in %s: %s", user_address, token_address, balance)
+        return balance
+    except Exception as e:
+        logger.error("Error getting token balance: %s (%s)", e, type(e).__name__)
+        return None
+
+
+# ポートフォリオを非同期で取得するメソッド
+async def _get_portfolio(user_address: str = None) -> Union[Dict, None]:
+    """Async wrapper of tools.get_portfolio. The snapshot is a single batched round trip, it runs in a worker thread."""
+    return await asyncio.to_thread(tools.get_portfolio.func, user_address)
+
+
+# トランザクションの確定状況を非同期で取得するメソッド
+async def _get_transaction_status(tx_hash: str) -> Union[Dict, None]:
+    """Async implementation of tools.get_transaction_status."""
+    record = receipt_watcher.status(tx_hash)
+    if record is not None:
+        return {key: record[key] for key in ('tx_hash', 'label', 'status', 'block_number')}
+
+    try:
+        receipt = await async_web3.eth.get_transaction_receipt(tx_hash)
+    except Exception as e:
+        logger.error("Error getting transaction receipt: %s", e)
+        return None
+    return {
+        'tx_hash': tx_hash,
+        'label': None,
+        'status': 'success' if receipt['status'] == 1 else 'failed',
+        'block_number': receipt['blockNumber'],
+    }
+
+
+# 履歴を非同期で取得するメソッド
+async def _get_lending_history(user_address: str = None, days: float = 7, asset_address: str = None) -> Union[Dict, None]:
+    """Async wrapper of tools.get_lending_history. The query reads the local SQLite index in a worker thread."""
+    return await asyncio.to_thread(tools.get_lending_history.func, user_address, days, asset_address)
+
+
+# 同期版のツールに非同期の実装を追加するメソッド
+def _with_coroutine(sync_tool: BaseTool, coroutine) -> StructuredTool:
+    """
+    Build a tool with the name, description and argument schema of a sync tool plus an async implementation.
+
+    Args:
+        sync_tool (BaseTool): The tool from tools.py
+        coroutine: The async implementation with the same arguments
+
+    Returns:
+        StructuredTool: A tool whose invoke() runs the sync version and ainvoke() the async one
+    """
+    return StructuredTool(
+        name=sync_tool.name,
+        description=sync_tool.description,
+        args_schema=sync_tool.args_schema,
+        func=sync_tool.func,
+        coroutine=coroutine,
+    )
+
+
+"""
+Tools -> same names and schemas as tools.py
+"""
+lend_crypto = _with_coroutine(tools.lend_crypto, _lend_crypto)
+borrow_crypto = _with_coroutine(tools.borrow_crypto, _borrow_crypto)
+get_token_balance = _with_coroutine(tools.get_token_balance, _get_token_balance)
+get_portfolio = _with_coroutine(tools.get_portfolio, _get_portfolio)
+get_transaction_status = _with_coroutine(tools.get_transaction_status, _get_transaction_status)
+get_lending_history = _with_coroutine(tools.get_lending_history, _get_lending_history)
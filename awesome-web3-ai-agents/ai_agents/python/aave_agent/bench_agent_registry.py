@@ -0,0 +1,63 @@
+"""
+Agent Registry Benchmark
+-------------------
+What:
+Streamlitの再実行ごとにLLMクライアント・Web3・グラフを作り直す場合と、agent_registry.py のレジストリから
+取得する場合の所要時間を比較するベンチマークです。LLMやRPCへの接続は不要です。
+
+"startup" is the first build of the agent in the process (ChatGroq, bind_tools, StateGraph, ToolNode, compile and
+a Web3 instance). "rerun (uncached)" is what every Streamlit rerun used to pay, "rerun (registry)" is what a rerun
+pays now: a registry hit for the graph and the pooled Web3 from rpc_pool.
+
+Usage:
+    python bench_agent_registry.py [iterations]
+"""
+
+import os
+import sys
+import time
+import timeit
+
+# tools.py connects the pooled Web3 at import time, no request is sent during the benchmark
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:8545")
+
+from agent import MODEL, build_graph, get_graph, tools
+from agent_registry import get_agent_registry
+from rpc_pool import get_web3
+from web3 import Web3
+
+# Never sent anywhere, the clients are only constructed
+api_key = "gsk_benchmark_dummy_key"
+rpc_url = os.environ["RPC_URL"]
+
+
+# 以前の実装: 再実行ごとにWeb3とグラフを作り直す
+def uncached_rerun() -> None:
+    Web3(Web3.HTTPProvider(rpc_url))
+    build_graph(api_key, MODEL)
+
+
+# 新しい実装: レジストリと接続プールから取得する
+def registry_rerun() -> None:
+    get_web3()
+    get_graph(api_key, MODEL)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    start = time.perf_counter()
+    registry_rerun()
+    print(f"          startup: {(time.perf_counter() - start) * 1e3:10.2f} ms (first build, imports excluded)")
+
+    results = {}
+    for label, func in (("rerun (uncached)", uncached_rerun), ("rerun (registry)", registry_rerun)):
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        results[label] = best / iterations * 1e3
+        print(f"{label:>17}: {results[label]:10.3f} ms/rerun")
+    print(f"          speedup: {results['rerun (uncached)'] / results['rerun (registry)']:10.1f}x")
+    print(f"   registry stats: {get_agent_registry().stats()} ({len(tools)} tools)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Contract Cache Benchmark
+-------------------
+What:
+ツール呼び出しごとにコントラクトオブジェクトを生成する場合と、contract_cache.py のキャッシュを使う場合の
+オーバーヘッドを比較するマイクロベンチマークです。RPCへの接続は不要です。
+
+Measures the per-call cost of building the pool and token contract objects (and encoding the approve/supply
+calldata) the way the tools used to, against fetching them from the ContractCache.
+
+Usage:
+    python bench_contract_cache.py [iterations]
+"""
+
+import sys
+import timeit
+
+from abis import aave_lending_pool_abi, aave_lending_pool_address, erc20_abi
+from contract_cache import ContractCache
+from web3 import Web3
+
+token_address = "0x94a9D9AC8a22534E3FaCa9F4e7F2E2cf85d5E4C8"
+user_address = "0x51908F598A5e0d8F1A3bAbFa6DF76F9704daD072"
+
+# No requests are sent, the provider only has to exist
+web3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545"))
+contracts = ContractCache(web3)
+
+
+# 以前の実装: 呼び出しごとにABIを宣言してコントラクトを生成する
+def uncached_call() -> None:
+    inline_erc20_abi = [
+        {
+            "constant": False,
+            "inputs": [
+                {"name": "_spender", "type": "address"},
+                {"name": "_value", "type": "uint256"}
+            ],
+            "name": "approve",
+            "outputs": [{"name": "", "type": "bool"}],
+            "payable": False,
+            "stateMutability": "nonpayable",
+            "type": "function"
+        },
+        {
+            "constant": True,
+            "inputs": [],
+            "name": "decimals",
+            "outputs": [{"name": "", "type": "uint8"}],
+            "type": "function"
+        }
+    ]
+    lending_pool = web3.eth.contract(address=aave_lending_pool_address, abi=aave_lending_pool_abi)
+    token_contract = web3.eth.contract(address=token_address, abi=inline_erc20_abi)
+    token_contract.functions.approve(aave_lending_pool_address, 10**6)._encode_transaction_data()
+    lending_pool.functions.supply(token_address, 10**6, user_address, 0)._encode_transaction_data()
+
+
+# 新しい実装: キャッシュからコントラクトを取得する
+def cached_call() -> None:
+    lending_pool = contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+    token_contract = contracts.get(token_address, erc20_abi)
+    token_contract.functions.approve(aave_lending_pool_address, 10**6)._encode_transaction_data()
+    lending_pool.functions.supply(token_address, 10**6, user_address, 0)._encode_transaction_data()
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Warm both paths once so that import-time and first-use costs are not counted
+    uncached_call()
+    cached_call()
+
+    results = {}
+    for label, func in (("uncached", uncached_call), ("cached", cached_call)):
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        results[label] = best / iterations * 1e6
+        print(f"{label:>9}: {results[label]:10.1f} us/call")
+    print(f"  speedup: {results['uncached'] / results['cached']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
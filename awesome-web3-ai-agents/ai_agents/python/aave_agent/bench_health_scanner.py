@@ -0,0 +1,156 @@
+"""
+Health Scanner Benchmark
+-------------------
+What:
+多数のアカウントのヘルスファクターの取得にかかる時間を、アカウントごとに getUserAccountData を呼ぶ以前の方法と
+health_scanner.py（Multicall3 + NumPy）で比較するベンチマークです。RPCへの接続は不要で、ローカルのスタブチェーンを使います。
+
+The stub chain answers eth_call (direct getUserAccountData and Multicall3 aggregate3), eth_getLogs and
+eth_blockNumber from memory with precomputed account data, so the numbers are the client side cost (ABI encoding,
+decoding, middleware, Python loops) plus one simulated round trip per request (--latency, default 20 ms, roughly a
+hosted RPC). Time spent inside the stub itself is reported separately.
+
+Usage:
+    python bench_health_scanner.py [--accounts 10000] [--latency 0.02] [--changed 25]
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from abis import aave_lending_pool_abi
+from health_scanner import ACCOUNT_DATA_SELECTOR, AGGREGATE3_SELECTOR, HealthScanner
+from rpc_batch import multicall3_address
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+POOL_ADDRESS = '0x6Ae43d3271ff6888e7Fc43Fd7321a503ff738951'
+SUPPLY_TOPIC = '0x' + Web3.keccak(text="Supply(address,address,address,uint256,uint16)").hex().removeprefix('0x')
+UINT256_MAX = 2 ** 256 - 1
+
+
+# アカウントごとの getUserAccountData の戻り値をランダムに作るメソッド
+def _account_data(rng: random.Random) -> bytes:
+    collateral = rng.randint(100, 1_000_000) * 10 ** 8
+    threshold = rng.choice((7800, 8250, 8600))
+    if rng.random() < 0.2:
+        debt, health_factor = 0, UINT256_MAX
+    else:
+        debt = int(collateral * threshold / 10_000 / rng.uniform(0.95, 3.0))
+        health_factor = collateral * threshold * 10 ** 14 // debt
+    available = max(collateral * (threshold - 500) // 10_000 - debt, 0)
+    words = (collateral, debt, available, threshold, threshold - 500, health_factor)
+    return b''.join(word.to_bytes(32, 'big') for word in words)
+
+
+class StubChain(BaseProvider):
+    """In-memory node with a Multicall3 and an Aave pool that only implements getUserAccountData."""
+
+    def __init__(self, accounts: List[str], latency: float):
+        super().__init__()
+        rng = random.Random(7)
+        self.latency = latency
+        self.block = 1_000_000
+        self.logs: List[Dict[str, Any]] = []
+        self.data = {account[2:].lower(): _account_data(rng) for account in accounts}
+        self.requests = 0
+        self.stub_seconds = 0.0
+        self.codec = Web3().codec
+
+    def make_request(self, method, params) -> Dict[str, Any]:
+        if method == 'eth_chainId':
+            # The pooled provider of the agent answers this from memory (rpc_pool.CONSTANT_METHODS)
+            return {'jsonrpc': '2.0', 'id': 0, 'result': '0x1'}
+        start = time.perf_counter()
+        self.requests += 1
+        result = getattr(self, '_' + method)(params)
+        self.stub_seconds += time.perf_counter() - start
+        time.sleep(self.latency)
+        return {'jsonrpc': '2.0', 'id': 0, 'result': result}
+
+    def _eth_blockNumber(self, params):
+        return hex(self.block)
+
+    def _eth_call(self, params):
+        call = params[0]
+        data = bytes.fromhex(call['data'][2:])
+        if call['to'].lower() == multicall3_address.lower():
+            assert data[:4] == AGGREGATE3_SELECTOR
+            calls, = self.codec.decode(['(address,bool,bytes)[]'], data[4:])
+            results = [(True, self.data[call_data[-20:].hex()]) for _, _, call_data in calls]
+            return '0x' + self.codec.encode(['(bool,bytes)[]'], [results]).hex()
+        assert data[:4] == ACCOUNT_DATA_SELECTOR
+        return '0x' + self.data[data[-20:].hex()].hex()
+
+    def _eth_getLogs(self, params):
+        return self.logs
+
+    # 何件かのアカウントにSupplyイベントを発生させ、ブロックを進めるメソッド
+    def supply(self, accounts: List[str]) -> None:
+        self.block += 1
+        rng = random.Random(self.block)
+        for account in accounts:
+            self.data[account[2:].lower()] = _account_data(rng)
+            self.logs.append({
+                'address': POOL_ADDRESS, 'blockNumber': hex(self.block), 'logIndex': hex(len(self.logs)),
+                'transactionHash': '0x' + os.urandom(32).hex(), 'blockHash': '0x' + '00' * 32,
+                'transactionIndex': '0x0', 'removed': False, 'data': '0x' + '00' * 64,
+                'topics': [SUPPLY_TOPIC, '0x' + '00' * 32, '0x' + '00' * 12 + account[2:].lower(), '0x' + '00' * 32],
+            })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10_000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--changed', type=int, default=25)
+    parser.add_argument('--naive-sample', type=int, default=500, help="Accounts read one by one (extrapolated)")
+    args = parser.parse_args()
+
+    accounts = [Web3.to_checksum_address(os.urandom(20).hex()) for _ in range(args.accounts)]
+    chain = StubChain(accounts, args.latency)
+    web3 = Web3(chain)
+
+    # Before: one getUserAccountData per account, ABI decoded per account
+    pool = web3.eth.contract(address=POOL_ADDRESS, abi=aave_lending_pool_abi)
+    sample = accounts[:args.naive_sample]
+    chain.requests, chain.stub_seconds = 0, 0.0
+    start = time.perf_counter()
+    naive = [pool.functions.getUserAccountData(account).call() for account in sample]
+    naive_seconds = (time.perf_counter() - start) * len(accounts) / len(sample)
+    naive_requests = chain.requests * len(accounts) // len(sample)
+
+    # After: Multicall3 chunks decoded with NumPy
+    scanner = HealthScanner(web3, POOL_ADDRESS)
+    scanner.watch(accounts)
+    chain.requests, chain.stub_seconds = 0, 0.0
+    start = time.perf_counter()
+    scanner.scan()
+    scan_seconds = time.perf_counter() - start
+    scan_requests, scan_stub = chain.requests, chain.stub_seconds
+    expected = np.array([row[5] / 1e18 if row[1] else np.inf for row in naive])
+    assert np.allclose(scanner.table['health_factor'][:len(sample)], expected, rtol=1e-12)
+
+    # Incremental: a few Supply events, only those accounts are read again
+    chain.supply(random.Random(1).sample(accounts, args.changed))
+    chain.requests = 0
+    start = time.perf_counter()
+    updated = scanner.update()
+    update_seconds = time.perf_counter() - start
+    update_requests = chain.requests
+
+    print(f"{args.accounts} accounts, {args.latency * 1000:.0f} ms per request, chunk {scanner.chunk_size}")
+    print(f"{'':>26} {'seconds':>9} {'requests':>9}")
+    print(f"{'per account (estimated)':>26} {naive_seconds:9.2f} {naive_requests:9}")
+    print(f"{'health_scanner.scan':>26} {scan_seconds:9.2f} {scan_requests:9}   (stub CPU over all threads: {scan_stub:.2f} s)")
+    print(f"{'update, ' + str(updated) + ' changed':>26} {update_seconds:9.2f} {update_requests:9}")
+    print(f"speedup {naive_seconds / scan_seconds:.0f}x")
+    for label, count in scanner.buckets().items():
+        print(f"  {label:>22}: {count}")
+
+
+if __name__ == "__main__":
+    main()
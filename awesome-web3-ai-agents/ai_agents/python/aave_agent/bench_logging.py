@@ -0,0 +1,122 @@
+"""
+Logging Benchmark
+-------------------
+What:
+lend_crypto 1回分のログ出力にかかる時間を、以前の実装（f-string + basicConfig）と log_config.py の実装で比較する
+ベンチマークです。ログを出力する場合（INFO）と出力しない場合（WARNING）の両方を計測します。RPCへの接続は不要です。
+
+The "before" path replays the log calls lend_crypto used to make: f-strings built before the level check, the
+built transaction, the signature values and the hash, written synchronously to the stream by basicConfig's
+handler. The "after" path makes the calls tools.py makes now: %-style arguments checked against the level first,
+records passed to the queue and formatted (with redaction) on the listener thread. Output goes to os.devnull, so the
+numbers are the cost paid by the tool's thread, not by the terminal.
+
+Usage:
+    python bench_logging.py [iterations]
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import timeit
+
+from eth_account import Account
+from log_config import TEXT_FORMAT, DeferredQueueHandler, LazyHex, RedactingFormatter
+
+# A throwaway key, the transaction is only signed locally
+account = Account.create()
+approve_tx = {
+    'from': account.address,
+    'to': '0x94a9D9AC8a22534E3FaCa9F4e7F2E2cf85d5E4C8',
+    'data': '0x095ea7b3' + '00' * 64,
+    'chainId': 11155111,
+    'nonce': 7,
+    'type': 2,
+    'gas': 100000,
+    'maxFeePerGas': 30_000_000_000,
+    'maxPriorityFeePerGas': 1_500_000_000,
+    'value': 0,
+}
+signed = account.sign_transaction(approve_tx)
+tx_hash = signed.hash
+
+
+# 以前の実装と同じログ出力（レベルに関係なくf-stringを組み立てる）
+def eager_lend_logs(log: logging.Logger) -> None:
+    log.info(f"Attempting to lend {1.5} of asset at {approve_tx['to']}")
+    log.info(f"AAVE Lending Pool Address: {approve_tx['to']}")
+    log.info("Contracts initialized successfully")
+    log.info(f"Token decimals: {6}")
+    log.info(f"Account address: {account.address}")
+    log.info(f"Amount in token base units: {1500000}")
+    log.info(f"Approval transaction built: {approve_tx}")
+    log.info("Approval transaction signed successfully")
+    log.info("SignedTransaction attributes:")
+    log.info(f"Hash: {signed.hash.hex()}")
+    log.info(f"r: {signed.r}")
+    log.info(f"s: {signed.s}")
+    log.info(f"v: {signed.v}")
+    log.info(f"Approval Transaction Hash: {tx_hash.hex()}")
+    log.info(f"Supply Transaction Hash: {tx_hash.hex()}")
+
+
+# 現在の実装と同じログ出力（レベルを確認してから、書き出しスレッドでフォーマットする）
+def lazy_lend_logs(log: logging.Logger) -> None:
+    log.info("Attempting to lend %s of asset at %s", 1.5, approve_tx['to'])
+    log.debug("Using RPC URL: %s, AAVE Lending Pool Address: %s", 'http://127.0.0.1:8545', approve_tx['to'])
+    log.debug("Contracts initialized successfully")
+    log.debug("Token decimals: %s, account address: %s", 6, account.address)
+    log.debug("Amount in token base units: %s", 1500000)
+    log.debug("Approval transaction built: %s", approve_tx)
+    log.debug("Approval transaction signed: %s", LazyHex(signed.hash))
+    log.info("Approval Transaction Hash: %s", '0x' + tx_hash.hex())
+    log.info("Supply Transaction Hash: %s", '0x' + tx_hash.hex())
+
+
+def sync_logger(devnull, level: int) -> logging.Logger:
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log = logging.getLogger('bench.before')
+    log.handlers, log.propagate = [handler], False
+    log.setLevel(level)
+    return log
+
+
+def queued_logger(devnull, level: int):
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(RedactingFormatter(TEXT_FORMAT))
+    log_queue: "queue.Queue" = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    log = logging.getLogger('bench.after')
+    log.handlers, log.propagate = [DeferredQueueHandler(log_queue)], False
+    log.setLevel(level)
+    return log, listener
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with open(os.devnull, 'w') as devnull:
+        results = {}
+        for level_name, level in (("off", logging.WARNING), ("on", logging.INFO), ("debug", logging.DEBUG)):
+            before = sync_logger(devnull, level)
+            after, listener = queued_logger(devnull, level)
+            results[("before", level_name)] = min(timeit.repeat(lambda: eager_lend_logs(before), number=iterations, repeat=5))
+            results[("after", level_name)] = min(timeit.repeat(lambda: lazy_lend_logs(after), number=iterations, repeat=5))
+            # Let the listener drain what was queued before the next level
+            listener.stop()
+
+    print(f"{'logging':>8} {'before (us/call)':>18} {'after (us/call)':>17} {'speedup':>9}")
+    for level_name in ("off", "on", "debug"):
+        before_us = results[("before", level_name)] / iterations * 1e6
+        after_us = results[("after", level_name)] / iterations * 1e6
+        print(f"{level_name:>8} {before_us:18.2f} {after_us:17.2f} {before_us / after_us:8.1f}x")
+    print("One call is the logging of one lend_crypto (approve + supply). 'debug' in the before column is the same "
+          "INFO output, the old code had no debug level.")
+
+
+if __name__ == "__main__":
+    main()
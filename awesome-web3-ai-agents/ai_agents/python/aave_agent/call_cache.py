@@ -0,0 +1,270 @@
+"""
+Call Cache
+-------------------
+What:
+eth_call（ビュー関数の読み取り）の結果をブロック単位でキャッシュします。"latest"の読み取りは現在のブロック番号に
+固定されるため、同じブロック内で同じ読み取りを繰り返してもRPCリクエストは発生しません。
+
+This script is the read-through cache behind the pooled provider (see rpc_pool.py). Results are keyed by the call
+(to, data, from, ...) and the block number. A read at "latest" is pinned to the current head, which a background
+poller refreshes with a cheap eth_blockNumber, so a balance read, a borrow and the same balance read a few seconds
+later cost one eth_call as long as the chain does not move.
+
+Our own transactions are picked up from the receipts that pass through the provider (the receipt watcher and
+wait_for_transaction_receipt both fetch them): the head moves to the receipt's block at once and every entry whose
+call mentions the sender or the called contract (the target or an address argument in the calldata, e.g.
+balanceOf(user), getUserAccountData(user), the targets inside a Multicall3 aggregate) is dropped.
+
+Calls with more than CALL_CACHE_MAX_CALLDATA bytes of calldata, such as the health scanner's aggregate3 over
+hundreds of accounts, are sent without the cache: they are not repeated within a block and would only push the
+small, frequently repeated reads out of the LRU.
+
+Environment:
+    CALL_CACHE_SIZE: Maximum number of cached eth_call results, 0 disables the cache (default 1024)
+    CALL_CACHE_MAX_CALLDATA: Calls with more calldata bytes than this are not cached (default 8192)
+    HEAD_POLL_INTERVAL: Seconds between eth_blockNumber polls while reads are happening (default 4)
+
+Functions:
+    CallCache
+"""
+
+import logging
+# Built in python imports
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_CALLDATA = 8192
+DEFAULT_HEAD_POLL_INTERVAL = 4
+# The poller stops after this many intervals without a read and starts again with the next read
+IDLE_POLLS = 15
+# 固定しても結果が変わらない（ブロック番号に置き換えられる）ブロックタグ
+PINNABLE_TAGS = ("latest", None)
+# ブロック番号を固定した読み取りをノードが処理できなかった場合のエラーメッセージ
+UNKNOWN_BLOCK_ERRORS = ("header not found", "unknown block", "block not found")
+
+CallKey = Tuple[int, Tuple[Tuple[str, str], ...]]
+
+
+# calldataに含まれるアドレス（32バイトのワードの下位20バイト）を取り出すメソッド
+def _addresses_in(call: Dict[str, Any]) -> FrozenSet[str]:
+    addresses = {str(call[field]).lower() for field in ("to", "from") if call.get(field)}
+    data = str(call.get("data") or call.get("input") or "")
+    data = data[2:] if data.startswith("0x") else data
+    # Skip the 4-byte selector, then look at every 32-byte word that is a left padded 20-byte value
+    for offset in range(8, len(data) - 63, 64):
+        word = data[offset:offset + 64]
+        if word.startswith("0" * 24) and word[24:32] != "0" * 8:
+            addresses.add("0x" + word[24:].lower())
+    return frozenset(addresses)
+
+
+# calldataのバイト数を求めるメソッド
+def _calldata_size(call: Any) -> int:
+    if not isinstance(call, dict):
+        return 0
+    data = call.get("data") or call.get("input") or ""
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    data = str(data)
+    return (len(data) - 2 if data.startswith("0x") else len(data)) // 2
+
+
+def _hex_to_int(value: Any) -> int:
+    return value if isinstance(value, int) else int(value, 16)
+
+
+class CallCache:
+    """
+    Block-aware cache of eth_call results.
+
+    Usage (inside the provider):
+        block = cache.pin_block(params)                       # None -> not cacheable, send as is
+        response = cache.get(params, block)
+        if response is None:
+            response = send("eth_call", cache.pinned_params(params, block))
+            cache.put(params, block, response)
+    """
+
+    def __init__(
+        self,
+        fetch_head: Callable[[], int],
+        max_entries: int = DEFAULT_CACHE_SIZE,
+        head_poll_interval: float = DEFAULT_HEAD_POLL_INTERVAL,
+        max_calldata: int = DEFAULT_MAX_CALLDATA,
+    ):
+        self.fetch_head = fetch_head
+        self.max_entries = max_entries
+        self.max_calldata = max_calldata
+        self.head_poll_interval = head_poll_interval
+        self._entries: "OrderedDict[CallKey, Tuple[Dict[str, Any], FrozenSet[str]]]" = OrderedDict()
+        self._head: Optional[int] = None
+        self._head_at = 0.0
+        self._last_read = 0.0
+        self._poller: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "invalidated": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    # ヘッドのブロック番号を更新するメソッド（古いブロックのエントリは削除する）
+    def note_block(self, block_number: int, polled: bool = True) -> None:
+        """
+        Move the head forward to block_number, never backwards. Entries of older blocks are dropped.
+
+        Args:
+            block_number (int): A block known to be mined
+            polled (bool): The number is the chain head (eth_blockNumber), not just a block seen in a receipt
+        """
+        with self._lock:
+            if polled:
+                self._head_at = time.monotonic()
+            if self._head is not None and block_number <= self._head:
+                return
+            self._head = block_number
+            for key in [key for key in self._entries if key[0] < block_number]:
+                del self._entries[key]
+
+    def _poll(self) -> None:
+        while time.monotonic() - self._last_read < self.head_poll_interval * IDLE_POLLS:
+            try:
+                self.note_block(self.fetch_head())
+            except Exception as e:
+                logger.warning("Head poll failed: %s", e)
+            time.sleep(self.head_poll_interval)
+        logger.debug("Head poller idle, stopping")
+
+    # ポーリング用のスレッドを起動するメソッド
+    def _ensure_poller(self) -> None:
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll, name="head-poller", daemon=True)
+                self._poller.start()
+
+    def head(self, fetch: bool = True) -> Optional[int]:
+        """
+        The current head block, refreshed by the poller.
+
+        Args:
+            fetch (bool): Fetch the head right away when it is stale, otherwise return None (async callers)
+
+        Returns:
+            Optional[int]: The head block, None when it is not known
+        """
+        self._last_read = time.monotonic()
+        self._ensure_poller()
+        # A head older than two polls means the poller is failing or just started
+        if time.monotonic() - self._head_at > self.head_poll_interval * 2:
+            if not fetch:
+                return None
+            self.note_block(self.fetch_head())
+        return self._head
+
+    # 読み取りを固定するブロック番号を決めるメソッド（キャッシュできない場合はNone）
+    def pin_block(self, params: Any, fetch: bool = True) -> Optional[int]:
+        """
+        The block an eth_call is answered at: the head for "latest", the number itself for a block number.
+
+        Returns None for calls that are not cached: the cache is disabled, a state override is passed, the
+        calldata is larger than max_calldata bytes, or the tag is "pending", "safe", "finalized" or "earliest".
+        """
+        if not self.enabled or not isinstance(params, (list, tuple)) or not params or len(params) > 2:
+            return self._bypass()
+        if _calldata_size(params[0]) > self.max_calldata:
+            return self._bypass()
+        tag = params[1] if len(params) > 1 else None
+        if tag in PINNABLE_TAGS:
+            block = self.head(fetch)
+            return block if block is not None else self._bypass()
+        if isinstance(tag, int) or (isinstance(tag, str) and tag.startswith("0x")):
+            return _hex_to_int(tag)
+        return self._bypass()
+
+    def _bypass(self) -> None:
+        with self._lock:
+            self._counters["bypassed"] += 1
+        return None
+
+    @staticmethod
+    def pinned_params(params: Any, block: int) -> list:
+        return [params[0], hex(block)]
+
+    @staticmethod
+    def _key(params: Any, block: int) -> CallKey:
+        call = params[0]
+        return block, tuple(sorted((field, str(value).lower()) for field, value in call.items()))
+
+    def get(self, params: Any, block: int) -> Optional[Dict[str, Any]]:
+        """The cached response of the call at block, None on a miss."""
+        key = self._key(params, block)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+        return dict(entry[0])
+
+    def put(self, params: Any, block: int, response: Dict[str, Any]) -> None:
+        """Cache a successful response, errors (reverts included) are not cached."""
+        if "error" in response or "result" not in response:
+            return
+        key = self._key(params, block)
+        with self._lock:
+            if self._head is not None and block < self._head:
+                return
+            self._entries[key] = (response, _addresses_in(params[0]))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, addresses: Iterable[str]) -> int:
+        """
+        Drop every entry whose call mentions one of the addresses (target, sender or an address argument).
+
+        Returns:
+            int: Number of dropped entries
+        """
+        addresses = {address.lower() for address in addresses if address}
+        with self._lock:
+            stale = [key for key, (_, touched) in self._entries.items() if touched & addresses]
+            for key in stale:
+                del self._entries[key]
+            self._counters["invalidated"] += len(stale)
+        if stale:
+            logger.debug("Invalidated %s cached read(s) touching %s", len(stale), addresses)
+        return len(stale)
+
+    # 自分のトランザクションのレシートを反映するメソッド
+    def observe_receipt(self, receipt: Optional[Dict[str, Any]]) -> None:
+        """Apply a mined receipt: move the head to its block and drop the reads its sender and target touch."""
+        if not receipt or receipt.get("blockNumber") is None:
+            return
+        self.note_block(_hex_to_int(receipt["blockNumber"]), polled=False)
+        self.invalidate([receipt.get("from"), receipt.get("to"), receipt.get("contractAddress")])
+
+    @staticmethod
+    def is_unknown_block(response: Dict[str, Any]) -> bool:
+        """True when the node could not answer at the pinned block (e.g. it lags behind the head we pinned)."""
+        message = str((response.get("error") or {}).get("message", "")).lower()
+        return any(error in message for error in UNKNOWN_BLOCK_ERRORS)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits, misses, bypassed calls, invalidated entries, hit ratio, cached entries and the head block."""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else None,
+            "entries": entries,
+            "head_block": self._head,
+        }
@@ -0,0 +1,170 @@
+"""
+Contract Cache
+-------------------
+What:
+コントラクトオブジェクトを (アドレス, ABIのフィンガープリント) ごとに1度だけ生成して再利用します。
+ABIの解析とエンコーダー・デコーダーの準備は最初の1回だけ行われます。
+
+Building a web3 contract object parses the ABI and sets up one ContractFunction class per function. This script
+does that once per (address, ABI fingerprint), warms the ABI codec's encoder/decoder caches for every function
+signature and hands out the same contract handle to every tool.
+
+Functions:
+    get_contract_cache
+    get_async_contract_cache
+"""
+
+import hashlib
+import json
+# Built in python imports
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from eth_utils import get_abi_input_types, get_abi_output_types
+from rpc_pool import get_async_web3, get_web3
+# Web3 Interactions
+from web3 import AsyncWeb3, Web3
+from web3.contract import Contract
+
+
+# ABIのフィンガープリントを計算するメソッド
+def abi_fingerprint(abi: List[Dict]) -> str:
+    """
+    Compute a stable fingerprint of an ABI, independent of key order.
+
+    Args:
+        abi (List[Dict]): The contract ABI
+
+    Returns:
+        str: sha256 hex digest of the canonical JSON encoding of the ABI
+    """
+    canonical = json.dumps(abi, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ContractSpec:
+    """
+    Everything derived from an ABI that does not depend on the contract address.
+
+    Attributes:
+        fingerprint (str): The ABI fingerprint
+        factory (Type[Contract]): The web3 contract factory class for the ABI
+    """
+
+    def __init__(self, web3: Union[Web3, AsyncWeb3], abi: List[Dict], fingerprint: str):
+        self.fingerprint = fingerprint
+        self.factory = web3.eth.contract(abi=abi)
+        registry = web3.codec._registry
+        for element in abi:
+            if element.get("type") != "function":
+                continue
+            input_types = get_abi_input_types(element)
+            output_types = get_abi_output_types(element)
+            # The codec caches encoders/decoders per type list, building them here keeps it off the hot path
+            registry.get_tuple_encoder(*input_types)
+            registry.get_tuple_decoder(*output_types)
+
+
+class ContractCache:
+    """
+    Cache of ready-to-use contract handles keyed by (checksum address, ABI fingerprint).
+
+    ABIs are usually module level constants, so their fingerprints are memoised by object identity and the
+    fingerprint is only computed once per ABI object. Bound to an AsyncWeb3 instance it hands out AsyncContract
+    handles instead.
+    """
+
+    def __init__(self, web3: Union[Web3, AsyncWeb3]):
+        self.web3 = web3
+        self._fingerprints: Dict[int, Tuple[List[Dict], str]] = {}
+        self._specs: Dict[str, ContractSpec] = {}
+        self._contracts: Dict[Tuple[str, str], Contract] = {}
+        self._lock = threading.Lock()
+
+    # ABIオブジェクトに対応するContractSpecを取得するメソッド
+    def spec(self, abi: List[Dict]) -> ContractSpec:
+        """
+        Get the parsed spec of an ABI, building it on first use.
+
+        Args:
+            abi (List[Dict]): The contract ABI
+
+        Returns:
+            ContractSpec: Factory class of the ABI, with the codec warmed for its functions
+        """
+        cached = self._fingerprints.get(id(abi))
+        # Keep a reference to the ABI so its id can not be reused by another object
+        if cached is None or cached[0] is not abi:
+            cached = (abi, abi_fingerprint(abi))
+            self._fingerprints[id(abi)] = cached
+        fingerprint = cached[1]
+        spec = self._specs.get(fingerprint)
+        if spec is None:
+            with self._lock:
+                spec = self._specs.get(fingerprint)
+                if spec is None:
+                    spec = ContractSpec(self.web3, abi, fingerprint)
+                    self._specs[fingerprint] = spec
+        return spec
+
+    def get(self, address: str, abi: List[Dict]) -> Contract:
+        """
+        Get a reusable contract handle for the address and ABI.
+
+        Args:
+            address (str): The contract address
+            abi (List[Dict]): The contract ABI
+
+        Returns:
+            Contract: The cached contract instance
+        """
+        spec = self.spec(abi)
+        key = (Web3.to_checksum_address(address), spec.fingerprint)
+        contract = self._contracts.get(key)
+        if contract is None:
+            with self._lock:
+                contract = self._contracts.get(key)
+                if contract is None:
+                    contract = spec.factory(address=key[0])
+                    self._contracts[key] = contract
+        return contract
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_contract_cache: Optional[ContractCache] = None
+_contract_cache_lock = threading.Lock()
+_async_contract_cache: Optional[ContractCache] = None
+
+
+# 共有のコントラクトキャッシュを取得するメソッド
+def get_contract_cache() -> ContractCache:
+    """
+    Get the process-wide contract cache bound to the shared Web3 instance.
+
+    Returns:
+        ContractCache: The shared contract cache
+    """
+    global _contract_cache
+    if _contract_cache is None:
+        with _contract_cache_lock:
+            if _contract_cache is None:
+                _contract_cache = ContractCache(get_web3())
+    return _contract_cache
+
+
+# 非同期ツール用の共有コントラクトキャッシュを取得するメソッド
+def get_async_contract_cache() -> ContractCache:
+    """
+    Get the process-wide contract cache bound to the shared AsyncWeb3 instance.
+
+    Returns:
+        ContractCache: The shared cache of AsyncContract handles
+    """
+    global _async_contract_cache
+    if _async_contract_cache is None:
+        with _contract_cache_lock:
+            if _async_contract_cache is None:
+                _async_contract_cache = ContractCache(get_async_web3())
+    return _async_contract_cache
@@ -0,0 +1,453 @@
+"""
+Event Indexer
+-------------------
+What:
+AaveプールのSupply・Borrow・Repay・Withdraw・LiquidationCallイベントをバックグラウンドで読み取り、ローカルの
+SQLiteに保存します。「先週いくら預けたか」などの履歴の質問は、チェーンを読み直さずにローカルのデータから答えます。
+
+This script keeps a local copy of the pool's position events. A background thread reads them with eth_getLogs in
+block ranges that adapt to the provider: a range the provider refuses (too many results, range too large) is
+halved and retried, and the range grows again after a run of successful reads. A timed out read is retried on the
+same range with a short backoff, since a timeout does not mean that the range is too large. Each range is decoded
+in one pass, the block timestamps come from one batched request, and the rows are written together with the
+checkpoint in one SQLite transaction, so a restart resumes exactly where the last range ended.
+
+Rows are indexed by (user, block) and (asset, block). "user" is the account whose position changed (onBehalfOf
+for Supply and Borrow), "caller" the other party (the sender, repayer, withdrawal recipient or liquidator).
+Amounts are stored as raw integers (text, they can exceed 64 bits) and scaled when they are read.
+
+The indexer stays EVENT_INDEXER_CONFIRMATIONS blocks behind the head so that reorged logs are never stored.
+
+Environment:
+    EVENT_INDEXER_PATH: SQLite file (default pool_events.sqlite3 next to this script)
+    EVENT_INDEXER_START_BLOCK: First block of a new index (default: EVENT_INDEXER_LOOKBACK blocks before the head)
+    EVENT_INDEXER_LOOKBACK: Blocks indexed on the first run when no start block is set (default 216000, ~30 days)
+    EVENT_INDEXER_CHUNK_SIZE: Initial eth_getLogs block range (default 2000)
+    EVENT_INDEXER_MAX_CHUNK_SIZE: Largest eth_getLogs block range (default 10000)
+    EVENT_INDEXER_CONFIRMATIONS: Blocks behind the head that are not indexed yet (default 5)
+    EVENT_INDEXER_POLL_INTERVAL: Seconds between catch-up rounds once the index is at the head (default 15)
+
+Functions:
+    get_event_indexer
+"""
+
+import logging
+# Built in python imports
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from abis import aave_lending_pool_abi
+from rpc_pool import get_web3
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+"""
+Initial Setup -> GLOBAL VARIABLES
+"""
+current_dir = os.path.dirname(os.path.abspath(__file__))
+default_db_path = os.path.join(current_dir, 'pool_events.sqlite3')
+DEFAULT_LOOKBACK = 216_000
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_MAX_CHUNK_SIZE = 10_000
+DEFAULT_CONFIRMATIONS = 5
+DEFAULT_POLL_INTERVAL = 15
+# 連続で成功したらブロック範囲を広げる回数
+GROW_AFTER = 4
+# 1回のバッチリクエストで読み取るブロックヘッダーの数
+BLOCK_BATCH_SIZE = 100
+
+INDEXED_EVENTS = ('Supply', 'Borrow', 'Repay', 'Withdraw', 'LiquidationCall')
+# プロバイダーがブロック範囲や結果の件数の上限で拒否した場合のエラーメッセージ
+RANGE_ERRORS = (
+    'block range', 'blocks range', 'query returned more than', 'limit exceeded', 'response size exceeded',
+    '413 client error', 'request entity too large',
+)
+# タイムアウトは同じ範囲のまま、待ち時間を倍にしながら再試行する（秒）
+TIMEOUT_RETRIES = 3
+TIMEOUT_BACKOFF = 1.0
+
+T = TypeVar('T')
+
+# イベントごとの (ポジションが変わったアカウント, 相手, 資産, 数量) の引数名
+EVENT_FIELDS = {
+    'Supply': ('onBehalfOf', 'user', 'reserve', 'amount'),
+    'Borrow': ('onBehalfOf', 'user', 'reserve', 'amount'),
+    'Repay': ('user', 'repayer', 'reserve', 'amount'),
+    'Withdraw': ('user', 'to', 'reserve', 'amount'),
+    'LiquidationCall': ('user', 'liquidator', 'collateralAsset', 'liquidatedCollateralAmount'),
+}
+
+EventRow = Tuple[int, int, int, str, int, str, str, str, str, str, Optional[str], Optional[str]]
+
+
+# プロバイダーの上限によるエラーかどうかを判定するメソッド
+def is_range_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERRORS)
+
+
+# タイムアウトによるエラーかどうかを判定するメソッド
+def is_timeout_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return isinstance(error, TimeoutError) or 'timed out' in message or 'timeout' in message
+
+
+# タイムアウトしたリクエストを少し待ってから再試行するメソッド
+def retry_timeouts(request: Callable[[], T], label: str) -> T:
+    """
+    Run request, retrying it up to TIMEOUT_RETRIES times with a doubling backoff when it times out.
+
+    Args:
+        request (Callable[[], T]): The RPC call
+        label (str): What is read, for the log
+
+    Returns:
+        T: The result of request
+    """
+    for attempt in range(TIMEOUT_RETRIES + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == TIMEOUT_RETRIES or not is_timeout_error(e):
+                raise
+            delay = TIMEOUT_BACKOFF * 2 ** attempt
+            logger.info("%s timed out (%s), retrying in %.0f s", label, e, delay)
+            time.sleep(delay)
+
+
+# イベントのデコードに必要な情報をABIから作るメソッド
+def _event_decoders(abi: List[Dict]) -> Dict[bytes, Tuple[str, List[Tuple[str, str]], List[Tuple[str, str]]]]:
+    decoders = {}
+    for entry in abi:
+        if entry.get('type') != 'event' or entry['name'] not in INDEXED_EVENTS:
+            continue
+        signature = f"{entry['name']}({','.join(argument['type'] for argument in entry['inputs'])})"
+        indexed = [(argument['name'], argument['type']) for argument in entry['inputs'] if argument['indexed']]
+        data = [(argument['name'], argument['type']) for argument in entry['inputs'] if not argument['indexed']]
+        decoders[bytes(Web3.keccak(text=signature))] = (entry['name'], indexed, data)
+    return decoders
+
+
+def _to_int(value: Any) -> int:
+    return value if isinstance(value, int) else int(value, 16)
+
+
+def _to_bytes(value: Any) -> bytes:
+    return bytes.fromhex(value[2:]) if isinstance(value, str) else bytes(value)
+
+
+class EventIndexer:
+    """
+    Local SQLite index of the pool's Supply, Borrow, Repay, Withdraw and LiquidationCall events.
+
+    Usage:
+        indexer = get_event_indexer()
+        indexer.start()                                   # background catch-up, then follows the head
+        indexer.history(user, since=time.time() - 7 * 86400)
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        pool_address: str,
+        path: str = default_db_path,
+        start_block: Optional[int] = None,
+        lookback: int = DEFAULT_LOOKBACK,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+        confirmations: int = DEFAULT_CONFIRMATIONS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.web3 = web3
+        self.pool_address = Web3.to_checksum_address(pool_address)
+        self.path = path
+        self.start_block = start_block
+        self.lookback = lookback
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.head: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self._decoders = _event_decoders(aave_lending_pool_abi)
+        self._successes = 0
+        self._chain_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # One connection shared by the indexer thread and the tools, every access holds the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS pool_events ('
+                ' chain_id INTEGER NOT NULL,'
+                ' block_number INTEGER NOT NULL,'
+                ' log_index INTEGER NOT NULL,'
+                ' tx_hash TEXT NOT NULL,'
+                ' timestamp INTEGER NOT NULL,'
+                ' event TEXT NOT NULL,'
+                ' user TEXT NOT NULL,'
+                ' caller TEXT NOT NULL,'
+                ' asset TEXT NOT NULL,'
+                ' amount TEXT NOT NULL,'
+                ' debt_asset TEXT,'
+                ' debt_amount TEXT,'
+                ' PRIMARY KEY (chain_id, block_number, log_index))'
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS pool_events_user ON pool_events (chain_id, user, block_number)'
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS pool_events_asset ON pool_events (chain_id, asset, block_number)'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS indexer_checkpoint ('
+                ' chain_id INTEGER NOT NULL,'
+                ' pool TEXT NOT NULL,'
+                ' last_block INTEGER NOT NULL,'
+                ' PRIMARY KEY (chain_id, pool))'
+            )
+
+    @property
+    def chain_id(self) -> int:
+        # The chain id is read once, it can not change for the lifetime of the connection
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
+
+    def checkpoint(self) -> Optional[int]:
+        """The last indexed block, None before the first range is stored."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT last_block FROM indexer_checkpoint WHERE chain_id = ? AND pool = ?',
+                (self.chain_id, self.pool_address.lower()),
+            ).fetchone()
+        return row[0] if row else None
+
+    # プロバイダーの上限に合わせてブロック範囲を調整しながらログを取得するメソッド
+    def _get_logs(self, from_block: int, last_block: int) -> Tuple[List[Dict[str, Any]], int]:
+        while True:
+            to_block = min(from_block + self.chunk_size - 1, last_block)
+            try:
+                logs = retry_timeouts(lambda: self.web3.eth.get_logs({
+                    'address': self.pool_address,
+                    'fromBlock': from_block,
+                    'toBlock': to_block,
+                    'topics': [['0x' + topic.hex() for topic in self._decoders]],
+                }), f"eth_getLogs {from_block}-{to_block}")
+            except Exception as e:
+                if not is_range_error(e) or self.chunk_size == 1:
+                    raise
+                self.chunk_size = max(1, self.chunk_size // 2)
+                self._successes = 0
+                logger.info("eth_getLogs refused %s blocks (%s), retrying with %s", to_block - from_block + 1, e,
+                            self.chunk_size)
+                continue
+            self._successes += 1
+            if self._successes >= GROW_AFTER and self.chunk_size < self.max_chunk_size:
+                self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+                self._successes = 0
+            return logs, to_block
+
+    # ブロックのタイムスタンプをバッチリクエストで取得するメソッド
+    def _block_timestamps(self, block_numbers: Sequence[int]) -> Dict[int, int]:
+        timestamps = {}
+        for start in range(0, len(block_numbers), BLOCK_BATCH_SIZE):
+            requests = [("eth_getBlockByNumber", [hex(number), False]) for number in block_numbers[start:start + BLOCK_BATCH_SIZE]]
+            try:
+                responses = self.web3.provider.make_batch_request(requests)
+            except Exception as e:
+                logger.warning("Batched block read failed, reading one by one: %s", e)
+                responses = [self.web3.provider.make_request(method, params) for method, params in requests]
+            for response in responses:
+                block = response.get('result')
+                if block is None:
+                    raise ValueError(f"Block header missing from response: {response.get('error')}")
+                timestamps[_to_int(block['number'])] = _to_int(block['timestamp'])
+        return timestamps
+
+    # 1つのブロック範囲のログをまとめてデコードするメソッド
+    def _decode(self, logs: List[Dict[str, Any]]) -> List[EventRow]:
+        decoded = []
+        for log in logs:
+            if log.get('removed'):
+                continue
+            topics = [_to_bytes(topic) for topic in log['topics']]
+            decoder = self._decoders.get(topics[0]) if topics else None
+            if decoder is None:
+                continue
+            name, indexed, data = decoder
+            values: Dict[str, Any] = {}
+            for (argument, kind), topic in zip(indexed, topics[1:]):
+                values[argument] = '0x' + topic[-20:].hex() if kind == 'address' else int.from_bytes(topic, 'big')
+            values.update(zip(
+                (argument for argument, _ in data),
+                self.web3.codec.decode([kind for _, kind in data], _to_bytes(log['data'])),
+            ))
+            decoded.append((log, name, values))
+        if not decoded:
+            return []
+
+        timestamps = self._block_timestamps(sorted({_to_int(log['blockNumber']) for log, _, _ in decoded}))
+        rows = []
+        for log, name, values in decoded:
+            user, caller, asset, amount = (values[field] for field in EVENT_FIELDS[name])
+            liquidation = name == 'LiquidationCall'
+            block_number = _to_int(log['blockNumber'])
+            rows.append((
+                self.chain_id, block_number, _to_int(log['logIndex']), '0x' + _to_bytes(log['transactionHash']).hex(),
+                timestamps[block_number], name, user.lower(), caller.lower(), asset.lower(), str(amount),
+                values['debtAsset'].lower() if liquidation else None,
+                str(values['debtToCover']) if liquidation else None,
+            ))
+        return rows
+
+    def sync_once(self) -> int:
+        """
+        Index every range from the checkpoint up to the confirmed head.
+
+        Returns:
+            int: Number of events stored
+        """
+        self.head = self.web3.eth.block_number
+        target = self.head - self.confirmations
+        last = self.checkpoint()
+        if last is None:
+            start = self.start_block if self.start_block is not None else max(target - self.lookback, 0)
+            last = start - 1
+        stored = 0
+        while last < target:
+            begin = time.perf_counter()
+            logs, to_block = self._get_logs(last + 1, target)
+            rows = self._decode(logs)
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO pool_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO indexer_checkpoint (chain_id, pool, last_block) VALUES (?, ?, ?)',
+                    (self.chain_id, self.pool_address.lower(), to_block),
+                )
+            logger.debug("Indexed blocks %s-%s: %s event(s) in %.0f ms", last + 1, to_block, len(rows),
+                         (time.perf_counter() - begin) * 1000)
+            stored += len(rows)
+            last = to_block
+        return stored
+
+    def _run(self) -> None:
+        while True:
+            try:
+                stored = self.sync_once()
+                self.last_error = None
+                if stored:
+                    logger.info("Indexed %s pool event(s) up to block %s", stored, self.checkpoint())
+            except Exception as e:
+                self.last_error = f"{e} ({type(e).__name__})"
+                logger.warning("Event indexing failed: %s", self.last_error)
+            time.sleep(self.poll_interval)
+
+    # バックグラウンドのスレッドを起動するメソッド
+    def start(self) -> None:
+        """Start the background catch-up thread, it then follows the head. Calling it again does nothing."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-indexer", daemon=True)
+                self._thread.start()
+
+    def history(
+        self,
+        user: str,
+        since: Optional[float] = None,
+        asset: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Events of a user from the local index, newest first.
+
+        Args:
+            user (str): The account whose positions changed
+            since (Optional[float]): Unix time of the oldest event
+            asset (Optional[str]): Only events of this reserve (collateral or debt asset for liquidations)
+            limit (Optional[int]): Maximum number of events
+
+        Returns:
+            List[Dict[str, Any]]: One dict per event with the pool_events columns, amounts as raw integers
+        """
+        query = 'SELECT * FROM pool_events WHERE chain_id = ? AND user = ? AND timestamp >= ?'
+        params: List[Any] = [self.chain_id, user.lower(), int(since or 0)]
+        if asset:
+            query += ' AND (asset = ? OR debt_asset = ?)'
+            params += [asset.lower(), asset.lower()]
+        query += ' ORDER BY block_number DESC, log_index DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            cursor = self._connection.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        events = []
+        for row in rows:
+            event = dict(zip(columns, row))
+            event['amount'] = int(event['amount'])
+            if event['debt_amount'] is not None:
+                event['debt_amount'] = int(event['debt_amount'])
+            events.append(event)
+        return events
+
+    def stats(self) -> Dict[str, Any]:
+        """Indexed block, lag behind the head, current eth_getLogs range, stored events and the last error."""
+        checkpoint = self.checkpoint()
+        with self._lock:
+            events = self._connection.execute(
+                'SELECT COUNT(*) FROM pool_events WHERE chain_id = ?', (self.chain_id,)
+            ).fetchone()[0]
+        return {
+            'indexed_block': checkpoint,
+            'head_lag': self.head - checkpoint if self.head is not None and checkpoint is not None else None,
+            'chunk_size': self.chunk_size,
+            'events': events,
+            'last_error': self.last_error,
+        }
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_indexer: Optional[EventIndexer] = None
+_indexer_lock = threading.Lock()
+
+
+# 共有のイベントインデクサーを取得するメソッド
+def get_event_indexer(pool_address: str) -> EventIndexer:
+    """
+    Get the process-wide event indexer of the pool, bound to the shared Web3 instance.
+
+    Args:
+        pool_address (str): The Aave pool address
+
+    Returns:
+        EventIndexer: The shared indexer (not started, call start())
+    """
+    global _indexer
+    if _indexer is None:
+        with _indexer_lock:
+            if _indexer is None:
+                start_block = os.getenv("EVENT_INDEXER_START_BLOCK")
+                _indexer = EventIndexer(
+                    get_web3(),
+                    pool_address,
+                    path=os.getenv("EVENT_INDEXER_PATH", default_db_path),
+                    start_block=int(start_block) if start_block else None,
+                    lookback=int(os.getenv("EVENT_INDEXER_LOOKBACK", DEFAULT_LOOKBACK)),
+                    chunk_size=int(os.getenv("EVENT_INDEXER_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)),
+                    max_chunk_size=int(os.getenv("EVENT_INDEXER_MAX_CHUNK_SIZE", DEFAULT_MAX_CHUNK_SIZE)),
+                    confirmations=int(os.getenv("EVENT_INDEXER_CONFIRMATIONS", DEFAULT_CONFIRMATIONS)),
+                    poll_interval=float(os.getenv("EVENT_INDEXER_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+                )
+    return _indexer
@@ -0,0 +1,228 @@
+"""
+Fee Oracle
+-------------------
+What:
+EIP-1559のガス代パラメータ（maxFeePerGas・maxPriorityFeePerGas）とガスリミットを計算します。
+eth_feeHistory の結果は FEE_CACHE_TTL 秒（おおよそ1ブロック）キャッシュし、estimate_gas は毎回 eth_feeHistory と
+同じバッチで実行するため、トランザクションの組み立てに必要なRPCは1回になります。見積もりに失敗した場合は、
+同じバッチで取得したガス代はそのまま使い、ガスリミットには同じ送信者・関数・引数の形で最後に成功した見積もりを使います。
+
+Every transaction used to read web3.eth.gas_price several times and use fixed gas limits of 100k-700k. This script
+derives the fee parameters from eth_feeHistory (next block base fee + a priority fee percentile over recent blocks)
+and reuses them for FEE_CACHE_TTL seconds, a wall-clock TTL of roughly one block time. The gas limit is estimated
+live for every transaction, in the same batched request as the fee history when that is not cached: the gas of an
+Aave supply or borrow depends on the sender's positions (the reserves used as collateral or borrowed), so an
+estimate made in another state can run out of gas. The last successful estimate per (sender, contract, function,
+argument shape) is only used when the live estimate fails, for example because the call depends on a transaction
+that is not mined yet; the fee history read in the same batch is still used.
+
+Environment:
+    FEE_HISTORY_BLOCKS: Number of recent blocks used for the priority fee percentile (default 5)
+    FEE_PRIORITY_PERCENTILE: Priority fee percentile paid (default 50)
+    FEE_CACHE_TTL: Seconds the fee parameters are reused, roughly one block time (default 12)
+    GAS_ESTIMATE_MARGIN: Multiplier applied on top of estimate_gas (default 1.2)
+
+Functions:
+    get_fee_oracle
+"""
+
+import logging
+# Built in python imports
+import os
+import statistics
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from rpc_batch import ReadBatch
+from rpc_pool import get_web3
+# Web3 Interactions
+from web3 import Web3
+from web3.contract.contract import ContractFunction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_BLOCKS = 5
+DEFAULT_PRIORITY_PERCENTILE = 50
+DEFAULT_FEE_CACHE_TTL = 12
+DEFAULT_GAS_MARGIN = 1.2
+# web3.pyと同じく、報酬の履歴がない場合は1 gweiをチップとして使う
+MIN_PRIORITY_FEE = Web3.to_wei(1, 'gwei')
+
+
+# ガス見積もりのキャッシュキーとなる引数の形を計算するメソッド
+def argument_shape(value: Any) -> Any:
+    """
+    Reduce a call argument to the part that influences gas usage.
+
+    Addresses are kept as they select different code paths (e.g. a different token), integers only keep whether
+    they are zero, since writing a zero and a non-zero storage slot costs differently.
+
+    Args:
+        value (Any): A contract call argument
+
+    Returns:
+        Any: A hashable shape of the argument
+    """
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value != 0
+    if isinstance(value, (list, tuple)):
+        return tuple(argument_shape(item) for item in value)
+    return type(value).__name__
+
+
+class FeeOracle:
+    """
+    EIP-1559 fee parameters cached for cache_ttl seconds and live gas limits, with the last successful estimate as a
+    fallback.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        history_blocks: int = DEFAULT_HISTORY_BLOCKS,
+        priority_percentile: float = DEFAULT_PRIORITY_PERCENTILE,
+        cache_ttl: float = DEFAULT_FEE_CACHE_TTL,
+        gas_margin: float = DEFAULT_GAS_MARGIN,
+    ):
+        self.web3 = web3
+        self.history_blocks = history_blocks
+        self.priority_percentile = priority_percentile
+        self.cache_ttl = cache_ttl
+        self.gas_margin = gas_margin
+        self._fees: Optional[Dict[str, int]] = None
+        self._fees_at = 0.0
+        self._gas: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _gas_key(self, contract_function: ContractFunction, sender: str) -> Tuple:
+        return (
+            sender.lower(),
+            contract_function.address,
+            contract_function.fn_name,
+            tuple(argument_shape(arg) for arg in contract_function.args),
+        )
+
+    def _cached_fees(self) -> Optional[Dict[str, int]]:
+        with self._lock:
+            if self._fees is not None and time.monotonic() - self._fees_at < self.cache_ttl:
+                return self._fees
+        return None
+
+    # eth_feeHistoryの結果からガス代パラメータを計算するメソッド
+    def _fees_from_history(self, fee_history: Dict[str, Any]) -> Dict[str, int]:
+        # The last base fee in the history is the base fee of the next block
+        next_base_fee = fee_history['baseFeePerGas'][-1]
+        rewards = [block_rewards[0] for block_rewards in fee_history.get('reward') or [] if block_rewards]
+        priority_fee = max(int(statistics.median(rewards)) if rewards else 0, MIN_PRIORITY_FEE)
+        fees = {
+            'maxPriorityFeePerGas': priority_fee,
+            # Twice the base fee keeps the transaction valid through several full blocks of base fee increases
+            'maxFeePerGas': 2 * next_base_fee + priority_fee,
+        }
+        with self._lock:
+            self._fees = fees
+            self._fees_at = time.monotonic()
+        logger.debug("Fee parameters for block %s: %s", fee_history['oldestBlock'] + len(fee_history['baseFeePerGas']) - 1, fees)
+        return fees
+
+    def _queue_fee_history(self, batch: ReadBatch) -> None:
+        batch.add_rpc("fee_history", self.history_blocks, "latest", [self.priority_percentile])
+
+    def fees(self) -> Dict[str, int]:
+        """
+        Get maxFeePerGas and maxPriorityFeePerGas, reading eth_feeHistory at most once per cache_ttl seconds.
+
+        Returns:
+            Dict[str, int]: The EIP-1559 fee fields of a transaction
+        """
+        fees = self._cached_fees()
+        if fees is not None:
+            return fees
+        batch = ReadBatch(self.web3)
+        self._queue_fee_history(batch)
+        fee_history, = batch.execute()
+        return self._fees_from_history(fee_history)
+
+    def transaction_params(self, contract_function: ContractFunction, sender: str, fallback_gas: int) -> Dict[str, int]:
+        """
+        Get gas, maxFeePerGas and maxPriorityFeePerGas for a contract transaction.
+
+        The gas estimate and, when it is not cached, the fee history are sent in one batched request. If the gas
+        estimate fails, for example because the call depends on a transaction that is not mined yet, the last
+        successful estimate of the same sender, function and argument shape is used, or fallback_gas without one.
+        The fee history of the same batch is kept in that case.
+
+        Args:
+            contract_function (ContractFunction): The bound contract function to send
+            sender (str): The sending account
+            fallback_gas (int): Gas limit used when the estimate is not available
+
+        Returns:
+            Dict[str, int]: The gas and fee fields of the transaction
+        """
+        key = self._gas_key(contract_function, sender)
+        fees = self._cached_fees()
+
+        batch = ReadBatch(self.web3)
+        if fees is None:
+            self._queue_fee_history(batch)
+        batch.add_rpc("estimate_gas", {
+            'from': sender,
+            'to': contract_function.address,
+            'data': contract_function._encode_transaction_data(),
+        })
+
+        # A failed estimate must not throw away the fee history read in the same batch
+        results = batch.execute(return_exceptions=True)
+        if fees is None:
+            fee_history = results.pop(0)
+            if isinstance(fee_history, Exception):
+                raise fee_history
+            fees = self._fees_from_history(fee_history)
+
+        estimate = results.pop(0)
+        if isinstance(estimate, Exception):
+            with self._lock:
+                gas = self._gas.get(key, fallback_gas)
+            logger.warning("Gas estimate for %s failed, using %s: %s", contract_function.fn_name, gas, estimate)
+            return {'gas': gas, **fees}
+
+        gas = int(estimate * self.gas_margin)
+        with self._lock:
+            self._gas[key] = gas
+        logger.debug("Gas limit %s for %s", gas, contract_function.fn_name)
+        return {'gas': gas, **fees}
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_fee_oracle: Optional[FeeOracle] = None
+_fee_oracle_lock = threading.Lock()
+
+
+# 共有のフィーオラクルを取得するメソッド
+def get_fee_oracle() -> FeeOracle:
+    """
+    Get the process-wide fee oracle bound to the shared Web3 instance.
+
+    Returns:
+        FeeOracle: The shared fee oracle
+    """
+    global _fee_oracle
+    if _fee_oracle is None:
+        with _fee_oracle_lock:
+            if _fee_oracle is None:
+                _fee_oracle = FeeOracle(
+                    get_web3(),
+                    history_blocks=int(os.getenv("FEE_HISTORY_BLOCKS", DEFAULT_HISTORY_BLOCKS)),
+                    priority_percentile=float(os.getenv("FEE_PRIORITY_PERCENTILE", DEFAULT_PRIORITY_PERCENTILE)),
+                    cache_ttl=float(os.getenv("FEE_CACHE_TTL", DEFAULT_FEE_CACHE_TTL)),
+                    gas_margin=float(os.getenv("GAS_ESTIMATE_MARGIN", DEFAULT_GAS_MARGIN)),
+                )
+    return _fee_oracle
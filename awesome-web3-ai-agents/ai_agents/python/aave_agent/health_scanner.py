@@ -0,0 +1,360 @@
+"""
+Health Scanner
+-------------------
+What:
+多数のウォレットのヘルスファクターをまとめて監視します。getUserAccountData を Multicall3 でチャンクごとにまとめて読み取り、
+結果を NumPy の構造化配列に格納して、ヘルスファクターの分布と清算までの距離をベクトル演算で計算します。
+2回目以降はプールのイベントからポジションが変わったアカウントだけを読み直します。
+
+get_user_account_data reads one account per call. This script reads hundreds to thousands of managed wallets with
+one aggregate3 eth_call per chunk of accounts (chunks run in parallel over the pooled connections), all at the same
+block. The 192 bytes each account returns are decoded in one go with NumPy instead of per account ABI decoding.
+Chunks larger than CALL_CACHE_MAX_CALLDATA bytes skip the per-block read cache (see call_cache.py).
+
+update() asks the pool for the position events (Supply, Withdraw, Borrow, Repay, LiquidationCall, collateral and
+e-mode changes, ...) since the last scan and re-reads only the watched accounts they name. Price moves and interest
+change health factors without any pool event, so a full scan still runs every HEALTH_FULL_SCAN_INTERVAL seconds.
+
+Environment:
+    HEALTH_SCAN_CHUNK_SIZE: Accounts per aggregate3 call (default 200, a call costs roughly 50k gas per account
+                            and nodes cap eth_call gas, usually at 50M)
+    HEALTH_SCAN_WORKERS: Chunks read in parallel (default 4)
+    HEALTH_FULL_SCAN_INTERVAL: Seconds between full scans in update() (default 300)
+    HEALTH_EVENT_RANGE: Largest block gap caught up with eth_getLogs, a longer gap triggers a full scan (default 5000).
+                        The logs are read in windows that are halved whenever the provider refuses the range.
+
+Usage:
+    python health_scanner.py wallets.txt [--watch SECONDS] [--top N]
+
+Functions:
+    HealthScanner
+"""
+
+import argparse
+import logging
+# Built in python imports
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from abis import aave_lending_pool_abi, aave_lending_pool_address
+from event_indexer import is_range_error, retry_timeouts
+from rpc_batch import multicall3_address
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_WORKERS = 4
+DEFAULT_FULL_SCAN_INTERVAL = 300
+DEFAULT_EVENT_RANGE = 5000
+
+# calldataを直接組み立てるための関数セレクタ（アカウントごとにContractFunctionを作らない）
+ACCOUNT_DATA_SELECTOR = bytes(Web3.keccak(text="getUserAccountData(address)")[:4])
+AGGREGATE3_SELECTOR = bytes(Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4])
+
+# getUserAccountData の戻り値（6ワード）の位置
+FIELD_WORDS = ('collateral_usd', 'debt_usd', 'available_borrows_usd', 'liquidation_threshold', 'ltv', 'health_factor')
+# Base currency amounts have 8 decimals (USD), ltv and threshold are basis points, the health factor has 18 decimals
+FIELD_SCALES = np.array([1e8, 1e8, 1e8, 1e4, 1e4, 1e18])
+
+ACCOUNT_DTYPE = np.dtype([
+    ('account', 'U42'),
+    ('collateral_usd', 'f8'),
+    ('debt_usd', 'f8'),
+    ('available_borrows_usd', 'f8'),
+    ('liquidation_threshold', 'f8'),
+    ('ltv', 'f8'),
+    ('health_factor', 'f8'),
+    # Fraction the collateral value can fall before the health factor reaches 1
+    ('collateral_drop_to_liquidation', 'f8'),
+    # Debt that can still be added before the health factor reaches 1
+    ('debt_headroom_usd', 'f8'),
+    ('block', 'i8'),
+])
+
+# ヘルスファクターの区分（区切りの値）
+HEALTH_FACTOR_EDGES = np.array([1.0, 1.05, 1.1, 1.25, 1.5, 2.0])
+BUCKET_LABELS = ('< 1.00 (liquidatable)', '1.00-1.05', '1.05-1.10', '1.10-1.25', '1.25-1.50', '1.50-2.00', '>= 2.00')
+NO_DEBT_LABEL = 'no debt'
+
+# ポジションが変わったことを示すプールのイベント
+POSITION_EVENTS = (
+    'Supply', 'Withdraw', 'Borrow', 'Repay', 'LiquidationCall', 'ReserveUsedAsCollateralEnabled',
+    'ReserveUsedAsCollateralDisabled', 'UserEModeSet', 'SwapBorrowRateMode', 'RebalanceStableBorrowRate',
+    'MintUnbacked',
+)
+
+
+# イベントごとに、ポジションが変わったアカウントが入るトピックの位置を求めるメソッド
+def _position_event_topics(abi: List[Dict]) -> Dict[bytes, int]:
+    topics = {}
+    for entry in abi:
+        if entry.get('type') != 'event' or entry['name'] not in POSITION_EVENTS:
+            continue
+        indexed = [argument['name'] for argument in entry['inputs'] if argument['indexed']]
+        # The position belongs to onBehalfOf when the event has one (Supply, Borrow), otherwise to user
+        holder = 'onBehalfOf' if 'onBehalfOf' in indexed else 'user'
+        signature = f"{entry['name']}({','.join(argument['type'] for argument in entry['inputs'])})"
+        topics[bytes(Web3.keccak(text=signature))] = 1 + indexed.index(holder)
+    return topics
+
+
+# getUserAccountData の戻り値をまとめてデコードするメソッド
+def decode_account_data(return_data: Sequence[Optional[bytes]]) -> np.ndarray:
+    """
+    Decode getUserAccountData return data of many accounts at once.
+
+    Args:
+        return_data (Sequence[Optional[bytes]]): 192 bytes per account, None for a failed read
+
+    Returns:
+        np.ndarray: Shape (accounts, 6) float64 in human units (USD, fractions, health factor), NaN rows for failed
+        reads and an infinite health factor for accounts without debt (Aave returns uint256 max)
+    """
+    failed = np.array([data is None or len(data) != 192 for data in return_data], dtype=bool)
+    buffer = b''.join(bytes(192) if bad else bytes(data) for data, bad in zip(return_data, failed))
+    words = np.frombuffer(buffer, dtype=np.uint8).reshape(len(return_data), 6, 32)
+    # Every value except the no-debt health factor fits in the low 128 bits, read them as two big endian uint64
+    halves = np.ascontiguousarray(words[:, :, 16:]).view('>u8').astype(np.float64)
+    values = (halves[:, :, 0] * 2.0 ** 64 + halves[:, :, 1]) / FIELD_SCALES
+    values[words[:, :, :16].any(axis=2)] = np.inf
+    values[failed] = np.nan
+    return values
+
+
+class HealthScanner:
+    """
+    Health factors of many accounts in a NumPy structured array (ACCOUNT_DTYPE), one row per watched account.
+
+    Usage:
+        scanner = HealthScanner(get_web3(), aave_lending_pool_address)
+        scanner.watch(addresses)
+        scanner.scan()                  # every watched account
+        scanner.update()                # only the accounts named by pool events since the last scan
+        scanner.buckets(), scanner.riskiest(10)
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        pool_address: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        full_scan_interval: float = DEFAULT_FULL_SCAN_INTERVAL,
+        event_range: int = DEFAULT_EVENT_RANGE,
+    ):
+        self.web3 = web3
+        self.pool_address = Web3.to_checksum_address(pool_address)
+        self.chunk_size = chunk_size
+        self.full_scan_interval = full_scan_interval
+        self.event_range = event_range
+        # eth_getLogs window, halved when the provider refuses a range (see event_indexer.is_range_error)
+        self.log_range = event_range
+        self.table = np.zeros(0, dtype=ACCOUNT_DTYPE)
+        self.block: Optional[int] = None
+        self.last_full_scan = 0.0
+        self._rows: Dict[str, int] = {}
+        self._event_topics = _position_event_topics(aave_lending_pool_abi)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='health-scan')
+
+    def watch(self, addresses: Iterable[str]) -> None:
+        """Add accounts to the watched set, they are read by the next scan."""
+        new = []
+        for address in addresses:
+            key = address.lower()
+            if key not in self._rows:
+                self._rows[key] = len(self._rows)
+                new.append(Web3.to_checksum_address(address))
+        if new:
+            rows = np.zeros(len(new), dtype=ACCOUNT_DTYPE)
+            rows['account'] = new
+            rows['block'] = -1
+            self.table = np.concatenate([self.table, rows])
+
+    # 1チャンク分のアカウントを1回のaggregate3で読み取るメソッド
+    def _read_chunk(self, accounts: Sequence[str], block: int) -> List[Optional[bytes]]:
+        calls = [(self.pool_address, True, ACCOUNT_DATA_SELECTOR + bytes(12) + bytes.fromhex(account[2:])) for account in accounts]
+        data = AGGREGATE3_SELECTOR + self.web3.codec.encode(['(address,bool,bytes)[]'], [calls])
+        raw = self.web3.eth.call({'to': multicall3_address, 'data': data}, block)
+        results, = self.web3.codec.decode(['(bool,bytes)[]'], raw)
+        return [return_data if success else None for success, return_data in results]
+
+    def _read(self, rows: np.ndarray, block: int) -> None:
+        accounts = self.table['account'][rows]
+        chunks = [accounts[start:start + self.chunk_size] for start in range(0, len(accounts), self.chunk_size)]
+        return_data: List[Optional[bytes]] = []
+        for chunk_data in self._executor.map(lambda chunk: self._read_chunk(chunk, block), chunks):
+            return_data.extend(chunk_data)
+        values = decode_account_data(return_data)
+        for column, field in enumerate(FIELD_WORDS):
+            self.table[field][rows] = values[:, column]
+        self._derive(rows)
+        self.table['block'][rows] = block
+
+    # 清算までの距離をベクトル演算で計算するメソッド
+    def _derive(self, rows: np.ndarray) -> None:
+        table = self.table
+        health_factor = table['health_factor'][rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drop = np.where(health_factor > 1, 1 - 1 / health_factor, 0.0)
+        table['collateral_drop_to_liquidation'][rows] = np.where(np.isnan(health_factor), np.nan, drop)
+        table['debt_headroom_usd'][rows] = (
+            table['collateral_usd'][rows] * table['liquidation_threshold'][rows] - table['debt_usd'][rows]
+        )
+
+    def scan(self, block: Optional[int] = None) -> np.ndarray:
+        """
+        Read every watched account at one block.
+
+        Args:
+            block (Optional[int]): Block to read at, the current head by default
+
+        Returns:
+            np.ndarray: The updated table
+        """
+        block = self.web3.eth.block_number if block is None else block
+        start = time.perf_counter()
+        self._read(np.arange(len(self.table)), block)
+        self.block, self.last_full_scan = block, time.monotonic()
+        logger.info("Scanned %s account(s) at block %s in %.0f ms", len(self.table), block, (time.perf_counter() - start) * 1000)
+        return self.table
+
+    # 前回のスキャン以降のイベントからポジションが変わったアカウントを求めるメソッド
+    def changed_accounts(self, from_block: int, to_block: int) -> np.ndarray:
+        """
+        Rows of the watched accounts named by position events in [from_block, to_block].
+
+        The range is read in windows of log_range blocks, halved (and kept smaller for later calls) whenever the
+        provider refuses it, and retried on the same window when it times out (see event_indexer.retry_timeouts).
+        Raises the provider's error when even a single block is refused.
+        """
+        logs = []
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.log_range - 1, to_block)
+            try:
+                logs.extend(retry_timeouts(lambda: self.web3.eth.get_logs({
+                    'address': self.pool_address,
+                    'fromBlock': start,
+                    'toBlock': end,
+                    'topics': [['0x' + topic.hex() for topic in self._event_topics]],
+                }), f"eth_getLogs {start}-{end}"))
+            except Exception as e:
+                if not is_range_error(e) or self.log_range == 1:
+                    raise
+                self.log_range = max(1, self.log_range // 2)
+                logger.info("eth_getLogs refused %s blocks (%s), retrying with %s", end - start + 1, e, self.log_range)
+                continue
+            start = end + 1
+        rows = set()
+        for log in logs:
+            topics = log['topics']
+            position = self._event_topics.get(bytes(topics[0]))
+            if position is None or position >= len(topics):
+                continue
+            row = self._rows.get('0x' + bytes(topics[position])[-20:].hex())
+            if row is not None:
+                rows.add(row)
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def update(self) -> int:
+        """
+        Bring the table to the current head, re-reading only the accounts whose positions changed.
+
+        Falls back to a full scan on the first call, when the full scan interval has passed (prices and interest move
+        health factors without pool events) or when the gap is longer than HEALTH_EVENT_RANGE blocks.
+
+        Returns:
+            int: Number of accounts read
+        """
+        head = self.web3.eth.block_number
+        stale = time.monotonic() - self.last_full_scan > self.full_scan_interval
+        unscanned = np.flatnonzero(self.table['block'] < 0)
+        if self.block is None or stale or head - self.block > self.event_range:
+            self.scan(head)
+            return len(self.table)
+        if head <= self.block and not len(unscanned):
+            return 0
+        changed = np.zeros(0, dtype=np.int64)
+        if head > self.block:
+            try:
+                changed = self.changed_accounts(self.block + 1, head)
+            except Exception as e:
+                if not is_range_error(e):
+                    raise
+                logger.warning("Could not read the pool events up to block %s (%s), scanning every account", head, e)
+                self.scan(head)
+                return len(self.table)
+        rows = np.union1d(changed, unscanned)
+        if len(rows):
+            self._read(rows, head)
+        self.block = head
+        logger.info("Re-read %s changed account(s) up to block %s", len(rows), head)
+        return len(rows)
+
+    def buckets(self) -> Dict[str, int]:
+        """Number of accounts per health factor bucket, accounts without debt are counted separately."""
+        health_factor = self.table['health_factor']
+        scanned = ~np.isnan(health_factor) & (self.table['block'] >= 0)
+        no_debt = scanned & ((self.table['debt_usd'] == 0) | np.isinf(health_factor))
+        with_debt = health_factor[scanned & ~no_debt]
+        counts = np.bincount(np.digitize(with_debt, HEALTH_FACTOR_EDGES), minlength=len(BUCKET_LABELS))
+        return {**dict(zip(BUCKET_LABELS, counts.tolist())), NO_DEBT_LABEL: int(no_debt.sum())}
+
+    def riskiest(self, count: int = 10) -> np.ndarray:
+        """The accounts with debt and the lowest health factors, lowest first."""
+        table = self.table[(self.table['debt_usd'] > 0) & np.isfinite(self.table['health_factor'])]
+        return table[np.argsort(table['health_factor'])[:count]]
+
+
+# 環境変数の設定でスキャナーを作成するメソッド
+def scanner_from_env(web3: Web3, pool_address: str) -> HealthScanner:
+    return HealthScanner(
+        web3,
+        pool_address,
+        chunk_size=int(os.getenv('HEALTH_SCAN_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+        workers=int(os.getenv('HEALTH_SCAN_WORKERS', DEFAULT_WORKERS)),
+        full_scan_interval=float(os.getenv('HEALTH_FULL_SCAN_INTERVAL', DEFAULT_FULL_SCAN_INTERVAL)),
+        event_range=int(os.getenv('HEALTH_EVENT_RANGE', DEFAULT_EVENT_RANGE)),
+    )
+
+
+def _print_report(scanner: HealthScanner, top: int) -> None:
+    print(f"Block {scanner.block}: {len(scanner.table)} account(s)")
+    for label, count in scanner.buckets().items():
+        print(f"  {label:>22}: {count}")
+    for row in scanner.riskiest(top):
+        print(f"  {row['account']}  HF {row['health_factor']:.3f}  debt ${row['debt_usd']:,.2f}  "
+              f"collateral can drop {row['collateral_drop_to_liquidation']:.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Health factors of many Aave accounts")
+    parser.add_argument('wallets', help="File with one account address per line")
+    parser.add_argument('--watch', type=float, default=0, help="Re-check every N seconds (changed accounts only)")
+    parser.add_argument('--top', type=int, default=10, help="Number of riskiest accounts to list")
+    args = parser.parse_args()
+
+    # Shared pooled connection and logging of the agent
+    from log_config import configure_logging
+    from rpc_pool import get_web3
+    configure_logging()
+
+    with open(args.wallets) as wallets:
+        addresses = [line.strip() for line in wallets if line.strip() and not line.startswith('#')]
+    scanner = scanner_from_env(get_web3(), aave_lending_pool_address)
+    scanner.watch(addresses)
+    scanner.scan()
+    _print_report(scanner, args.top)
+    while args.watch:
+        time.sleep(args.watch)
+        if scanner.update():
+            _print_report(scanner, args.top)
+
+
+if __name__ == "__main__":
+    main()
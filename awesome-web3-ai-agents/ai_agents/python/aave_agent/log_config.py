@@ -0,0 +1,168 @@
+"""
+Log Config
+-------------------
+What:
+AAVEエージェントのロギングを設定します。ログの書き出しはキューを介して専用スレッドで行うため、ツールの処理を止めません。
+モジュールごとにログレベルを設定でき、秘密鍵や署名済みトランザクションはログに出力される前に伏せ字にされます。
+
+Every module logs through logging.getLogger(__name__) with %-style arguments, so a message below the level of its
+logger costs one level check and is never formatted:
+
+    logger.debug("Approval transaction built: %s", approve_tx)
+
+Records that pass their level are put on a queue as they are; formatting, redaction and the write to stderr happen on
+the listener thread. The formatter redacts registered secrets (the private key set by the user) and long hex blobs
+such as raw signed transactions, in the message and in the traceback. LOG_FORMAT=json writes one JSON object per line.
+
+Environment:
+    LOG_LEVEL: Level of the root logger (default INFO)
+    LOG_LEVELS: Per module levels, e.g. "tools=DEBUG,rpc_pool=WARNING,web3=WARNING"
+    LOG_FORMAT: "text" (default) or "json"
+
+Functions:
+    configure_logging
+    register_secret
+    LazyHex
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+# Built in python imports
+import os
+import queue
+import re
+import threading
+from typing import List, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+REDACTED = '[REDACTED]'
+# Hex strings longer than a 32-byte hash or key are raw transactions or signatures
+_LONG_HEX = re.compile(r'0x[0-9a-fA-F]{130,}')
+
+_secrets: List[str] = []
+_secrets_lock = threading.Lock()
+_secret_pattern: Optional[re.Pattern] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+# ログから伏せる値を登録するメソッド（秘密鍵など）
+def register_secret(value: Optional[str]) -> None:
+    """
+    Register a value (e.g. the private key) that must never appear in the logs, with or without its 0x prefix.
+
+    Args:
+        value (Optional[str]): The secret, ignored if empty
+    """
+    global _secret_pattern
+    if not value:
+        return
+    bare = value[2:] if value.lower().startswith('0x') else value
+    with _secrets_lock:
+        if bare in _secrets:
+            return
+        _secrets.append(bare)
+        _secret_pattern = re.compile('|'.join(f'(?:0x)?{re.escape(secret)}' for secret in _secrets), re.IGNORECASE)
+
+
+def redact(text: str) -> str:
+    """Replace registered secrets and long hex blobs in a string."""
+    pattern = _secret_pattern
+    if pattern is not None:
+        text = pattern.sub(REDACTED, text)
+    return _LONG_HEX.sub(lambda match: f'0x{REDACTED}({(len(match.group()) - 2) // 2} bytes)', text)
+
+
+class LazyHex:
+    """
+    Log argument that renders bytes (HexBytes, raw transactions) as 0x hex, only when the record is formatted.
+
+        logger.debug("Raw transaction: %s", LazyHex(signed_tx.raw_transaction))
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: bytes):
+        self.value = value
+
+    def __str__(self) -> str:
+        return '0x' + bytes(self.value).hex()
+
+
+class RedactingFormatter(logging.Formatter):
+    """Text formatter that redacts the formatted message, traceback included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message (redacted) and exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return redact(json.dumps(entry, default=str))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the formatting to the listener thread.
+
+    The standard QueueHandler formats the message in the logging thread. Here the record is only snapshotted (the
+    traceback is rendered now, the message arguments are kept as they are) and formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+# 環境変数の "module=LEVEL,..." をモジュールごとのレベルに変換するメソッド
+def _module_levels(spec: str) -> List[tuple]:
+    levels = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels.append((name.strip(), level.strip().upper()))
+    return levels
+
+
+# ロギングを設定するメソッド（何度呼んでも1度だけ設定される）
+def configure_logging() -> None:
+    """
+    Configure the root logger with the queue handler, levels and formatter from the environment.
+
+    Safe to call from every entrypoint and module, only the first call has an effect.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if os.getenv('LOG_FORMAT', 'text').lower() == 'json' else RedactingFormatter(TEXT_FORMAT)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+
+        log_queue: "queue.Queue" = queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        root.handlers = [DeferredQueueHandler(log_queue)]
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        for name, level in _module_levels(os.getenv('LOG_LEVELS', '')):
+            logging.getLogger(name).setLevel(level)
@@ -4,37 +4,36 @@ Main script
 What:
 This script acts as the entrypoint to the AI Agent. Within you'll find that it provides functionality to be able to connect to a Web3 endpoint and have the AI agent act on it.
 
+The conversation is kept by a LangGraph checkpointer (one thread per chat session), so each turn only sends the
+new user message to the graph. The memory policy in memory.py caps how much of the thread reaches the LLM.
+The answer is streamed (see agent_common/streaming.py): LLM tokens and tool progress are rendered while the graph runs.
 
 """
 import os
-# Python Built In Libraries
-from typing import (  # used to set additional metadata for a variable
-    Annotated, List)
+import uuid
 
 # User Interface
 import streamlit as st
-from langchain_core.messages import BaseMessage, SystemMessage
-from langchain_groq import ChatGroq
-# Langchain / Langraphpip 
-from langgraph.graph import \
-    START  # type of node (a python function which has some kind of logic) which takes user input and sends it into the graph
-from langgraph.graph import \
-    StateGraph  # data structure which represents the current snapshot of an application
-from langgraph.graph.message import \
-    add_messages  # appends messages to the end of the attribute it was assigned to
-from langgraph.prebuilt import \
-    ToolNode  # a pre-built component and node whichs runs the tools called in the last AIMessage
-from langgraph.prebuilt import \
-    tools_condition  # a pre-built component and node which uses the conditional_edge to route to the ToolNode if the last message has tool calls. Otherwise, route to the end.
-# Tools
-from tools import (borrow_crypto, get_token_balance, lend_crypto,
-                   set_private_key)
-from typing_extensions import \
-    TypedDict  # a type that allows you to define dictionaries with specific key-value types
-from web3 import Web3
-
-# Initialize Web3
-web3 = Web3(Web3.HTTPProvider(os.getenv("RPC_URL")))
+from agent import get_graph
+from agent_registry import get_agent_registry, stream_async
+from langchain_core.messages import HumanMessage
+from memory import get_prompt_metrics
+from agent_common.streaming import STREAM_MODES, render_stream
+from agent_common.tracing import get_tracer
+from tools import event_indexer, reserve_index, set_private_key
+from tx_tracker import get_receipt_watcher, set_session
+from rpc_pool import get_rpc_pool, get_web3
+
+# Initialize Web3 - the same pooled connection the tools use
+web3 = get_web3()
+prompt_metrics = get_prompt_metrics()
+
+WELCOME_MESSAGE = "Hello! I'm your AAVE DeFi assistant. I can help you check token balances, lend, and borrow crypto. How can I assist you today?"
+
+# One checkpointer thread per chat, a new one after "Clear Chat History"
+# 会話のスレッドID
+if "thread_id" not in st.session_state:
+    st.session_state["thread_id"] = uuid.uuid4().hex
 
 with st.sidebar:
     groq_api_key = st.text_input("Groq API Key", key="chatbot_api_key", type="password")
@@ -44,9 +43,31 @@ with st.sidebar:
     "[Create a private key with Rabby Wallet](https://rabby.io/)"
 
     if st.button("Clear Chat History"):
-        st.session_state.messages = [{"role": "assistant", "content": "Hello! I'm your AAVE DeFi assistant. I can help you check token balances, lend, and borrow crypto. How can I assist you today?"}]
+        st.session_state.messages = [{"role": "assistant", "content": WELCOME_MESSAGE}]
+        prompt_metrics.clear(st.session_state.thread_id)
+        st.session_state.thread_id = uuid.uuid4().hex
         st.rerun()
 
+    # ターンごとのプロンプトサイズを表示する
+    with st.expander("Prompt size per turn"):
+        st.dataframe(prompt_metrics.turns(st.session_state.thread_id))
+
+    # スパン名ごとの処理時間（LLM・ツール・RPC・トランザクションの確定待ち）を表示する
+    with st.expander("Latency (ms)"):
+        st.dataframe(get_tracer().histograms())
+
+    # エージェントレジストリの統計情報を表示する
+    with st.expander("Agent registry"):
+        st.json(get_agent_registry().stats())
+
+    # eth_callのキャッシュのヒット率を表示する
+    with st.expander("Read cache"):
+        st.json(get_rpc_pool().call_cache.stats())
+
+    # イベントインデックスの進み具合を表示する
+    with st.expander("Event index"):
+        st.json(event_indexer.stats())
+
     "[![View the source code](https://badgen.net/static/Github/Repository/black?icon=github)](https://github.com/jondoescoding/awesome-ai-agents/tree/main/ai_agents/aave_agent)"
 
     
@@ -60,6 +81,18 @@ if not private_key:
 # Set the private key in tools.py
 set_private_key(private_key)
 
+# The tokens come from the reserves of the Aave pool, read once per process (see reserve_index.py)
+# プールのリザーブ一覧を読み込む（トークンのメタデータもここで読み込まれる）
+try:
+    reserve_lines = list(reserve_index.describe())
+except Exception as e:
+    st.error(f"Could not read the Aave reserves: {e}")
+    st.stop()
+
+# The pool events are indexed in the background so that history questions are answered locally (see event_indexer.py)
+# プールのイベントのインデックス作成をバックグラウンドで開始する
+event_indexer.start()
+
 # Create account from private key
 account = web3.eth.account.from_key(private_key)
 user_address = account.address
@@ -70,68 +103,30 @@ You are connected to the wallet address: {user_address}
 
 You have access to the following tokens and their addresses:
 
-- USDC (USD Coin): 0x94a9D9AC8a22534E3FaCa9F4e7F2E2cf85d5E4C8
-- DAI (Dai Stablecoin): 0xFF34B3d4Aee8ddCd6F9AFFFB6Fe49bD371b8a357 
-- WBTC (Wrapped Bitcoin): 0x29f2D40B0605204364af54EC677bD022dA425d03 
-- USDT (Tether USD): 0xaA8E23Fb1079EA71e0a56F48a2aA51851D8433D0
+{chr(10).join(reserve_lines)}
+
+Reserves marked frozen or paused can not be lent or borrowed. When lending or borrowing returns a message starting
+with "Rejected before sending", nothing was sent: explain the reason to the user.
 
 You can help users:
 1. Check their token balances of ONLY the above contracts. Let the user know what tokens are available.
+When the user asks for more than one balance or their positions, use get_portfolio once instead of get_token_balance per token.
 2. Lend their tokens to earn interest
 3. Borrow tokens against their collateral
+4. Check whether a submitted transaction has been confirmed. Lending and borrowing return the transaction hash as
+soon as it is sent, the confirmation is reported separately.
+5. Answer questions about their past supplies, borrows, repayments, withdrawals and liquidations with
+get_lending_history (e.g. days=7 for "last week").
 
 Always use the exact token addresses provided above when helping users interact with the protocol."""
 
-llm = ChatGroq(model="llama3-70b-8192", api_key=groq_api_key)
-
 ####
 # LOGIC - LangGraph Setup
 ####
 
-# Initialize LLM and Tools
-# 使うツールとLLMを初期化する。
-tools = [get_token_balance, lend_crypto, borrow_crypto]
-llm_with_tools = llm.bind_tools(tools=tools)
-
-# State Management
-class State(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages]
-
-# Graph Builder Setup
-graph_builder = StateGraph(State)
-
-# Chatbot Function
-# chatbot 関数
-def chatbot(state: State):
-    # Get all messages including history
-    messages = state["messages"]
-    
-    # Add system message if it's not already in the messages
-    if not any(isinstance(msg, SystemMessage) for msg in messages):
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + messages
-    
-    # Get response from LLM with full conversation history
-    # AIに推論を実行させる。
-    response = llm_with_tools.invoke(messages)
-    
-    return {"messages": [response]}
-
-# Node Configuration
-# AI Agent用のワークフローを作成する。
-tools_node = ToolNode(tools=tools)
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_node("tools", tools_node)
-
-# Edge Configuration
-graph_builder.add_conditional_edges(
-    "chatbot",
-    tools_condition,
-)
-graph_builder.add_edge("tools", "chatbot")
-graph_builder.add_edge(START, "chatbot")
-
-# Compile Graph
-graph = graph_builder.compile()
+# The graph (LLM client, bound tools, checkpointer) is built once per process and API key, not on every rerun
+# グラフはAPIキーごとに1度だけ作成され、Streamlitの再実行では使い回される（agent.py を参照）
+graph = get_graph(groq_api_key)
 
 ####
 # UI - Streamlit Chat Interface
@@ -140,12 +135,37 @@ st.title("🏦💬 AAVE DeFi Assistant")
 
 # Initialize chat history
 if "messages" not in st.session_state:
-    st.session_state["messages"] = [{"role": "assistant", "content": "Hello! I'm your AAVE DeFi assistant. I can help you check token balances, lend, and borrow crypto. How can I assist you today?"}]
+    st.session_state["messages"] = [{"role": "assistant", "content": WELCOME_MESSAGE}]
+
+# Identify this chat session so that transaction updates are delivered to it
+# トランザクションの確定通知を届けるためのセッションID
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+set_session(st.session_state.session_id)
+receipt_watcher = get_receipt_watcher()
 
 # Display chat history
 for msg in st.session_state.messages:
     st.chat_message(msg["role"]).write(msg["content"])
 
+# Push transaction confirmations into the chat while the user is idle
+# バックグラウンドで確定したトランザクションの状況をチャットに反映する
+@st.fragment(run_every=float(os.getenv("RECEIPT_POLL_INTERVAL", 3)))
+def transaction_updates():
+    updates = receipt_watcher.drain_updates(st.session_state.session_id)
+    if updates:
+        for update in updates:
+            block = f" in block {update['block_number']}" if update['block_number'] else ""
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": f"Transaction `{update['tx_hash']}` ({update['label']}) is **{update['status']}**{block}.",
+            })
+        st.rerun()
+    for pending in receipt_watcher.pending(st.session_state.session_id):
+        st.caption(f"⏳ Waiting for `{pending['tx_hash']}` ({pending['label']}) to be mined...")
+
+transaction_updates()
+
 # Handle user input
 if prompt := st.chat_input():
     if not groq_api_key:
@@ -156,22 +176,31 @@ if prompt := st.chat_input():
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.chat_message("user").write(prompt)
 
-    # Convert chat history to LangChain message format
-    from langchain_core.messages import AIMessage, HumanMessage
-    history = []
-    for msg in st.session_state.messages:
-        if msg["role"] == "user":
-            history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            history.append(AIMessage(content=msg["content"]))
-
-    # Get AI response with a loading spinner
-    with st.spinner("Thinking..."):
-        response = graph.invoke({"messages": history})
-        msg = response["messages"][-1].content
+    # Only the new message is sent, the rest of the conversation is in the checkpointer thread
+    # 新しいメッセージだけをグラフに渡す（履歴はチェックポインターに保存されている）
+    # The cached graph is shared by every user, the user specific system prompt is passed with the run config
+    # The callback handler records a span per LLM call and per tool call (see agent_common/tracing.py)
+    config = {
+        "configurable": {"thread_id": st.session_state.thread_id, "system_prompt": SYSTEM_PROMPT},
+        "callbacks": [get_tracer().callback_handler()],
+    }
+    prompt_metrics.start_turn(st.session_state.thread_id)
+
+    # Stream the AI response: tokens are shown as they are generated, tool calls as progress
+    # AIの応答をストリーミングで表示する（トークンは生成されるたびに、ツールの呼び出しは進捗として表示する）
+    with st.chat_message("assistant"):
+        status = st.status("Thinking...")
+        placeholder = st.empty()
+        # 複数のツール呼び出しを並列に実行するため、グラフは非同期で実行する
+        # The shared event loop keeps the async HTTP connections of the cached LLM client alive between turns
+        # The LLM, tool and RPC spans of the turn are children of the turn span
+        with get_tracer().span("agent.turn", agent="aave"):
+            chunks = stream_async(
+                graph.astream({"messages": [HumanMessage(content=prompt)]}, config, stream_mode=STREAM_MODES)
+            )
+            msg = render_stream(chunks, placeholder, status)
 
     # Add AI response to chat
     st.session_state.messages.append({"role": "assistant", "content": msg})
-    st.chat_message("assistant").write(msg)
 
 
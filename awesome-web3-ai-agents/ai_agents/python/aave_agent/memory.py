@@ -0,0 +1,237 @@
+"""
+Memory
+-------------------
+What:
+会話履歴のうちLLMに送る範囲を制限するメモリーポリシーと、ターンごとのプロンプトサイズの計測を提供します。
+会話の状態はLangGraphのチェックポインターに保存されるため、各ターンでは新しいメッセージだけをグラフに渡します。
+
+The conversation lives in the LangGraph checkpointer (one thread per chat session), so main.py only sends the new
+user message each turn. ConversationMemory runs at the start of every turn and caps what is kept in the thread:
+"window" drops everything before the last MEMORY_WINDOW messages, "summary" additionally folds the dropped
+messages into a running summary with the LLM. PromptMetrics records the size of every prompt sent to the LLM.
+
+Environment:
+    MEMORY_POLICY: "window" (default) or "summary"
+    MEMORY_WINDOW: Number of most recent messages kept (default 20)
+
+Functions:
+    get_prompt_metrics
+"""
+
+import logging
+# Built in python imports
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (AIMessage, BaseMessage, HumanMessage,
+                                     RemoveMessage, SystemMessage,
+                                     get_buffer_string)
+from agent_common.tool_output import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 20
+# 要約の指示
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an AAVE DeFi assistant in a few sentences. "
+    "Keep token symbols, amounts, addresses and transaction hashes exactly. "
+    "If a previous summary is given, extend it instead of starting over."
+)
+
+
+# 送信するメッセージのおおよそのトークン数を計算するメソッド
+def message_tokens(messages: List[BaseMessage]) -> int:
+    """
+    Estimate the prompt tokens of a list of messages, tool call arguments included.
+
+    Args:
+        messages (List[BaseMessage]): The messages sent to the LLM
+
+    Returns:
+        int: The estimated number of tokens
+    """
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += estimate_tokens(content)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            total += estimate_tokens(str(message.tool_calls))
+    return total
+
+
+class ConversationMemory:
+    """
+    LangGraph node applying the memory policy at the start of each turn.
+
+    The cut always lands on a HumanMessage so that an AIMessage with tool calls is never separated from its
+    ToolMessages.
+    """
+
+    def __init__(self, llm: Optional[BaseChatModel] = None, policy: str = "window", window: int = DEFAULT_WINDOW):
+        if policy not in ("window", "summary"):
+            raise ValueError(f"Unknown memory policy: {policy}")
+        if policy == "summary" and llm is None:
+            raise ValueError("The summary policy needs an LLM")
+        self.llm = llm
+        self.policy = policy
+        self.window = window
+
+    # 残すメッセージの開始位置を計算するメソッド
+    def _cut(self, messages: List[BaseMessage]) -> int:
+        if len(messages) <= self.window:
+            return 0
+        start = len(messages) - self.window
+        for index in range(start, len(messages)):
+            if isinstance(messages[index], HumanMessage):
+                return index
+        # The current turn alone is longer than the window, keep it from its first message
+        for index in range(start - 1, -1, -1):
+            if isinstance(messages[index], HumanMessage):
+                return index
+        return 0
+
+    async def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        messages = state["messages"]
+        cut = self._cut(messages)
+        if cut == 0:
+            return {}
+        dropped = messages[:cut]
+        update: Dict[str, Any] = {"messages": [RemoveMessage(id=message.id) for message in dropped]}
+        if self.policy == "summary":
+            # 古いメッセージを要約に取り込む。
+            previous = state.get("summary") or ""
+            response = await self.llm.ainvoke([
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content=f"Previous summary:\n{previous}\n\nConversation:\n{get_buffer_string(dropped)}"),
+            ])
+            update["summary"] = response.content
+        logger.info("Memory policy '%s' dropped %s message(s)", self.policy, len(dropped))
+        return update
+
+    def prompt(self, system_prompt: str, state: Dict[str, Any]) -> List[BaseMessage]:
+        """
+        Build the messages sent to the LLM: the system prompt (with the running summary, if any) and the thread.
+
+        Args:
+            system_prompt (str): The agent's system prompt
+            state (Dict[str, Any]): The graph state
+
+        Returns:
+            List[BaseMessage]: The prompt
+        """
+        summary = state.get("summary")
+        if summary:
+            system_prompt = f"{system_prompt}\n\nSummary of the earlier conversation:\n{summary}"
+        return [SystemMessage(content=system_prompt)] + list(state["messages"])
+
+
+class PromptMetrics:
+    """
+    Per chat thread record of the prompts sent to the LLM.
+
+    Every LLM call is recorded with the number of messages, the estimated prompt tokens and, when the provider
+    reports it, the actual input/output token usage. Calls are grouped into turns by start_turn().
+    """
+
+    def __init__(self, max_turns: int = 50):
+        self.max_turns = max_turns
+        self._turns: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def start_turn(self, thread_id: str) -> None:
+        with self._lock:
+            turns = self._turns.setdefault(thread_id, [])
+            turns.append({'started_at': time.time(), 'llm_calls': []})
+            del turns[:-self.max_turns]
+
+    def record(self, thread_id: str, messages: List[BaseMessage], response: Optional[AIMessage] = None) -> None:
+        """
+        Record one LLM call of the current turn.
+
+        Args:
+            thread_id (str): The chat thread
+            messages (List[BaseMessage]): The prompt sent to the LLM
+            response (Optional[AIMessage]): The LLM response, its usage_metadata is recorded if present
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        call = {
+            'messages': len(messages),
+            'estimated_tokens': message_tokens(messages),
+            'input_tokens': usage.get('input_tokens'),
+            'output_tokens': usage.get('output_tokens'),
+        }
+        with self._lock:
+            turns = self._turns.setdefault(thread_id, [])
+            if not turns:
+                turns.append({'started_at': time.time(), 'llm_calls': []})
+            turns[-1]['llm_calls'].append(call)
+        logger.debug("Prompt for thread %s: %s", thread_id, call)
+
+    def turns(self, thread_id: str) -> List[Dict[str, Any]]:
+        """
+        Summaries of the recorded turns of a thread, oldest first.
+
+        Returns:
+            List[Dict[str, Any]]: llm_calls, the largest prompt (messages and estimated tokens) and the summed
+            input tokens reported by the provider per turn
+        """
+        with self._lock:
+            turns = [dict(turn, llm_calls=list(turn['llm_calls'])) for turn in self._turns.get(thread_id, [])]
+        summaries = []
+        for turn in turns:
+            calls = turn['llm_calls']
+            summaries.append({
+                'llm_calls': len(calls),
+                'max_prompt_messages': max((call['messages'] for call in calls), default=0),
+                'max_prompt_tokens': max((call['estimated_tokens'] for call in calls), default=0),
+                'input_tokens': sum(call['input_tokens'] or 0 for call in calls),
+            })
+        return summaries
+
+    def clear(self, thread_id: str) -> None:
+        with self._lock:
+            self._turns.pop(thread_id, None)
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_prompt_metrics: Optional[PromptMetrics] = None
+_prompt_metrics_lock = threading.Lock()
+
+
+# 共有のプロンプト計測を取得するメソッド
+def get_prompt_metrics() -> PromptMetrics:
+    """
+    Get the process-wide prompt metrics.
+
+    Returns:
+        PromptMetrics: The shared prompt metrics
+    """
+    global _prompt_metrics
+    if _prompt_metrics is None:
+        with _prompt_metrics_lock:
+            if _prompt_metrics is None:
+                _prompt_metrics = PromptMetrics()
+    return _prompt_metrics
+
+
+# 環境変数からメモリーポリシーを作成するメソッド
+def memory_from_env(llm: BaseChatModel) -> ConversationMemory:
+    """
+    Create the ConversationMemory configured by MEMORY_POLICY and MEMORY_WINDOW.
+
+    Args:
+        llm (BaseChatModel): The LLM used by the summary policy
+
+    Returns:
+        ConversationMemory: The memory node
+    """
+    return ConversationMemory(
+        llm,
+        policy=os.getenv("MEMORY_POLICY", "window").lower(),
+        window=int(os.getenv("MEMORY_WINDOW", DEFAULT_WINDOW)),
+    )
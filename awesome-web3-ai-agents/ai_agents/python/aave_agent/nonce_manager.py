@@ -0,0 +1,176 @@
+"""
+Nonce Manager
+-------------------
+What:
+アカウントごとのナンスをローカルで払い出します。依存するトランザクション（approve → supply など）を
+レシートを待たずに連続で送信でき、並列のチャットセッションから同じ鍵を使ってもナンスが衝突しません。
+
+This script hands out transaction nonces locally per account. The first allocation (and any allocation after
+the resync interval) reads the pending transaction count from the chain, every other allocation is a local
+increment under a lock. Nonces that end up unused (signing or sending failed) are handed back with release(),
+which only rewinds when they are still the latest allocation, so nonces another session already holds are never
+handed out twice. When a transaction is dropped or replaced, resync() resets the account to the chain's pending
+count.
+
+Environment:
+    NONCE_RESYNC_INTERVAL: Seconds after which the local nonce is checked against the chain again (default 60)
+
+Functions:
+    get_nonce_manager
+"""
+
+import logging
+# Built in python imports
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from rpc_pool import get_web3
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESYNC_INTERVAL = 60
+
+
+class AccountNonce:
+    """
+    Local nonce state of a single account.
+
+    Attributes:
+        next_nonce (Optional[int]): The next nonce to hand out, None until the first sync
+        synced_at (float): Monotonic time of the last sync with the chain
+        lock (threading.Lock): Serialises allocations for the account
+    """
+
+    def __init__(self):
+        self.next_nonce: Optional[int] = None
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+
+class NonceManager:
+    """
+    Thread-safe per-account nonce allocator.
+
+    The lock of an account is only held for the local bookkeeping and the occasional pending-count read, never
+    across a transaction send, so it is safe to use from threads and from asyncio tasks alike.
+    """
+
+    def __init__(self, web3: Web3, resync_interval: float = DEFAULT_RESYNC_INTERVAL):
+        self.web3 = web3
+        self.resync_interval = resync_interval
+        self._accounts: Dict[str, AccountNonce] = {}
+        self._accounts_lock = threading.Lock()
+
+    def _account(self, address: str) -> AccountNonce:
+        with self._accounts_lock:
+            if address not in self._accounts:
+                self._accounts[address] = AccountNonce()
+            return self._accounts[address]
+
+    # チェーン上の未確定分を含むトランザクション数を取得するメソッド
+    def _pending_count(self, address: str) -> int:
+        return self.web3.eth.get_transaction_count(address, 'pending')
+
+    def allocate(self, address: str, count: int = 1) -> List[int]:
+        """
+        Reserve consecutive nonces for an account.
+
+        Args:
+            address (str): The sending account
+            count (int): Number of consecutive nonces to reserve, e.g. 2 for approve + supply
+
+        Returns:
+            List[int]: The reserved nonces in sending order
+        """
+        state = self._account(address)
+        with state.lock:
+            now = time.monotonic()
+            if state.next_nonce is None or now - state.synced_at > self.resync_interval:
+                chain_nonce = self._pending_count(address)
+                # Keep local allocations that the node has not seen yet, but catch up with transactions sent
+                # from outside this process (e.g. the user's wallet)
+                state.next_nonce = chain_nonce if state.next_nonce is None else max(state.next_nonce, chain_nonce)
+                state.synced_at = now
+            nonces = list(range(state.next_nonce, state.next_nonce + count))
+            state.next_nonce += count
+        logger.debug("Allocated nonce(s) %s for %s", nonces, address)
+        return nonces
+
+    def release(self, address: str, nonces: List[int]) -> bool:
+        """
+        Hand back nonces that were reserved but never sent.
+
+        The counter is only rewound when these nonces are still the most recent allocation of the account. When a
+        concurrent session has allocated after them, the counter is left alone: rewinding would hand out nonces
+        that session still holds. The gap is then healed by the receipt watcher, which resyncs the account once
+        the transactions queued behind it are dropped.
+
+        Args:
+            address (str): The sending account
+            nonces (List[int]): The unused nonces, consecutive and in sending order (as returned by allocate)
+
+        Returns:
+            bool: True if the nonces will be handed out again
+        """
+        if not nonces:
+            return False
+        state = self._account(address)
+        with state.lock:
+            released = state.next_nonce == nonces[-1] + 1
+            if released:
+                state.next_nonce = nonces[0]
+        if released:
+            logger.debug("Released nonce(s) %s for %s", nonces, address)
+        else:
+            logger.warning("Nonce(s) %s for %s were not released, later nonces are already in use", nonces, address)
+        return released
+
+    def resync(self, address: str) -> int:
+        """
+        Reset the account to the chain's pending transaction count.
+
+        Call this after a transaction was dropped or replaced, so that the gap left by its nonce is reused by
+        the next transaction. Nonces of transactions that were never sent are handed back with release() instead.
+
+        Args:
+            address (str): The account to resync
+
+        Returns:
+            int: The next nonce after the resync
+        """
+        state = self._account(address)
+        with state.lock:
+            state.next_nonce = self._pending_count(address)
+            state.synced_at = time.monotonic()
+            logger.info("Resynced nonce for %s: next nonce is %s", address, state.next_nonce)
+            return state.next_nonce
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_nonce_manager: Optional[NonceManager] = None
+_nonce_manager_lock = threading.Lock()
+
+
+# 共有のナンスマネージャーを取得するメソッド
+def get_nonce_manager() -> NonceManager:
+    """
+    Get the process-wide nonce manager bound to the shared Web3 instance.
+
+    Returns:
+        NonceManager: The shared nonce manager
+    """
+    global _nonce_manager
+    if _nonce_manager is None:
+        with _nonce_manager_lock:
+            if _nonce_manager is None:
+                _nonce_manager = NonceManager(
+                    get_web3(),
+                    resync_interval=float(os.getenv("NONCE_RESYNC_INTERVAL", DEFAULT_RESYNC_INTERVAL)),
+                )
+    return _nonce_manager
@@ -0,0 +1,322 @@
+"""
+Reserve Index
+-------------------
+What:
+AAVEプールに登録されている全リザーブ（トークン）の一覧と設定（LTV・上限・凍結/停止状態など）をチェーンから読み込みます。
+シンボルまたはアドレスからリザーブをO(1)で引けるため、ツールはトランザクションを送る前に上限や凍結状態を確認できます。
+
+The reserve list comes from Pool.getReservesList instead of a hard-coded token list. Each refresh is a single
+Multicall3 round trip (see rpc_batch.py) with getReservesList, getReserveData and the aToken / debt token supplies of
+every known reserve, and it happens at most once per block (the head comes from the read cache's poller, see
+call_cache.py). Token and aToken addresses, symbols and decimals never change for a listed reserve, they are read
+once when a reserve first shows up, so a refresh only re-reads what moves.
+
+The configuration bitmap of getReserveData is decoded here (the same bit layout as Aave v3 ReserveConfiguration),
+so no separate data provider call is needed. check_supply and check_borrow mirror the checks of Aave's
+ValidationLogic that can fail without any account state: inactive, paused or frozen reserves, borrowing disabled,
+supply and borrow caps and the liquidity available to borrow.
+
+Functions:
+    get_reserve_index
+"""
+
+import logging
+# Built in python imports
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from abis import aave_lending_pool_abi, erc20_abi
+from contract_cache import get_contract_cache
+from rpc_batch import ReadBatch
+from rpc_pool import get_rpc_pool, get_web3
+from token_registry import get_token_registry
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+RAY = 10 ** 27
+
+# Aave v3 ReserveConfiguration bit layout: name -> (first bit, number of bits)
+# リザーブ設定のビット配置
+CONFIGURATION_BITS = {
+    'ltv': (0, 16),
+    'liquidation_threshold': (16, 16),
+    'liquidation_bonus': (32, 16),
+    'decimals': (48, 8),
+    'active': (56, 1),
+    'frozen': (57, 1),
+    'borrowing_enabled': (58, 1),
+    'stable_borrowing_enabled': (59, 1),
+    'paused': (60, 1),
+    'reserve_factor': (64, 16),
+    'borrow_cap': (80, 36),
+    'supply_cap': (116, 36),
+}
+# 割合（ベーシスポイント）で表される設定
+BASIS_POINT_FIELDS = ('ltv', 'liquidation_threshold', 'liquidation_bonus', 'reserve_factor')
+FLAG_FIELDS = ('active', 'frozen', 'borrowing_enabled', 'stable_borrowing_enabled', 'paused')
+
+# getReserveData の ReserveData の位置
+RESERVE_CONFIGURATION = 0
+RESERVE_LIQUIDITY_INDEX = 1
+RESERVE_A_TOKEN = 8
+RESERVE_STABLE_DEBT_TOKEN = 9
+RESERVE_VARIABLE_DEBT_TOKEN = 10
+RESERVE_ACCRUED_TO_TREASURY = 12
+
+
+# リザーブ設定のビットマップを読み取るメソッド
+def decode_configuration(data: int) -> Dict[str, Any]:
+    """
+    Decode the ReserveConfigurationMap of getReserveData.
+
+    Args:
+        data (int): The configuration bitmap
+
+    Returns:
+        Dict[str, Any]: Flags as bool, ltv / thresholds / reserve factor as percentages, caps in whole tokens
+        (0 means no cap)
+    """
+    configuration: Dict[str, Any] = {}
+    for name, (offset, size) in CONFIGURATION_BITS.items():
+        value = (data >> offset) & ((1 << size) - 1)
+        if name in FLAG_FIELDS:
+            value = bool(value)
+        elif name in BASIS_POINT_FIELDS:
+            value = value / 100
+        configuration[name] = value
+    return configuration
+
+
+class ReserveIndex:
+    """
+    Per block snapshot of every reserve of the Aave pool with O(1) lookup by symbol or address.
+
+    Each reserve is a dict with symbol, name, address, decimals, aToken / debt token addresses, the decoded
+    configuration, and total_supplied / total_debt / available_liquidity in human-readable units.
+    """
+
+    def __init__(self, web3: Web3, pool_address: str):
+        self.web3 = web3
+        self.pool_address = pool_address
+        self.block: Optional[int] = None
+        # Asset address -> static data (token addresses, symbol, decimals), read once per reserve
+        self._static: Dict[str, Dict[str, Any]] = {}
+        self._by_address: Dict[str, Dict[str, Any]] = {}
+        self._by_symbol: Dict[str, Dict[str, Any]] = {}
+        self._refresh_lock = threading.Lock()
+
+    def _pool(self):
+        return get_contract_cache().get(self.pool_address, aave_lending_pool_abi)
+
+    # 新しいリザーブの変わらない情報（トークンアドレス・シンボル・桁数）を読み込むメソッド
+    def _load_static(self, asset_addresses: List[str]) -> None:
+        batch = ReadBatch(self.web3)
+        for address in asset_addresses:
+            batch.add_call(self._pool().functions.getReserveData(address))
+        token_registry = get_token_registry()
+        for address, reserve_data in zip(asset_addresses, batch.execute()):
+            metadata = token_registry.get(address)
+            self._static[address] = {
+                'symbol': metadata['symbol'] or address,
+                'name': metadata['name'],
+                'address': address,
+                'decimals': metadata['decimals'],
+                'a_token': reserve_data[RESERVE_A_TOKEN],
+                # Reserves listed after stable debt was deprecated (Aave v3.2) return address(0), kept as None
+                'stable_debt_token': (None if int(reserve_data[RESERVE_STABLE_DEBT_TOKEN], 16) == 0
+                                      else reserve_data[RESERVE_STABLE_DEBT_TOKEN]),
+                'variable_debt_token': reserve_data[RESERVE_VARIABLE_DEBT_TOKEN],
+            }
+        logger.info("Indexed %s new reserve(s)", len(asset_addresses))
+
+    # 1つのリザーブの変化する情報を読み込む呼び出しをバッチに追加し、その件数（4〜5件）を返すメソッド
+    def _add_dynamic_reads(self, batch: ReadBatch, static: Dict[str, Any]) -> int:
+        contracts = get_contract_cache()
+        batch.add_call(self._pool().functions.getReserveData(static['address']))
+        batch.add_call(contracts.get(static['a_token'], erc20_abi).functions.totalSupply())
+        batch.add_call(contracts.get(static['variable_debt_token'], erc20_abi).functions.totalSupply())
+        batch.add_call(contracts.get(static['address'], erc20_abi).functions.balanceOf(static['a_token']))
+        if static['stable_debt_token'] is None:
+            # A call to address(0) succeeds with empty return data, which can not be decoded
+            return 4
+        batch.add_call(contracts.get(static['stable_debt_token'], erc20_abi).functions.totalSupply())
+        return 5
+
+    @staticmethod
+    def _build_reserve(static: Dict[str, Any], reads: List[Any]) -> Dict[str, Any]:
+        reserve_data, a_supply, variable_debt, liquidity, *stable = reads
+        stable_debt = stable[0] if static['stable_debt_token'] is not None else 0
+        scale = 10 ** static['decimals']
+        # Supply cap check of ValidationLogic: aToken supply plus the treasury's share not minted yet
+        treasury = reserve_data[RESERVE_ACCRUED_TO_TREASURY] * reserve_data[RESERVE_LIQUIDITY_INDEX] // RAY
+        return {
+            **static,
+            **decode_configuration(reserve_data[RESERVE_CONFIGURATION][0]),
+            'total_supplied': (a_supply + treasury) / scale,
+            'total_debt': (variable_debt + stable_debt) / scale,
+            'available_liquidity': liquidity / scale,
+        }
+
+    # バッチの結果をリザーブごとに分けるメソッド
+    @staticmethod
+    def _split_reads(statics: List[Dict[str, Any]], counts: List[int], results: List[Any]) -> Dict[str, List[Any]]:
+        reads, offset = {}, 0
+        for static, count in zip(statics, counts):
+            reads[static['address']] = results[offset:offset + count]
+            offset += count
+        return reads
+
+    # ブロックが進んでいればリザーブの情報を読み直すメソッド
+    def refresh(self, force: bool = False) -> None:
+        """
+        Re-read the reserves if the chain moved since the last refresh.
+
+        One multicall reads getReservesList and the changing data of every known reserve. Reserves listed since the
+        last refresh are read in two more round trips, removed ones are dropped.
+
+        Args:
+            force (bool): Refresh even if the head block did not change
+        """
+        head = get_rpc_pool().call_cache.head()
+        with self._refresh_lock:
+            if not force and self.block is not None and head is not None and head <= self.block:
+                return
+            known = list(self._static.values())
+            batch = ReadBatch(self.web3)
+            batch.add_call(self._pool().functions.getReservesList())
+            counts = [self._add_dynamic_reads(batch, static) for static in known]
+            results = batch.execute()
+            listed = [Web3.to_checksum_address(address) for address in results[0]]
+            reads = self._split_reads(known, counts, results[1:])
+
+            new = [address for address in listed if address not in self._static]
+            if new:
+                self._load_static(new)
+                new_static = [self._static[address] for address in new]
+                batch = ReadBatch(self.web3)
+                counts = [self._add_dynamic_reads(batch, static) for static in new_static]
+                reads.update(self._split_reads(new_static, counts, batch.execute()))
+
+            by_address, by_symbol = {}, {}
+            for address in listed:
+                reserve = self._build_reserve(self._static[address], reads[address])
+                by_address[address.lower()] = reserve
+                by_symbol.setdefault(reserve['symbol'].upper(), reserve)
+            # Readers see either the old or the new snapshot, never a half built one
+            self._by_address, self._by_symbol, self.block = by_address, by_symbol, head
+
+    def reserves(self, fresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Every reserve of the pool in getReservesList order.
+
+        Args:
+            fresh (bool): Refresh first if the chain moved, otherwise only the first call reads the chain
+        """
+        if fresh or self.block is None:
+            self.refresh()
+        return list(self._by_address.values())
+
+    def get(self, symbol_or_address: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look a reserve up by token symbol (case-insensitive) or underlying token address.
+
+        Returns:
+            Optional[Dict[str, Any]]: The reserve, None if the pool has no such reserve
+        """
+        if fresh or self.block is None:
+            self.refresh()
+        key = symbol_or_address.lower() if symbol_or_address.startswith('0x') else symbol_or_address.upper()
+        return self._by_address.get(key) if key.startswith('0x') else self._by_symbol.get(key)
+
+    @staticmethod
+    def _state_problem(reserve: Dict[str, Any], action: str) -> Optional[str]:
+        if not reserve['active']:
+            return f"the {reserve['symbol']} reserve is not active, {action} is not possible"
+        if reserve['paused']:
+            return f"the {reserve['symbol']} reserve is paused, {action} is not possible"
+        if reserve['frozen']:
+            return f"the {reserve['symbol']} reserve is frozen, {action} is disabled"
+        return None
+
+    # 貸し出しがリバートするかを送信前に確認するメソッド
+    def check_supply(self, asset_address: str, amount: float) -> Optional[str]:
+        """
+        Check a supply against the current reserve state.
+
+        Returns:
+            Optional[str]: Why Aave would revert the supply, None if it passes the reserve checks
+        """
+        reserve = self.get(asset_address, fresh=True)
+        if reserve is None:
+            return f"{asset_address} is not a reserve of the Aave pool"
+        problem = self._state_problem(reserve, "supplying")
+        if problem:
+            return problem
+        cap = reserve['supply_cap']
+        if cap and reserve['total_supplied'] + amount > cap:
+            room = max(cap - reserve['total_supplied'], 0)
+            return f"supplying {amount} {reserve['symbol']} exceeds the supply cap of {cap} (room left: {room:.6f})"
+        return None
+
+    # 借り入れがリバートするかを送信前に確認するメソッド
+    def check_borrow(self, asset_address: str, amount: float, interest_rate_mode: int = 2) -> Optional[str]:
+        """
+        Check a borrow against the current reserve state (the account's collateral is checked by the tool).
+
+        Returns:
+            Optional[str]: Why Aave would revert the borrow, None if it passes the reserve checks
+        """
+        reserve = self.get(asset_address, fresh=True)
+        if reserve is None:
+            return f"{asset_address} is not a reserve of the Aave pool"
+        problem = self._state_problem(reserve, "borrowing")
+        if problem:
+            return problem
+        if not reserve['borrowing_enabled']:
+            return f"borrowing is not enabled for {reserve['symbol']}"
+        if interest_rate_mode == 1 and not reserve['stable_borrowing_enabled']:
+            return f"stable rate borrowing is not enabled for {reserve['symbol']}, use the variable rate (2)"
+        cap = reserve['borrow_cap']
+        if cap and reserve['total_debt'] + amount > cap:
+            room = max(cap - reserve['total_debt'], 0)
+            return f"borrowing {amount} {reserve['symbol']} exceeds the borrow cap of {cap} (room left: {room:.6f})"
+        if amount > reserve['available_liquidity']:
+            return f"only {reserve['available_liquidity']:.6f} {reserve['symbol']} is available to borrow"
+        return None
+
+    def describe(self) -> Iterable[str]:
+        """One line per reserve for the system prompt: symbol, name, address and why it can not be used, if so."""
+        for reserve in self.reserves():
+            notes = [state for state in ('frozen', 'paused') if reserve[state]]
+            if not reserve['borrowing_enabled']:
+                notes.append('borrowing disabled')
+            suffix = f" [{', '.join(notes)}]" if notes else ""
+            yield f"- {reserve['symbol']} ({reserve['name']}): {reserve['address']}{suffix}"
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_reserve_index: Optional[ReserveIndex] = None
+_reserve_index_lock = threading.Lock()
+
+
+# 共有のリザーブインデックスを取得するメソッド
+def get_reserve_index(pool_address: str) -> ReserveIndex:
+    """
+    Get the process-wide reserve index of the Aave pool.
+
+    Args:
+        pool_address (str): The Aave pool address
+
+    Returns:
+        ReserveIndex: The shared index, the reserves are read on first use
+    """
+    global _reserve_index
+    if _reserve_index is None:
+        with _reserve_index_lock:
+            if _reserve_index is None:
+                _reserve_index = ReserveIndex(get_web3(), pool_address)
+    return _reserve_index
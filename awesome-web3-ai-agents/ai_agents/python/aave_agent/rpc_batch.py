@@ -0,0 +1,246 @@
+"""
+RPC Batch
+-------------------
+What:
+1回のツール呼び出しで必要になる独立した読み取り処理を、1回のJSON-RPCバッチリクエストにまとめます。
+複数のコントラクト読み取りは、チェーンが対応していればMulticall3の aggregate3 による1回の eth_call にまとめます。
+
+This script lets a tool queue up all of its independent reads (contract view calls, nonce, gas price, ...) and send
+them to the node in a single HTTP round trip. When several contract reads are queued and the chain has Multicall3
+deployed, they are folded into one aggregate3 eth_call that travels inside the same JSON-RPC batch.
+
+Environment:
+    MULTICALL3_ADDRESS: Address of the Multicall3 contract (defaults to the canonical cross-chain deployment)
+
+Classes:
+    ReadBatch
+"""
+
+import logging
+# Built in python imports
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+from eth_utils import get_abi_output_types
+# Web3 Interactions
+from web3 import Web3
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.contract.contract import Contract, ContractFunction
+from web3.exceptions import ContractLogicError
+
+logger = logging.getLogger(__name__)
+
+"""
+Initial Setup -> GLOBAL VARIABLES
+"""
+# Multicall3 is deployed at the same address on Sepolia, mainnet and most other EVM chains
+multicall3_address = Web3.to_checksum_address(
+    os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+)
+
+# Minimal Multicall3 ABI - only aggregate3 is needed
+multicall3_abi = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ],
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ],
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# Web3インスタンスごとにMulticall3が使えるかどうかと、Multicall3のコントラクトオブジェクトをキャッシュする
+_multicall_support: Dict[int, bool] = {}
+_multicall_support_lock = threading.Lock()
+_multicall_contracts: Dict[int, Contract] = {}
+
+
+# チェーンにMulticall3がデプロイされているかを確認するメソッド
+def supports_multicall(web3: Web3) -> bool:
+    """
+    Check once per Web3 instance whether Multicall3 is deployed on the connected chain.
+
+    Args:
+        web3 (Web3): The Web3 instance to check
+
+    Returns:
+        bool: True if the Multicall3 contract has code on chain
+    """
+    key = id(web3)
+    if key not in _multicall_support:
+        with _multicall_support_lock:
+            if key not in _multicall_support:
+                try:
+                    _multicall_support[key] = len(web3.eth.get_code(multicall3_address)) > 0
+                except Exception as e:
+                    logger.warning("Could not check for Multicall3, falling back to plain batching: %s", e)
+                    return False
+                logger.info("Multicall3 available: %s", _multicall_support[key])
+    return _multicall_support[key]
+
+
+# Multicall3のコントラクトオブジェクトを取得するメソッド
+def _multicall_contract(web3: Web3) -> Contract:
+    key = id(web3)
+    if key not in _multicall_contracts:
+        _multicall_contracts[key] = web3.eth.contract(address=multicall3_address, abi=multicall3_abi)
+    return _multicall_contracts[key]
+
+
+# コントラクト関数の戻り値をデコードするメソッド
+def decode_return_data(web3: Web3, contract_function: ContractFunction, return_data: bytes) -> Any:
+    """
+    Decode raw eth_call return data the same way ContractFunction.call() does.
+
+    Args:
+        web3 (Web3): Web3 instance providing the ABI codec
+        contract_function (ContractFunction): The bound contract function that produced the data
+        return_data (bytes): Raw return data
+
+    Returns:
+        Any: A single value for single-output functions, otherwise a list of values
+    """
+    output_types = get_abi_output_types(contract_function.abi)
+    decoded = web3.codec.decode(output_types, return_data)
+    normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+    if len(normalized) == 1:
+        return normalized[0]
+    return list(normalized)
+
+
+class ReadBatch:
+    """
+    Collects the independent reads of one tool invocation and executes them in a single round trip.
+
+    Usage:
+        batch = ReadBatch(web3)
+        batch.add_call(token_contract.functions.decimals())
+        batch.add_call(token_contract.functions.balanceOf(user_address))
+        batch.add_rpc("get_transaction_count", user_address)
+        batch.add_rpc("gas_price")
+        decimals, balance, nonce, gas_price = batch.execute()
+
+    Results come back in the order the reads were added. If the node rejects JSON-RPC batches, the reads are
+    executed one by one so callers never have to care which path was taken.
+    """
+
+    def __init__(self, web3: Web3, use_multicall: bool = True):
+        self.web3 = web3
+        self.use_multicall = use_multicall
+        # Each entry is ("call", ContractFunction) or ("rpc", (eth attribute name, args))
+        self._reads: List[Tuple[str, Any]] = []
+
+    def add_call(self, contract_function: ContractFunction) -> None:
+        """Queue a contract view call, e.g. token_contract.functions.decimals()."""
+        self._reads.append(("call", contract_function))
+
+    def add_rpc(self, name: str, *args: Any) -> None:
+        """Queue a web3.eth method or property by name, e.g. add_rpc("get_transaction_count", address)."""
+        self._reads.append(("rpc", (name, args)))
+
+    def __len__(self) -> int:
+        return len(self._reads)
+
+    # バッチモード中にweb3.ethのメソッド・プロパティを呼び出してリクエスト情報を取得するメソッド
+    def _rpc_request(self, name: str, args: Tuple[Any, ...]) -> Any:
+        attribute = getattr(self.web3.eth, name)
+        # Properties such as gas_price already return the batched request when accessed
+        return attribute(*args) if callable(attribute) else attribute
+
+    def execute(self, return_exceptions: bool = False) -> List[Any]:
+        """
+        Send every queued read and return the results in the order they were added.
+
+        Args:
+            return_exceptions (bool): Put the exception of a failed read in its place instead of raising. A JSON-RPC
+                batch fails as a whole, so the reads are then retried one by one to keep the results that succeed.
+
+        Returns:
+            List[Any]: One decoded result (or exception, with return_exceptions) per queued read
+
+        Raises:
+            ContractLogicError: If one of the contract calls reverts
+        """
+        if not self._reads:
+            return []
+        calls = [(index, read) for index, (kind, read) in enumerate(self._reads) if kind == "call"]
+        aggregate = self.use_multicall and len(calls) > 1 and supports_multicall(self.web3)
+
+        try:
+            return self._execute_batch(calls, aggregate)
+        except ContractLogicError:
+            if not return_exceptions:
+                raise
+            return self._execute_sequential(return_exceptions)
+        except Exception as e:
+            # Some public RPCs do not accept JSON-RPC batches, keep the tool working with sequential reads
+            logger.warning("Batched read failed, falling back to sequential reads: %s", e)
+            return self._execute_sequential(return_exceptions)
+
+    # 1回のJSON-RPCバッチで全ての読み取りを実行するメソッド
+    def _execute_batch(self, calls: List[Tuple[int, ContractFunction]], aggregate: bool) -> List[Any]:
+        results: List[Any] = [None] * len(self._reads)
+        with self.web3.batch_requests() as batch:
+            if aggregate:
+                multicall = _multicall_contract(self.web3)
+                batch.add(multicall.functions.aggregate3([
+                    (contract_function.address, True, contract_function._encode_transaction_data())
+                    for _, contract_function in calls
+                ]))
+            rpc_indexes = []
+            for index, (kind, read) in enumerate(self._reads):
+                if kind == "call" and not aggregate:
+                    batch.add(read)
+                    rpc_indexes.append(index)
+                elif kind == "rpc":
+                    batch.add(self._rpc_request(*read))
+                    rpc_indexes.append(index)
+            responses = batch.execute()
+
+        if aggregate:
+            aggregated, responses = responses[0], responses[1:]
+            for (index, contract_function), (success, return_data) in zip(calls, aggregated):
+                if not success:
+                    raise ContractLogicError(f"Multicall read {contract_function.fn_name} reverted")
+                results[index] = decode_return_data(self.web3, contract_function, return_data)
+        for index, response in zip(rpc_indexes, responses):
+            results[index] = response
+        return results
+
+    # 1件ずつ読み取りを実行するメソッド（バッチ非対応のRPC向け）
+    def _execute_sequential(self, return_exceptions: bool = False) -> List[Any]:
+        results = []
+        for kind, read in self._reads:
+            try:
+                if kind == "call":
+                    results.append(read.call())
+                else:
+                    name, args = read
+                    attribute = getattr(self.web3.eth, name)
+                    results.append(attribute(*args) if callable(attribute) else attribute)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
@@ -0,0 +1,431 @@
+"""
+RPC Pool
+-------------------
+What:
+全てのツールで共有するWeb3インスタンスと、キープアライブ付きのRPCプロバイダープールを提供します。
+複数のRPCエンドポイントを登録でき、ノードが落ちた場合は次の正常なエンドポイントへフェイルオーバーします。
+
+This script owns the single Web3 connection that every tool shares. Each endpoint listed in RPC_URL gets its own
+pooled requests.Session (HTTP keep-alive, bounded number of connections), and requests fail over to the next
+healthy endpoint whenever a node can not be reached. eth_call reads go through a block-aware read cache (see
+call_cache.py), a repeated read within the same block does not reach any endpoint.
+
+Environment:
+    RPC_URL: One or more RPC endpoints separated by commas, tried in the given order
+    RPC_POOL_SIZE: Maximum number of concurrent HTTP connections per endpoint (default 10)
+    RPC_TIMEOUT: Request timeout in seconds (default 30)
+    RPC_FAILURE_COOLDOWN: Seconds an endpoint is skipped after a failure (default 30)
+    CALL_CACHE_SIZE: Maximum number of cached eth_call results, 0 disables the cache (default 1024)
+    CALL_CACHE_MAX_CALLDATA: Calls with more calldata bytes than this skip the read cache (default 8192)
+    HEAD_POLL_INTERVAL: Seconds between head block polls of the read cache (default 4)
+
+Functions:
+    get_web3
+    get_async_web3
+    get_rpc_pool
+"""
+
+import asyncio
+import logging
+# Built in python imports
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import requests
+# Block-aware eth_call cache
+from call_cache import DEFAULT_CACHE_SIZE, DEFAULT_HEAD_POLL_INTERVAL, DEFAULT_MAX_CALLDATA, CallCache
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+# Spans around every RPC request
+from agent_common.tracing import get_tracer
+# Web3 Interactions
+from web3 import AsyncWeb3, Web3
+from web3.providers import AsyncHTTPProvider, HTTPProvider, JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+logger = logging.getLogger(__name__)
+
+# Loading the environmental variables before the pool reads its configuration
+load_dotenv()
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_FAILURE_COOLDOWN = 30
+# 連続失敗時のクールダウンの最大倍率
+MAX_COOLDOWN_MULTIPLIER = 8
+# Answers that never change for the configured chain. web3's validation middleware asks for eth_chainId before
+# every eth_call, without this a cached read would still cost a round trip.
+# 変わることのないリクエスト（最初の応答を使い回す）
+CONSTANT_METHODS = ("eth_chainId", "net_version")
+
+
+# キープアライブ付きのHTTPセッションを作成するメソッド
+def _build_session(pool_size: int) -> requests.Session:
+    """
+    Create a requests.Session that keeps connections alive and caps how many are open at once.
+
+    Args:
+        pool_size (int): Maximum number of connections kept to the endpoint
+
+    Returns:
+        requests.Session: Session with a bounded, blocking connection pool mounted for http and https
+    """
+    session = requests.Session()
+    # pool_block=True makes extra threads wait for a free connection instead of opening new ones
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+class RpcEndpoint:
+    """
+    A single RPC endpoint together with its health state.
+
+    Attributes:
+        url (str): The endpoint URL
+        provider (HTTPProvider): Provider bound to the endpoint's pooled session
+        failures (int): Number of consecutive transport failures
+        unhealthy_until (float): Monotonic time until which the endpoint is skipped
+        latency (Optional[float]): Moving average of the request latency in seconds
+    """
+
+    def __init__(self, url: str, pool_size: int, timeout: float):
+        self.url = url
+        # Retries are disabled on purpose, failing over to another endpoint is faster than retrying a dead one
+        self.provider = HTTPProvider(
+            url,
+            request_kwargs={"timeout": timeout},
+            session=_build_session(pool_size),
+            exception_retry_configuration=None,
+        )
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.latency: Optional[float] = None
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def record_success(self, elapsed: float) -> None:
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    def record_failure(self, cooldown: float) -> None:
+        self.failures += 1
+        multiplier = min(2 ** (self.failures - 1), MAX_COOLDOWN_MULTIPLIER)
+        self.unhealthy_until = time.monotonic() + cooldown * multiplier
+
+
+# バッチで取得したレシートをキャッシュに反映するメソッド
+def observe_receipts(call_cache: CallCache, batch_requests: List[Tuple[RPCEndpoint, Any]], responses: Any) -> None:
+    if not isinstance(responses, list):
+        return
+    for (method, _), response in zip(batch_requests, responses):
+        if method == "eth_getTransactionReceipt" and isinstance(response, dict):
+            call_cache.observe_receipt(response.get("result"))
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """
+    Web3 provider that spreads requests over several RPC endpoints with keep-alive sessions.
+
+    Requests go to the first healthy endpoint in the configured order. Transport errors (connection refused,
+    timeouts, HTTP 5xx/429) mark the endpoint unhealthy for a cooldown period and the request is retried on the
+    next endpoint. JSON-RPC errors returned by a node are passed through unchanged, they are not a health problem.
+
+    eth_call requests are answered from call_cache when the same call was made in the current block, and the
+    receipts of mined transactions invalidate the cached reads they affect.
+    """
+
+    def __init__(
+        self,
+        endpoint_uris: List[str],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        failure_cooldown: float = DEFAULT_FAILURE_COOLDOWN,
+        call_cache_size: int = DEFAULT_CACHE_SIZE,
+        head_poll_interval: float = DEFAULT_HEAD_POLL_INTERVAL,
+        call_cache_max_calldata: int = DEFAULT_MAX_CALLDATA,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        if not endpoint_uris:
+            raise ValueError("At least one RPC endpoint is required")
+        self.endpoints = [RpcEndpoint(url, pool_size, timeout) for url in endpoint_uris]
+        self.failure_cooldown = failure_cooldown
+        self._lock = threading.Lock()
+        self.call_cache = CallCache(
+            self._fetch_head,
+            max_entries=call_cache_size,
+            head_poll_interval=head_poll_interval,
+            max_calldata=call_cache_max_calldata,
+        )
+        self.constants: Dict[str, RPCResponse] = {}
+
+    def __str__(self) -> str:
+        return f"Pooled RPC connection {', '.join(endpoint.url for endpoint in self.endpoints)}"
+
+    @property
+    def endpoint_uri(self) -> str:
+        """The endpoint that the next request will be sent to."""
+        return self._ordered_endpoints()[0].url
+
+    # 正常なエンドポイントを優先した順番でエンドポイントを返すメソッド
+    def _ordered_endpoints(self) -> List[RpcEndpoint]:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [endpoint for endpoint in self.endpoints if endpoint.is_healthy(now)]
+            # Endpoints in cooldown are still tried last, soonest recovery first, so that a full outage is retried
+            cooling = sorted(
+                (endpoint for endpoint in self.endpoints if not endpoint.is_healthy(now)),
+                key=lambda endpoint: endpoint.unhealthy_until,
+            )
+        return healthy + cooling
+
+    # フェイルオーバーしながらリクエストを送信するメソッド
+    def _dispatch(self, description: str, call):
+        last_error: Optional[Exception] = None
+        with get_tracer().span(f"rpc.{description}") as span:
+            for attempt, endpoint in enumerate(self._ordered_endpoints(), start=1):
+                start = time.monotonic()
+                try:
+                    result = call(endpoint.provider)
+                except requests.RequestException as e:
+                    with self._lock:
+                        endpoint.record_failure(self.failure_cooldown)
+                    logger.warning("RPC endpoint %s failed on %s: %s", endpoint.url, description, e)
+                    last_error = e
+                    continue
+                with self._lock:
+                    endpoint.record_success(time.monotonic() - start)
+                span.set_attribute("endpoint", endpoint.url)
+                span.set_attribute("attempts", attempt)
+                return result
+            raise last_error
+
+    def _fetch_head(self) -> int:
+        response = self._dispatch("eth_blockNumber", lambda provider: provider.make_request("eth_blockNumber", []))
+        return int(response["result"], 16)
+
+    # キャッシュを使ってeth_callを送信するメソッド
+    def _cached_call(self, params: Any) -> RPCResponse:
+        block = self.call_cache.pin_block(params)
+        if block is None:
+            return self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", params))
+        response = self.call_cache.get(params, block)
+        if response is not None:
+            return response
+        pinned = CallCache.pinned_params(params, block)
+        response = self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", pinned))
+        if CallCache.is_unknown_block(response):
+            # The endpoint lags behind the head we pinned, ask it for its own latest block instead
+            return self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", params))
+        self.call_cache.put(params, block, response)
+        return response
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == "eth_call":
+            return self._cached_call(params)
+        if method in self.constants:
+            return self.constants[method]
+        response = self._dispatch(method, lambda provider: provider.make_request(method, params))
+        if method == "eth_getTransactionReceipt":
+            self.call_cache.observe_receipt(response.get("result"))
+        elif method in CONSTANT_METHODS and "result" in response:
+            self.constants[method] = response
+        return response
+
+    def make_batch_request(self, batch_requests: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        responses = self._dispatch("batch", lambda provider: provider.make_batch_request(batch_requests))
+        observe_receipts(self.call_cache, batch_requests, responses)
+        return responses
+
+    def health(self) -> List[Dict[str, Any]]:
+        """
+        Snapshot of the health of every endpoint, useful for debugging failover.
+
+        Returns:
+            List[Dict[str, Any]]: url, healthy flag, consecutive failures and average latency per endpoint
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.is_healthy(now),
+                    "failures": endpoint.failures,
+                    "latency": endpoint.latency,
+                }
+                for endpoint in self.endpoints
+            ]
+
+
+class PooledAsyncHTTPProvider(AsyncJSONBaseProvider):
+    """
+    AsyncWeb3 counterpart of PooledHTTPProvider.
+
+    It shares the endpoint list and health state of a PooledHTTPProvider, so an endpoint that failed for the
+    sync tools is skipped by the async tools as well (and vice versa). Each endpoint gets an AsyncHTTPProvider,
+    which keeps one aiohttp session per thread and event loop.
+    """
+
+    def __init__(self, pool: PooledHTTPProvider, timeout: float = DEFAULT_TIMEOUT, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.pool = pool
+        self._providers: Dict[str, AsyncHTTPProvider] = {
+            endpoint.url: AsyncHTTPProvider(
+                endpoint.url,
+                request_kwargs={"timeout": aiohttp.ClientTimeout(total=timeout)},
+                exception_retry_configuration=None,
+            )
+            for endpoint in pool.endpoints
+        }
+
+    def __str__(self) -> str:
+        return f"Async pooled RPC connection {', '.join(self._providers)}"
+
+    @property
+    def endpoint_uri(self) -> str:
+        """The endpoint that the next request will be sent to."""
+        return self.pool.endpoint_uri
+
+    # フェイルオーバーしながら非同期でリクエストを送信するメソッド
+    async def _dispatch(self, description: str, call):
+        last_error: Optional[Exception] = None
+        with get_tracer().span(f"rpc.{description}", transport="async") as span:
+            for attempt, endpoint in enumerate(self.pool._ordered_endpoints(), start=1):
+                start = time.monotonic()
+                try:
+                    result = await call(self._providers[endpoint.url])
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    with self.pool._lock:
+                        endpoint.record_failure(self.pool.failure_cooldown)
+                    logger.warning("RPC endpoint %s failed on %s: %s", endpoint.url, description, e)
+                    last_error = e
+                    continue
+                with self.pool._lock:
+                    endpoint.record_success(time.monotonic() - start)
+                span.set_attribute("endpoint", endpoint.url)
+                span.set_attribute("attempts", attempt)
+                return result
+            raise last_error
+
+    # キャッシュを使ってeth_callを送信するメソッド（同期版とキャッシュを共有する）
+    async def _cached_call(self, params: Any) -> RPCResponse:
+        call_cache = self.pool.call_cache
+        # Never block the event loop on a head fetch, a stale head sends the call uncached while the poller catches up
+        block = call_cache.pin_block(params, fetch=False)
+        if block is None:
+            return await self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", params))
+        response = call_cache.get(params, block)
+        if response is not None:
+            return response
+        pinned = CallCache.pinned_params(params, block)
+        response = await self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", pinned))
+        if CallCache.is_unknown_block(response):
+            return await self._dispatch("eth_call", lambda provider: provider.make_request("eth_call", params))
+        call_cache.put(params, block, response)
+        return response
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == "eth_call":
+            return await self._cached_call(params)
+        if method in self.pool.constants:
+            return self.pool.constants[method]
+        response = await self._dispatch(method, lambda provider: provider.make_request(method, params))
+        if method == "eth_getTransactionReceipt":
+            self.pool.call_cache.observe_receipt(response.get("result"))
+        elif method in CONSTANT_METHODS and "result" in response:
+            self.pool.constants[method] = response
+        return response
+
+    async def make_batch_request(self, batch_requests: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        responses = await self._dispatch("batch", lambda provider: provider.make_batch_request(batch_requests))
+        observe_receipts(self.pool.call_cache, batch_requests, responses)
+        return responses
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        for endpoint in self.pool._ordered_endpoints():
+            if await self._providers[endpoint.url].is_connected(show_traceback):
+                return True
+        return False
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_web3: Optional[Web3] = None
+_web3_lock = threading.Lock()
+_async_web3: Optional[AsyncWeb3] = None
+_async_web3_lock = threading.Lock()
+
+
+# 環境変数からRPCエンドポイントの一覧を読み込むメソッド
+def _endpoint_uris_from_env() -> List[str]:
+    return [url.strip() for url in os.getenv("RPC_URL", "").split(",") if url.strip()]
+
+
+# 共有のWeb3インスタンスを取得するメソッド
+def get_web3() -> Web3:
+    """
+    Get the process-wide Web3 instance backed by the pooled provider.
+
+    The instance is created on first use from the environment and then shared by every tool and chat session.
+
+    Returns:
+        Web3: The shared Web3 instance
+    """
+    global _web3
+    if _web3 is None:
+        with _web3_lock:
+            if _web3 is None:
+                provider = PooledHTTPProvider(
+                    _endpoint_uris_from_env(),
+                    pool_size=int(os.getenv("RPC_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                    timeout=float(os.getenv("RPC_TIMEOUT", DEFAULT_TIMEOUT)),
+                    failure_cooldown=float(os.getenv("RPC_FAILURE_COOLDOWN", DEFAULT_FAILURE_COOLDOWN)),
+                    call_cache_size=int(os.getenv("CALL_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+                    head_poll_interval=float(os.getenv("HEAD_POLL_INTERVAL", DEFAULT_HEAD_POLL_INTERVAL)),
+                    call_cache_max_calldata=int(os.getenv("CALL_CACHE_MAX_CALLDATA", DEFAULT_MAX_CALLDATA)),
+                )
+                logger.info("Initialized RPC pool with %s endpoint(s)", len(provider.endpoints))
+                _web3 = Web3(provider)
+    return _web3
+
+
+# 非同期ツール用の共有AsyncWeb3インスタンスを取得するメソッド
+def get_async_web3() -> AsyncWeb3:
+    """
+    Get the process-wide AsyncWeb3 instance used by the async tools.
+
+    It sends requests over aiohttp but shares the endpoints and their health state with get_web3().
+
+    Returns:
+        AsyncWeb3: The shared AsyncWeb3 instance
+    """
+    global _async_web3
+    if _async_web3 is None:
+        with _async_web3_lock:
+            if _async_web3 is None:
+                _async_web3 = AsyncWeb3(PooledAsyncHTTPProvider(
+                    get_rpc_pool(),
+                    timeout=float(os.getenv("RPC_TIMEOUT", DEFAULT_TIMEOUT)),
+                ))
+    return _async_web3
+
+
+# 共有のプロバイダープールを取得するメソッド
+def get_rpc_pool() -> PooledHTTPProvider:
+    """
+    Get the pooled provider behind the shared Web3 instance.
+
+    Returns:
+        PooledHTTPProvider: The shared provider
+    """
+    return get_web3().provider
@@ -0,0 +1,351 @@
+"""
+Simulation
+-------------------
+What:
+署名する前にトランザクションを eth_call / eth_estimateGas でシミュレーションし、リバートする場合は理由を
+読みやすい形に変換して送信を中止します。approve → supply のように前のトランザクションに依存する場合は、
+state override で承認後のallowanceを設定してシミュレーションします。
+
+lend_crypto and borrow_crypto used to find out about a revert from the receipt, a block and the gas of a failed
+transaction later. This script runs the built transaction first and turns the revert data into a reason:
+Aave's numeric error codes ("26", "35", ... raised as Error(string)) and the custom errors of newer pool versions
+become the error name and a short explanation, Panic codes and the OpenZeppelin ERC20 errors are named too.
+
+A supply that follows an approval sent in the same tool call can not be run as is (the allowance does not exist
+yet). Its eth_estimateGas gets a state override that writes the approved amount into the token's allowance
+mapping. The storage slot of the mapping is found once per token by probing the usual layouts (Solidity and
+Vyper mappings in the first slots) in one batched request; the estimate also replaces the fixed fallback gas limit
+of such a supply.
+
+Only a node answering with an error aborts the send. When the simulation itself can not run (connection error),
+the tool goes on as before and the failure is logged.
+
+Environment:
+    PREFLIGHT_SIMULATION: "false" skips the simulation (default "true")
+
+Functions:
+    get_simulator
+"""
+
+import logging
+# Built in python imports
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from eth_abi import decode
+from rpc_pool import get_web3
+# Web3 Interactions
+from web3 import Web3
+from web3.exceptions import ContractLogicError, Web3RPCError
+
+logger = logging.getLogger(__name__)
+
+simulation_enabled = os.getenv("PREFLIGHT_SIMULATION", "true").lower() != "false"
+
+# トランザクションのうちシミュレーションに渡すフィールド（ナンスは送信前の値なので渡さない）
+CALL_FIELDS = ('from', 'to', 'data', 'value', 'gas', 'maxFeePerGas', 'maxPriorityFeePerGas')
+ESTIMATE_FIELDS = ('from', 'to', 'data', 'value')
+
+ERROR_STRING_SELECTOR = bytes.fromhex('08c379a0')
+PANIC_SELECTOR = bytes.fromhex('4e487b71')
+
+# Aave v3 のエラーコード（Errors.sol）のうち、利用者の操作で発生するもの
+AAVE_ERRORS = {
+    11: ('CALLER_NOT_ATOKEN', "the caller is not the aToken"),
+    24: ('INVALID_MINT_AMOUNT', "the amount is too small to mint aTokens"),
+    25: ('INVALID_BURN_AMOUNT', "the amount is too small to burn aTokens"),
+    26: ('INVALID_AMOUNT', "the amount must be greater than 0"),
+    27: ('RESERVE_INACTIVE', "the reserve is not active"),
+    28: ('RESERVE_FROZEN', "the reserve is frozen"),
+    29: ('RESERVE_PAUSED', "the reserve is paused"),
+    30: ('BORROWING_NOT_ENABLED', "borrowing is not enabled for this reserve"),
+    31: ('STABLE_BORROWING_NOT_ENABLED', "stable rate borrowing is not enabled for this reserve"),
+    32: ('NOT_ENOUGH_AVAILABLE_USER_BALANCE', "the amount is larger than the available balance"),
+    33: ('INVALID_INTEREST_RATE_MODE_SELECTED', "invalid interest rate mode"),
+    34: ('COLLATERAL_BALANCE_IS_ZERO', "no collateral supplied"),
+    35: ('HEALTH_FACTOR_LOWER_THAN_LIQUIDATION_THRESHOLD',
+         "the health factor would fall below the liquidation threshold"),
+    36: ('COLLATERAL_CANNOT_COVER_NEW_BORROW', "not enough collateral to cover the new borrow"),
+    37: ('COLLATERAL_SAME_AS_BORROWING_CURRENCY', "the collateral is the same asset as the borrow"),
+    38: ('AMOUNT_BIGGER_THAN_MAX_LOAN_SIZE_STABLE', "the amount exceeds the maximum stable rate loan size"),
+    39: ('NO_DEBT_OF_SELECTED_TYPE', "there is no debt of the selected interest rate mode"),
+    40: ('NO_EXPLICIT_AMOUNT_TO_REPAY_ON_BEHALF', "repaying on behalf of another account needs an explicit amount"),
+    43: ('UNDERLYING_BALANCE_ZERO', "the supplied balance is zero"),
+    47: ('SPECIFIED_CURRENCY_NOT_BORROWED_BY_USER', "the account has not borrowed this asset"),
+    48: ('SAME_BLOCK_BORROW_REPAY', "borrow and repay can not happen in the same block"),
+    50: ('BORROW_CAP_EXCEEDED', "the reserve's borrow cap would be exceeded"),
+    51: ('SUPPLY_CAP_EXCEEDED', "the reserve's supply cap would be exceeded"),
+    53: ('DEBT_CEILING_EXCEEDED', "the isolation mode debt ceiling would be exceeded"),
+    57: ('LTV_VALIDATION_FAILED', "collateral with an LTV of 0 must be withdrawn first"),
+    58: ('INCONSISTENT_EMODE_CATEGORY', "the asset is not in the account's e-mode category"),
+    59: ('PRICE_ORACLE_SENTINEL_CHECK_FAILED', "borrowing is paused by the price oracle sentinel"),
+    60: ('ASSET_NOT_BORROWABLE_IN_ISOLATION', "the asset can not be borrowed in isolation mode"),
+    62: ('USER_IN_ISOLATION_MODE', "the account is in isolation mode"),
+    78: ('INVALID_EXPIRATION', "the permit deadline has passed"),
+    79: ('INVALID_SIGNATURE', "the permit signature is invalid"),
+    82: ('ASSET_NOT_LISTED', "the asset is not listed in the pool"),
+    89: ('SILOED_BORROWING_VIOLATION', "siloed assets can not be borrowed together with other assets"),
+}
+# Panic(uint256) のコード
+PANIC_REASONS = {
+    0x01: "assertion failed",
+    0x11: "arithmetic overflow or underflow",
+    0x12: "division by zero",
+    0x21: "invalid enum value",
+    0x31: "pop on an empty array",
+    0x32: "array index out of bounds",
+    0x41: "out of memory",
+    0x51: "call to an uninitialized function",
+}
+
+
+# エラー名（SNAKE_CASE）をカスタムエラーの名前（CamelCase）に変換するメソッド
+def _custom_error_name(name: str) -> str:
+    return ''.join(word.capitalize() for word in name.split('_'))
+
+
+def _selector(signature: str) -> bytes:
+    return bytes(Web3.keccak(text=signature)[:4])
+
+
+# Newer pool versions revert with custom errors named after the same constants, e.g. SupplyCapExceeded()
+CUSTOM_ERRORS = {
+    _selector(f"{_custom_error_name(name)}()"): f"{description} ({_custom_error_name(name)})"
+    for name, description in AAVE_ERRORS.values()
+}
+CUSTOM_ERRORS.update({
+    _selector("ERC20InsufficientBalance(address,uint256,uint256)"): "the token balance is too low",
+    _selector("ERC20InsufficientAllowance(address,uint256,uint256)"): "the token allowance is too low",
+})
+
+
+# アドレスや数値を32バイトのワードに変換するメソッド
+def _word(value: Any) -> bytes:
+    return (int(value, 16) if isinstance(value, str) else value).to_bytes(32, 'big')
+
+
+def _to_bytes(data: Any) -> bytes:
+    if isinstance(data, str):
+        return bytes.fromhex(data[2:] if data.startswith('0x') else data) if data else b''
+    return bytes(data or b'')
+
+
+# リバートの理由を読みやすい形に変換するメソッド
+def describe_reason(reason: str) -> str:
+    """Turn an Aave error code ("51") into its explanation, other reasons are returned as they are."""
+    reason = reason.strip()
+    if reason.isdigit() and int(reason) in AAVE_ERRORS:
+        name, description = AAVE_ERRORS[int(reason)]
+        return f"{description} (Aave error {reason} {name})"
+    return reason
+
+
+def decode_revert(data: Any, message: Optional[str] = None) -> str:
+    """
+    Decode revert data into a readable reason.
+
+    Args:
+        data (Any): The revert data (hex string or bytes), as found on ContractLogicError.data
+        message (Optional[str]): The node's error message, used when there is no data
+
+    Returns:
+        str: The reason, e.g. "the reserve's supply cap would be exceeded (Aave error 51 SUPPLY_CAP_EXCEEDED)"
+    """
+    raw = _to_bytes(data) if isinstance(data, (str, bytes, bytearray)) else b''
+    if len(raw) >= 4:
+        selector = raw[:4]
+        if selector == ERROR_STRING_SELECTOR:
+            try:
+                reason, = decode(['string'], raw[4:])
+                return describe_reason(reason)
+            except Exception:
+                return f"execution reverted (undecodable reason 0x{raw.hex()})"
+        if selector == PANIC_SELECTOR:
+            code = int.from_bytes(raw[4:36], 'big')
+            return f"panic 0x{code:02x} ({PANIC_REASONS.get(code, 'unknown')})"
+        if selector in CUSTOM_ERRORS:
+            return CUSTOM_ERRORS[selector]
+        return f"custom error 0x{selector.hex()}"
+    # Some nodes only put the reason in the message ("execution reverted: 26")
+    reason = (message or '').split('execution reverted', 1)[-1].lstrip(': ')
+    return describe_reason(reason) if reason else "execution reverted without a reason"
+
+
+class TransactionSimulator:
+    """
+    Runs built transactions through eth_call / eth_estimateGas before they are signed.
+
+    Usage:
+        reason = simulator.call(supply_tx)                                    # None when it would succeed
+        override = simulator.allowance_override(token, owner, pool, amount)   # None when the slot is unknown
+        gas, reason = simulator.estimate_gas(supply_tx, override)
+    """
+
+    def __init__(self, web3: Web3):
+        self.web3 = web3
+        # (slot, layout) of the allowance mapping per token, None when no usual layout matched
+        self._allowance_slots: Dict[str, Optional[Tuple[int, str]]] = {}
+        self._lock = threading.Lock()
+
+    # ノードが返したエラーから理由を取り出すメソッド（接続エラーなどはNone）
+    @staticmethod
+    def _failure(error: Exception) -> Optional[str]:
+        if isinstance(error, ContractLogicError):
+            return decode_revert(error.data, error.message)
+        if isinstance(error, Web3RPCError):
+            # The node refused the call itself, e.g. "insufficient funds for gas * price + value"
+            rpc_error = (error.rpc_response or {}).get('error') or {}
+            return rpc_error.get('message') if isinstance(rpc_error, dict) and rpc_error.get('message') else error.message
+        logger.warning("Could not simulate the transaction, sending without simulation: %s (%s)", error,
+                       type(error).__name__)
+        return None
+
+    def call(self, tx: Dict[str, Any], state_override: Optional[Dict] = None) -> Optional[str]:
+        """
+        Run the exact built transaction (sender, calldata, value, gas and fees) with eth_call.
+
+        Returns:
+            Optional[str]: The readable revert reason, None when the call succeeds or could not be run
+        """
+        call = {field: tx[field] for field in CALL_FIELDS if field in tx}
+        try:
+            self.web3.eth.call(call, 'latest', state_override)
+        except Exception as e:
+            return self._failure(e)
+        return None
+
+    def estimate_gas(self, tx: Dict[str, Any], state_override: Optional[Dict] = None) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Estimate the gas of a transaction, optionally on top of a state override.
+
+        Returns:
+            Tuple[Optional[int], Optional[str]]: (gas, None) on success, (None, reason) on a revert and (None, None)
+            when the estimate could not be run
+        """
+        estimate = {field: tx[field] for field in ESTIMATE_FIELDS if field in tx}
+        try:
+            return self.web3.eth.estimate_gas(estimate, None, state_override), None
+        except Exception as e:
+            return None, self._failure(e)
+
+    @staticmethod
+    def _allowance_key(owner: str, spender: str, slot: int, layout: str) -> str:
+        # allowance[owner][spender]: Solidity hashes key . slot, Vyper slot . key
+        if layout == 'solidity':
+            key = Web3.keccak(_word(spender) + Web3.keccak(_word(owner) + _word(slot)))
+        else:
+            key = Web3.keccak(Web3.keccak(_word(slot) + _word(owner)) + _word(spender))
+        return '0x' + bytes(key).hex()
+
+    # allowanceのマッピングが保存されているスロットを探すメソッド（トークンごとに1度だけ）
+    def _find_allowance_slot(self, token: str, owner: str, spender: str) -> Optional[Tuple[int, str]]:
+        marker = int('5151' * 16, 16)
+        candidates = [(slot, layout) for slot in range(16) for layout in ('solidity', 'vyper')]
+        calldata = '0x' + (_selector("allowance(address,address)") + _word(owner) + _word(spender)).hex()
+        requests = [
+            ("eth_call", [
+                {'to': token, 'data': calldata},
+                'latest',
+                {token: {'stateDiff': {self._allowance_key(owner, spender, slot, layout): '0x' + _word(marker).hex()}}},
+            ])
+            for slot, layout in candidates
+        ]
+        try:
+            responses = self.web3.provider.make_batch_request(requests)
+        except Exception as e:
+            logger.warning("Batched allowance slot probe failed, probing one by one: %s", e)
+            responses = [self.web3.provider.make_request(method, params) for method, params in requests]
+        if not isinstance(responses, list) or len(responses) != len(requests):
+            # e.g. a single error object for the whole batch, the probe did not run (nothing is cached)
+            raise ValueError(f"Unexpected response to the allowance slot probe: {str(responses)[:200]}")
+        for candidate, response in zip(candidates, responses):
+            result = response.get('result') if isinstance(response, dict) else None
+            if not isinstance(result, str):
+                continue
+            try:
+                # An empty result ('0x') or a malformed one is a miss
+                if int(result, 16) == marker:
+                    return candidate
+            except ValueError:
+                continue
+        return None
+
+    def allowance_override(self, token: str, owner: str, spender: str, amount: int) -> Optional[Dict]:
+        """
+        A state override that sets allowance(owner, spender) of the token to amount.
+
+        Returns:
+            Optional[Dict]: The override for eth_call / eth_estimateGas, None when the token's layout is unknown
+        """
+        token = Web3.to_checksum_address(token)
+        with self._lock:
+            known = token in self._allowance_slots
+            found = self._allowance_slots.get(token)
+        if not known:
+            # Raises when the probe could not run, the token is probed again next time
+            found = self._find_allowance_slot(token, owner, spender)
+            with self._lock:
+                self._allowance_slots[token] = found
+            logger.debug("Allowance slot of %s: %s", token, found)
+        if found is None:
+            return None
+        key = self._allowance_key(owner, spender, *found)
+        return {token: {'stateDiff': {key: '0x' + _word(amount).hex()}}}
+
+    def preflight(self, tx: Dict[str, Any], approve_tx: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Simulate a built transaction, on top of an ERC20 approval sent right before it when approve_tx is given.
+
+        Args:
+            tx (Dict[str, Any]): The built transaction
+            approve_tx (Optional[Dict[str, Any]]): A built approve(spender, amount) the transaction depends on
+
+        Returns:
+            Tuple[Optional[str], Optional[int]]: The reason of the first step that would revert (None when both pass
+            or could not be simulated) and, with an approval, the gas estimate of tx on top of it. Never raises,
+            a simulation that fails for any other reason than a revert returns (None, None).
+        """
+        try:
+            return self._preflight(tx, approve_tx)
+        except Exception as e:
+            logger.warning("Could not simulate the transaction, sending without simulation: %s (%s)", e,
+                           type(e).__name__)
+            return None, None
+
+    def _preflight(self, tx: Dict[str, Any], approve_tx: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[int]]:
+        if approve_tx is None:
+            return self.call(tx), None
+        reason = self.call(approve_tx)
+        if reason:
+            return f"the approval would fail: {reason}", None
+        spender, amount = decode(['address', 'uint256'], _to_bytes(approve_tx['data'])[4:])
+        override = self.allowance_override(approve_tx['to'], approve_tx['from'], spender, amount)
+        if override is None:
+            logger.info("Allowance layout of %s is unknown, the dependent transaction is not simulated", approve_tx['to'])
+            return None, None
+        gas, reason = self.estimate_gas(tx, override)
+        return reason, gas
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_simulator: Optional[TransactionSimulator] = None
+_simulator_lock = threading.Lock()
+
+
+# 共有のシミュレーターを取得するメソッド
+def get_simulator() -> TransactionSimulator:
+    """
+    Get the process-wide transaction simulator bound to the shared Web3 instance.
+
+    Returns:
+        TransactionSimulator: The shared simulator
+    """
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = TransactionSimulator(get_web3())
+    return _simulator
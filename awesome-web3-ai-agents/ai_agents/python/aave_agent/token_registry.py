@@ -0,0 +1,181 @@
+"""
+Token Registry
+-------------------
+What:
+ERC20トークンのメタデータ（decimals・symbol・name）をチェーンIDとアドレスごとに1度だけ取得してキャッシュします。
+キャッシュはメモリ上のLRUとローカルのJSONファイルに保存されるため、再起動後もRPCを呼ばずに利用できます。
+
+Token metadata never changes once a token is deployed, so this script fetches it once per (chainId, address),
+keeps it in an in-memory LRU and persists it to a small JSON file so that restarts start warm.
+
+Environment:
+    TOKEN_METADATA_CACHE: Path of the JSON cache file (default token_metadata_cache.json next to this script)
+    TOKEN_METADATA_CACHE_SIZE: Maximum number of tokens kept in memory (default 256)
+    TOKEN_PRELOAD_ADDRESSES: Comma separated token addresses whose metadata tools.py loads at startup (default none)
+
+Functions:
+    get_token_registry
+"""
+
+import json
+import logging
+# Built in python imports
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from abis import erc20_abi
+from contract_cache import get_contract_cache
+from rpc_batch import ReadBatch
+from rpc_pool import get_web3
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+"""
+Initial Setup -> GLOBAL VARIABLES
+"""
+current_dir = os.path.dirname(os.path.abspath(__file__))
+default_cache_path = os.path.join(current_dir, 'token_metadata_cache.json')
+DEFAULT_CACHE_SIZE = 256
+
+
+class TokenRegistry:
+    """
+    LRU cache of ERC20 metadata keyed by (chainId, checksum address), backed by a JSON file.
+
+    Each entry is a dict with 'decimals', 'symbol' and 'name'. symbol and name are None for tokens that do not
+    implement them as strings.
+    """
+
+    def __init__(self, web3: Web3, cache_path: str = default_cache_path, max_size: int = DEFAULT_CACHE_SIZE):
+        self.web3 = web3
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self._chain_id: Optional[int] = None
+        self._tokens: "OrderedDict[Tuple[int, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def chain_id(self) -> int:
+        # The chain id is read once, it can not change for the lifetime of the connection
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
+
+    # キャッシュファイルを読み込むメソッド
+    def _load(self) -> None:
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r') as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable token metadata cache %s: %s", self.cache_path, e)
+            return
+        for key, metadata in list(entries.items())[-self.max_size:]:
+            chain_id, address = key.split(":", 1)
+            self._tokens[(int(chain_id), address)] = metadata
+        logger.info("Loaded %s token(s) from metadata cache", len(self._tokens))
+
+    # キャッシュファイルに書き込むメソッド（一時ファイル経由で書き換える）
+    def _save(self) -> None:
+        entries = {f"{chain_id}:{address}": metadata for (chain_id, address), metadata in self._tokens.items()}
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(entries, cache_file, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not persist token metadata cache: %s", e)
+
+    # トークンのメタデータをチェーンから取得するメソッド
+    def _fetch(self, address: str) -> Dict:
+        token_contract = get_contract_cache().get(address, erc20_abi)
+        batch = ReadBatch(self.web3)
+        batch.add_call(token_contract.functions.decimals())
+        batch.add_call(token_contract.functions.symbol())
+        batch.add_call(token_contract.functions.name())
+        try:
+            decimals, symbol, name = batch.execute()
+        except Exception as e:
+            # Some older tokens (e.g. MKR) return bytes32 for symbol/name, only decimals is required
+            logger.warning("Could not read symbol/name of %s, reading decimals only: %s", address, e)
+            decimals, symbol, name = token_contract.functions.decimals().call(), None, None
+        return {'decimals': decimals, 'symbol': symbol, 'name': name}
+
+    def get(self, token_address: str) -> Dict:
+        """
+        Get the metadata of a token, fetching it from the chain on the first request only.
+
+        Args:
+            token_address (str): The Ethereum address of the token
+
+        Returns:
+            Dict: 'decimals', 'symbol' and 'name' of the token
+        """
+        key = (self.chain_id, Web3.to_checksum_address(token_address))
+        with self._lock:
+            if key in self._tokens:
+                self._tokens.move_to_end(key)
+                return self._tokens[key]
+
+        metadata = self._fetch(key[1])
+        logger.debug("Fetched token metadata for %s: %s", key[1], metadata)
+
+        with self._lock:
+            self._tokens[key] = metadata
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+            self._save()
+        return metadata
+
+    def get_decimals(self, token_address: str) -> int:
+        """Shortcut for get(token_address)['decimals']."""
+        return self.get(token_address)['decimals']
+
+    def preload(self, token_addresses: Iterable[str]) -> None:
+        """
+        Warm the cache for the given tokens, e.g. the tokens listed in TOKEN_PRELOAD_ADDRESSES.
+
+        Failures are logged and ignored so that a flaky RPC at startup does not stop the app.
+
+        Args:
+            token_addresses (Iterable[str]): Addresses of the tokens to preload
+        """
+        for token_address in token_addresses:
+            try:
+                self.get(token_address)
+            except Exception as e:
+                logger.warning("Could not preload token metadata for %s: %s", token_address, e)
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_registry: Optional[TokenRegistry] = None
+_registry_lock = threading.Lock()
+
+
+# 共有のトークンレジストリを取得するメソッド
+def get_token_registry() -> TokenRegistry:
+    """
+    Get the process-wide token registry bound to the shared Web3 instance.
+
+    Returns:
+        TokenRegistry: The shared registry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TokenRegistry(
+                    get_web3(),
+                    cache_path=os.getenv("TOKEN_METADATA_CACHE", default_cache_path),
+                    max_size=int(os.getenv("TOKEN_METADATA_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+                )
+    return _registry
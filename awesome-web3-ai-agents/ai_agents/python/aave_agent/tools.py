@@ -11,33 +11,60 @@ Functions:
     lend_tokens
     borrow_tokens
     get_tokens
+    get_portfolio
+    get_transaction_status
+    get_lending_history
 
 機能：
     貸出: lend_tokens
     借入: borrow_tokens
     トークン情報取得: get_tokens
+    ポートフォリオ取得: get_portfolio
+    トランザクション状況取得: get_transaction_status
+    履歴取得: get_lending_history
 """
 
-import json
 import logging
 # Built in python imports
 import os
-from typing import Union
-
+import time
+from datetime import datetime, timezone
+from typing import Dict, Union
+
+from abis import aave_lending_pool_abi, aave_lending_pool_address, erc20_abi
+# Cached allowances and EIP-2612 permits
+from allowances import get_allowance_cache, use_permit
+# Reusable contract handles
+from contract_cache import get_contract_cache
 from dotenv import load_dotenv
+# Local index of the pool's Supply / Borrow / Repay / Withdraw / LiquidationCall events
+from event_indexer import get_event_indexer
+# Block-cached fee parameters and gas estimates
+from fee_oracle import get_fee_oracle
 from langchain_core.tools import tool
-# Web3 Interactions
-from web3 import Web3
-
-# Configure logging
-# ロギングの設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# Lazy, level-gated logging with redaction
+from log_config import LazyHex, configure_logging, register_secret
+# Locally allocated nonces
+from nonce_manager import get_nonce_manager
+# Batched reads (JSON-RPC batch + Multicall3)
+from rpc_batch import ReadBatch
+# On-chain reserve list and configuration (caps, frozen / paused state)
+from reserve_index import get_reserve_index
+# Shared Web3 connection pool
+from rpc_pool import get_web3
+# Pre-flight simulation (eth_call / eth_estimateGas with state overrides)
+from simulation import get_simulator, simulation_enabled
+# Cached token metadata (decimals, symbol, name)
+from token_registry import get_token_registry
+# Spans around the confirmation waits
+from agent_common.tracing import get_tracer
+# Background receipt tracking
+from tx_tracker import get_receipt_watcher, wait_for_receipts
+
+# Configure logging (LOG_LEVEL / LOG_LEVELS / LOG_FORMAT, see log_config.py)
+# ロギングの設定（書き出しは別スレッドで行い、秘密鍵や署名済みトランザクションは伏せ字にする）
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Global variable for private key
 _private_key = None
@@ -53,25 +80,60 @@ def set_private_key(key: str):
     """
     global _private_key
     _private_key = key
-    logging.info("Private key has been set")
+    # Never let the key reach the logs, even through an exception message
+    register_secret(key)
+    logger.info("Private key has been set")
 
 """
 Initial Setup -> GLOBAL VARIABLES
 """
-rpc_url = os.getenv("RPC_URL") # what will be used to connect to the blockchain
-aave_lending_pool_address = "0x6Ae43d3271ff6888e7Fc43Fd7321a503ff738951" # aave's pool address on the blockchain 
+# aave_lending_pool_address (aave's pool address on the blockchain) is defined in abis.py
+
+
+# Initialize Web3 connection - shared by every tool through the pooled provider (see rpc_pool.py)
+# Web3接続の初期化（プールされたプロバイダーを全ツールで共有する）
+web3 = get_web3()
+token_registry = get_token_registry()
+# Tokens listed in TOKEN_PRELOAD_ADDRESSES are read once at startup instead of on the first tool call (see token_registry.py)
+# TOKEN_PRELOAD_ADDRESSESに指定したトークンのメタデータを起動時に読み込んでおく
+token_registry.preload(
+    address.strip() for address in os.getenv("TOKEN_PRELOAD_ADDRESSES", "").split(",") if address.strip()
+)
+
+# Contract handles are built once per (address, ABI) and shared by every tool call (see contract_cache.py)
+# コントラクトオブジェクトは1度だけ生成して使い回す
+contracts = get_contract_cache()
+
+# Nonces are handed out locally per account so dependent transactions can be sent back-to-back (see nonce_manager.py)
+# ナンスはローカルで払い出し、approve → supply をレシートを待たずに連続送信する
+nonce_manager = get_nonce_manager()
+
+# Fee parameters and gas limits come from the fee oracle instead of fixed values (see fee_oracle.py)
+# ガス代とガスリミットはフィーオラクルから取得する
+fee_oracle = get_fee_oracle()
 
+# Submitted transactions are confirmed in the background unless TX_SUBMIT_MODE=wait (see tx_tracker.py)
+# 送信したトランザクションの確定はバックグラウンドで監視する
+receipt_watcher = get_receipt_watcher()
 
-# Initialize Web3 connection
-# Web3接続の初期化
-web3 = Web3(Web3.HTTPProvider(rpc_url))
+# Allowances are cached so that a sufficient approval is not sent again (see allowances.py)
+# allowanceをキャッシュし、十分な承認がある場合はapproveを省略する
+allowance_cache = get_allowance_cache()
 
-# Load AAVE Lending Pool ABI - the ABI allows us to know what functions are available
-# AAVE Lending Pool ABIの読み込み
-current_dir = os.path.dirname(os.path.abspath(__file__))
-abi_path = os.path.join(current_dir, 'aave_lending_pool_abi_testnet.json')
-with open(abi_path, 'r') as abi_file:
-    aave_lending_pool_abi = json.load(abi_file)
+# The tokens the agent can work with are the reserves of the pool, read from the chain (see reserve_index.py)
+# 扱えるトークンはプールのリザーブ一覧から取得し、送信前に上限や凍結状態を確認する
+reserve_index = get_reserve_index(aave_lending_pool_address)
+
+# Built transactions are simulated before they are signed, a revert is reported without sending (see simulation.py)
+# 署名前にトランザクションをシミュレーションし、リバートする場合は送信しない
+simulator = get_simulator()
+
+# Lending history is answered from a local SQLite index of the pool's events, kept up to date in the background
+# 貸出・借入の履歴はバックグラウンドで作成するローカルのイベントインデックスから取得する（event_indexer.py を参照）
+event_indexer = get_event_indexer(aave_lending_pool_address)
+
+# 履歴ツールが返すイベントの最大数（合計は期間内の全イベントで計算する）
+HISTORY_EVENT_LIMIT = 50
 
 # Loading the environmental variables which we don't want to be exposed to the general public
 load_dotenv()
@@ -89,236 +151,295 @@ def lend_crypto(
     Technical Flow:
     1. Connects to Ethereum network
     2. Initializes smart contract interfaces
-    3. Approves AAVE to spend tokens (ERC20 approve)
-    4. Supplies tokens to AAVE pool
+    3. Checks the cached allowance and approves AAVE to spend tokens only if it is too low
+       (or signs an EIP-2612 permit instead when USE_PERMIT=true)
+    4. Supplies tokens to AAVE pool and returns the hash while the receipt is tracked in the background
     
     Parameters:
     amount (float): The amount of cryptocurrency to lend in human-readable format (e.g., 100 USDC)
     asset_address (str): The Ethereum address of the token to be lent
 
     Returns:
-    Union[str, None]: The transaction hash if successful, None if any step fails
+    Union[str, None]: The transaction hash if successful, None if any step fails, or a message starting with
+    "Rejected before sending:" when the reserve state or a simulation of the transaction shows that Aave would
+    revert it. The transaction may still be pending, use get_transaction_status to check its confirmation.
 
     Implementation Details:
     --------------------
     1. Initial Setup and Validation:
        - Logs attempt to lend with amount and asset address
-       - Checks web3 connection to ensure we're connected to Ethereum
-       Why: Ensures we have proper connection before attempting any transactions
+       - Checks the reserve against the reserve index: active, not paused or frozen, room under the supply cap
+       Why: A supply Aave would revert is rejected before paying for a reverted transaction and a block wait
 
     2. Contract Setup:
-       - Loads minimal ERC20 ABI for token approval
-       - Initializes both AAVE lending pool and token contracts
+       - Gets both AAVE lending pool and token contracts from the contract cache
        Why: Need interfaces to interact with both the token and AAVE contracts
 
     3. Account Setup:
        - Creates account from private key
-       - Gets current nonce (transaction count)
-       - Retrieves current gas price
        Why: Required for transaction signing and gas estimation
 
     4. Amount Conversion:
-       - Converts human-readable amount to token decimals
+       - Converts human-readable amount to token decimals (cached per token, see token_registry.py)
        Why: Smart contracts work with raw numbers, not decimals
 
     5. Token Approval:
-       - Builds approval transaction with EIP-1559 parameters
-       - Signs and sends approval transaction
-       - Waits for approval confirmation
-       Why: ERC20 tokens require explicit approval before third-party contracts can move them
-
-    6. Supply to AAVE:
-       - Builds supply transaction with EIP-1559 parameters
-       - Signs and sends supply transaction
-       - Waits for supply confirmation
-       Why: Actually supplies the tokens to AAVE's lending pool
+       - Reads the current allowance of the pool through the allowance cache (see allowances.py)
+       - Skips the approval entirely when the allowance already covers the amount
+       - With USE_PERMIT=true and a token implementing EIP-2612, signs a permit off-chain instead
+       - Otherwise builds the approval transaction, it is signed and sent after the simulation below
+       Why: ERC20 tokens require explicit approval before third-party contracts can move them,
+       but a repeated approval costs a transaction, gas and a block of latency for nothing
+
+    6. Pre-flight Simulation (see simulation.py):
+       - Runs the built approval with eth_call, and the supply with eth_estimateGas on top of a state override
+         holding the approved allowance (or the built supply with eth_call when there is no approval)
+       - A revert returns "Rejected before sending:" with the decoded Aave error, nothing is signed
+       - The estimate on top of the approval replaces the 700k fallback gas limit of the supply
+       Why: A failed attempt costs a round trip instead of a block wait and the gas of a reverted transaction
+
+    7. Supply to AAVE:
+       - Builds supply (or supplyWithPermit) transaction with EIP-1559 parameters
+       - Reserves one nonce per transaction locally (see nonce_manager.py) only after building and simulating,
+         so a failure before signing never leaves a gap that later transactions would queue behind
+       - Signs and sends the approval, then the supply with the next nonce right after it
+       - Hands the transactions to the background receipt watcher and returns the supply hash right away
+         (with TX_SUBMIT_MODE=wait it blocks until the supply is mined instead)
+       Why: Actually supplies the tokens to AAVE's lending pool without holding the agent during confirmation
 
     Error Handling:
     - Separate try-catch blocks for approval and supply steps
     - Detailed logging of transaction states and errors
     - Transaction receipt validation
+    - The cached allowance is dropped after every approval or supply we send
     Why: Provides clear error messages and transaction status for debugging
 
     Gas and Transaction Parameters:
     - Uses EIP-1559 transaction type (type 2)
-    - Calculates maxFeePerGas and maxPriorityFeePerGas
-    - Sets appropriate gas limits for each operation
+    - maxFeePerGas and maxPriorityFeePerGas from eth_feeHistory, cached for FEE_CACHE_TTL seconds (see fee_oracle.py)
+    - Gas limits from a live estimate_gas batched with the fee read, with the last successful estimate or a fixed
+      fallback when the estimate is not possible
     Why: Ensures reliable transaction processing with optimal gas costs
     """
-    # Initial validation: Log the attempt and verify Ethereum connection
+    # Initial validation: Log the attempt
     # 初期チェック
-    logging.info(f"Attempting to lend {amount} of asset at {asset_address}")
-    if not web3.is_connected():
-        logging.warning("Unable to connect to Ethereum")
-        return None
+    logger.info("Attempting to lend %s of asset at %s", amount, asset_address)
 
     # Validate private key is set
     if _private_key is None:
-        logging.error("Private key not set. Please set private key before attempting transactions.")
+        logger.error("Private key not set. Please set private key before attempting transactions.")
         return None
 
     try:
+        # Reject what Aave would revert before anything is signed (see reserve_index.py)
+        # 凍結・停止中のリザーブや供給上限を超える貸し出しは送信前に拒否する
+        problem = reserve_index.check_supply(asset_address, amount)
+        if problem:
+            logger.warning("Supply rejected before sending: %s", problem)
+            return f"Rejected before sending: {problem}"
+
         # Log connection details for debugging purposes
-        logging.info("Connected to Ethereum")
-        logging.info(f"Using RPC URL: {rpc_url}")
-        logging.info(f"AAVE Lending Pool Address: {aave_lending_pool_address}")
+        logger.debug("Using RPC URL: %s, AAVE Lending Pool Address: %s", web3.provider.endpoint_uri, aave_lending_pool_address)
         
-        # Define minimal ERC20 ABI for approval and decimals
-        erc20_abi = [
-            {
-                "constant": False,
-                "inputs": [
-                    {"name": "_spender", "type": "address"},
-                    {"name": "_value", "type": "uint256"}
-                ],
-                "name": "approve",
-                "outputs": [{"name": "", "type": "bool"}],
-                "payable": False,
-                "stateMutability": "nonpayable",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "type": "function"
-            }
-        ]
-        
-        # Initialize smart contract interfaces
+        # Get smart contract interfaces from the contract cache
         # lending_pool: Interface to interact with AAVE's lending pool
         # token_contract: Interface to interact with the token contract
-        # ERC20およびAAVEスマートコントラクトの初期化
-        lending_pool = web3.eth.contract(address=aave_lending_pool_address, abi=aave_lending_pool_abi)
-        token_contract = web3.eth.contract(address=asset_address, abi=erc20_abi)
-        logging.info("Contracts initialized successfully")
-        
-        # Get token decimals
-        token_decimals = token_contract.functions.decimals().call()
-        logging.info(f"Token decimals: {token_decimals}")
+        # ERC20およびAAVEスマートコントラクトの取得
+        lending_pool = contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        token_contract = contracts.get(asset_address, erc20_abi)
+        logger.debug("Contracts initialized successfully")
         
-        # Setup account and get current blockchain state
-        # アカウントとナンスの情報を取得する。
+        # Get token decimals from the metadata cache (only the first call for a token hits the chain)
+        token_decimals = token_registry.get_decimals(asset_address)
+
+        # Setup account
         account = web3.eth.account.from_key(_private_key)
-        nonce = web3.eth.get_transaction_count(account.address)
-        logging.info(f"Account address: {account.address}")
-        logging.info(f"Current nonce: {nonce}")
-        logging.info(f"Current gas price: {web3.eth.gas_price}")
+        logger.debug("Token decimals: %s, account address: %s", token_decimals, account.address)
 
         # Convert human-readable amount to token decimals
         # Dynamically use the token's decimal places
         amount_in_wei = int(amount * 10**token_decimals)
-        logging.info(f"Amount in token base units: {amount_in_wei}")
-
-        # Build approval transaction
-        # This transaction allows AAVE to spend our tokens
-        # Approval transactionを作成する。
-        approve_tx = token_contract.functions.approve(
-            aave_lending_pool_address,  # Who we're approving (AAVE)
-            amount_in_wei              # How much we're approving
-        ).build_transaction({
-            'from': account.address,                    # Who is giving approval
+        logger.debug("Amount in token base units: %s", amount_in_wei)
+
+        # Decide how the pool gets its allowance
+        # 既存のallowanceで足りる場合はapproveを省略し、permitが使える場合は署名で代用する。
+        current_allowance = allowance_cache.get(asset_address, account.address, aave_lending_pool_address)
+        permit = None
+        needs_approve = current_allowance < amount_in_wei
+        if needs_approve and use_permit:
+            permit = allowance_cache.sign_permit(asset_address, account, aave_lending_pool_address, amount_in_wei)
+            needs_approve = permit is None
+        if not needs_approve and permit is None:
+            logger.info("Allowance %s covers the amount, skipping approval", current_allowance)
+
+        approve_tx = None
+        if needs_approve:
+            # Build approval transaction
+            # This transaction allows AAVE to spend our tokens
+            # Approval transactionを作成する。
+            approve_call = token_contract.functions.approve(
+                aave_lending_pool_address,  # Who we're approving (AAVE)
+                amount_in_wei              # How much we're approving
+            )
+            approve_tx = approve_call.build_transaction({
+                'from': account.address,                    # Who is giving approval
+                'chainId': 11155111,                       # Sepolia testnet chain ID
+                'type': 2,                                 # EIP-1559 transaction type
+                # gas, maxFeePerGas and maxPriorityFeePerGas from the fee oracle
+                **fee_oracle.transaction_params(approve_call, account.address, fallback_gas=100000)
+            })
+            logger.debug("Approval transaction built: %s", approve_tx)
+
+        # Build supply transaction to AAVE
+        # This transaction actually supplies our tokens to the lending pool
+        # AAVEへの貸し出しトランザクションを作成する。
+        if permit is not None:
+            # The permit signature replaces the approval, both happen inside this single transaction
+            # permitの署名を渡してapproveとsupplyを1つのトランザクションで行う。
+            supply_call = lending_pool.functions.supplyWithPermit(
+                asset_address,          # Token we're supplying
+                amount_in_wei,          # Amount we're supplying
+                account.address,        # Who will receive the aToken (us)
+                0,                      # Referral code (not used)
+                permit['deadline'],     # Permit expiry
+                permit['v'],            # Permit signature
+                permit['r'],
+                permit['s']
+            )
+        else:
+            supply_call = lending_pool.functions.supply(
+                asset_address,          # Token we're supplying
+                amount_in_wei,          # Amount we're supplying
+                account.address,        # Who will receive the aToken (us)
+                0                       # Referral code (not used)
+            )
+        supply_tx = supply_call.build_transaction({
+            'from': account.address,                    # Who is supplying
             'chainId': 11155111,                       # Sepolia testnet chain ID
-            'gas': 100000,                             # Maximum gas willing to spend
-            'maxFeePerGas': web3.eth.gas_price * 2,    # Maximum total fee per gas unit
-            'maxPriorityFeePerGas': web3.eth.gas_price,# Tip to miners
-            'nonce': nonce,                            # Transaction count
-            'type': 2                                  # EIP-1559 transaction type
+            'type': 2,                                 # EIP-1559 transaction type
+            # The estimate can only succeed once the allowance exists, until then the 700k fallback is used
+            **fee_oracle.transaction_params(supply_call, account.address, fallback_gas=700000)
         })
-        logging.info(f"Approval transaction built: {approve_tx}")
-        
+        logger.debug("Supply transaction built: %s", supply_tx)
+
+        # Run the transactions before anything is signed, a revert costs a round trip instead of a block
+        # 署名する前にシミュレーションし、リバートする場合は送信しない
+        if simulation_enabled:
+            with get_tracer().span("tx.simulate", label="supply"):
+                problem, supply_gas = simulator.preflight(supply_tx, approve_tx)
+            if problem:
+                logger.warning("Supply rejected before sending: %s", problem)
+                return f"Rejected before sending: {problem}"
+            if supply_gas is not None:
+                # Estimated on top of the approval, replaces the 700k fallback
+                supply_tx['gas'] = int(supply_gas * fee_oracle.gas_margin)
+
+        # Reserve one nonce per transaction only now that both are built and simulated, a failure in those steps
+        # must not leave a reserved nonce behind (later transactions would queue behind the gap)
+        # ナンスは組み立てとシミュレーションが終わってから、送信するトランザクションの数だけまとめて確保する。
+        nonces = nonce_manager.allocate(account.address, 2 if approve_tx is not None else 1)
+        logger.debug("Allocated nonce(s): %s", nonces)
         try:
-            # Sign and send approval transaction
-            logging.info("Attempting to sign approval transaction...")
-            signed_approve_tx = account.sign_transaction(approve_tx)
-            logging.info("Approval transaction signed successfully")
-            
-            # Debug: Inspect SignedTransaction object attributes
-            logging.info("SignedTransaction attributes:")
-            logging.info(f"Hash: {signed_approve_tx.hash.hex()}")
-            logging.info(f"r: {signed_approve_tx.r}")  # Part of transaction signature
-            logging.info(f"s: {signed_approve_tx.s}")  # Part of transaction signature
-            logging.info(f"v: {signed_approve_tx.v}")  # Recovery value for signature
-            
-            # Send the raw transaction to the network
+            if approve_tx is not None:
+                approve_tx['nonce'] = nonces[0]
+                signed_approve_tx = account.sign_transaction(approve_tx)
+                logger.debug("Approval transaction signed: %s", LazyHex(signed_approve_tx.hash))
+            # The supply takes the nonce right after the approval (if any)
+            supply_tx['nonce'] = nonces[-1]
+            signed_tx = account.sign_transaction(supply_tx)
+            logger.debug("Supply transaction signed: %s", LazyHex(signed_tx.hash))
+        except Exception:
+            # Nothing was sent, give the reserved nonces back
+            nonce_manager.release(account.address, nonces)
+            raise
+
+        tx_hash_approve = None
+        if approve_tx is not None:
             try:
-                # トランザクションを送信する。
-                tx_hash_approve = web3.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
+                # Send the raw transaction to the network
+                # The supply transaction follows right away with the next nonce, no need to wait for this receipt
+                try:
+                    # トランザクションを送信する。
+                    tx_hash_approve = web3.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
+                except Exception as e:
+                    # The raw transaction is redacted by the formatter, only its size is written
+                    logger.error("Failed to send raw transaction %s", LazyHex(signed_approve_tx.hash))
+                    logger.debug("Raw transaction: %s", LazyHex(signed_approve_tx.raw_transaction))
+                    # Both reserved nonces are unused now, give them back
+                    nonce_manager.release(account.address, nonces)
+                    raise e
+                finally:
+                    # The allowance is about to change (or we can not tell), read it again next time
+                    allowance_cache.invalidate(asset_address, account.address, aave_lending_pool_address)
+                    
+                logger.info("Approval Transaction Hash: %s", web3.to_hex(tx_hash_approve))
             except Exception as e:
-                logging.error("Failed to send raw transaction")
-                logging.error(f"Raw transaction: {signed_approve_tx.raw_transaction.hex()}")
+                logger.error("Error in approval transaction: %s (%s)", e, type(e).__name__)
                 raise e
-                
-            logging.info(f"Approval Transaction Hash: {tx_hash_approve.hex()}")
-            
-            # Wait for transaction to be mined and get receipt
-            receipt = web3.eth.wait_for_transaction_receipt(tx_hash_approve)
-            logging.info(f"Approval transaction mined in block: {receipt['blockNumber']}")
-            logging.info(f"Approval transaction status: {'Success' if receipt['status'] == 1 else 'Failed'}")
-        except Exception as e:
-            logging.error(f"Error in approval transaction: {str(e)}")
-            logging.error(f"Error type: {type(e)}")
-            raise e
-        
-        try:
-            # Build supply transaction to AAVE
-            # This transaction actually supplies our tokens to the lending pool
-            # AAVEへの貸し出しトランザクションを作成する。
-            supply_tx = lending_pool.functions.supply(
-                asset_address,          # Token we're supplying
-                amount_in_wei,          # Amount we're supplying
-                account.address,        # Who will receive the aToken (us)
-                0                       # Referral code (not used)
-            ).build_transaction({
-                'from': account.address,                    # Who is supplying
-                'chainId': 11155111,                       # Sepolia testnet chain ID
-                'gas': 700000,                             # Maximum gas willing to spend
-                'maxFeePerGas': web3.eth.gas_price * 2,    # Maximum total fee per gas unit
-                'maxPriorityFeePerGas': web3.eth.gas_price,# Tip to miners
-                'nonce': nonce + 1,                        # Increment nonce for second transaction
-                'type': 2                                  # EIP-1559 transaction type
-            })
-            logging.info("Supply transaction built successfully")
 
-            # Sign the supply transaction
-            logging.info("Attempting to sign supply transaction...")
-            signed_tx = account.sign_transaction(supply_tx)
-            logging.info("Supply transaction signed successfully")
-            
-            # Debug: Inspect SignedTransaction object for supply tx
-            logging.info("SignedTransaction attributes:")
-            logging.info(f"Hash: {signed_tx.hash.hex()}")
-            logging.info(f"r: {signed_tx.r}")  # Part of transaction signature
-            logging.info(f"s: {signed_tx.s}")  # Part of transaction signature
-            logging.info(f"v: {signed_tx.v}")  # Recovery value for signature
-            
+        try:
             # Send the supply transaction to the network
             try:
                 tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
             except Exception as e:
-                logging.error("Failed to send raw transaction")
-                logging.error(f"Raw transaction: {signed_tx.raw_transaction.hex()}")
+                logger.error("Failed to send raw transaction %s", LazyHex(signed_tx.hash))
+                logger.debug("Raw transaction: %s", LazyHex(signed_tx.raw_transaction))
+                # Only the supply nonce is unused, the approval (if any) is on its way
+                nonce_manager.release(account.address, nonces[-1:])
                 raise e
+            finally:
+                # The supply spends the allowance (or sets it via the permit)
+                allowance_cache.invalidate(asset_address, account.address, aave_lending_pool_address)
                 
-            logging.info(f"Supply Transaction Hash: {tx_hash.hex()}")
+            logger.info("Supply Transaction Hash: %s", web3.to_hex(tx_hash))
             
+            if not wait_for_receipts:
+                # Hand the transactions to the background watcher and return right away
+                # レシートはバックグラウンドで監視し、ハッシュをすぐに返す
+                if tx_hash_approve is not None:
+                    receipt_watcher.track(web3.to_hex(tx_hash_approve), f"approve {amount} of {asset_address}", account.address)
+                receipt_watcher.track(web3.to_hex(tx_hash), f"supply {amount} of {asset_address}", account.address)
+                return web3.to_hex(tx_hash)
+
             # Wait for supply transaction to be mined and get receipt
-            receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-            logging.info(f"Supply transaction mined in block: {receipt['blockNumber']}")
-            logging.info(f"Supply transaction status: {'Success' if receipt['status'] == 1 else 'Failed'}")
+            # The approval has the lower nonce, so it is mined in the same block or earlier
+            with get_tracer().span("tx.wait_receipt", label="supply"):
+                receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+            if tx_hash_approve is not None:
+                with get_tracer().span("tx.wait_receipt", label="approve"):
+                    approve_receipt = web3.eth.wait_for_transaction_receipt(tx_hash_approve)
+                logger.info("Approval transaction mined in block %s, status %s", approve_receipt['blockNumber'], approve_receipt['status'])
+            logger.info("Supply transaction mined in block %s, status %s", receipt['blockNumber'], receipt['status'])
             
             return web3.to_hex(tx_hash)
         except Exception as e:
-            logging.error(f"Error in supply transaction: {str(e)}")
-            logging.error(f"Error type: {type(e)}")
+            logger.error("Error in supply transaction: %s (%s)", e, type(e).__name__)
             raise e
     except Exception as e:
-        logging.error(f"An error occurred during the lending process: {e}")
-        logging.error(f"Error type: {type(e)}")
+        logger.error("An error occurred during the lending process: %s (%s)", e, type(e).__name__)
         return None
 
 
+# getUserAccountDataの戻り値を辞書に変換するメソッド
+def _format_account_data(account_data: list) -> dict:
+    """
+    Convert the raw getUserAccountData return values into a labelled dict.
+
+    Args:
+        account_data (list): The six values returned by getUserAccountData
+
+    Returns:
+        dict: The account data keyed by field name
+    """
+    return {
+        'totalCollateralBase': account_data[0],
+        'totalDebtBase': account_data[1],
+        'availableBorrowsBase': account_data[2],
+        'currentLiquidationThreshold': account_data[3],
+        'ltv': account_data[4],
+        'healthFactor': account_data[5]
+    }
+
 # AAVEプロトコルの「ユーザーアカウントデータ」を取得します。
 # AAVEプロトコルの「ユーザーアカウントデータ」を取得します。このデータには、担保額、借入可能額、ローンの健全性（Health Factor）などが含まれます。
 def get_user_account_data(account_address: str) -> dict:
@@ -338,21 +459,14 @@ def get_user_account_data(account_address: str) -> dict:
         - healthFactor: Current health factor
     """
     try:
-        # Aaveのコントラクトを初期化
-        lending_pool = web3.eth.contract(address=aave_lending_pool_address, abi=aave_lending_pool_abi)
+        # Aaveのコントラクトを取得
+        lending_pool = contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
         # ユーザーアカウントデータを取得
         account_data = lending_pool.functions.getUserAccountData(account_address).call()
         
-        return {
-            'totalCollateralBase': account_data[0],
-            'totalDebtBase': account_data[1],
-            'availableBorrowsBase': account_data[2],
-            'currentLiquidationThreshold': account_data[3],
-            'ltv': account_data[4],
-            'healthFactor': account_data[5]
-        }
+        return _format_account_data(account_data)
     except Exception as e:
-        logging.error(f"Error getting user account data: {e}")
+        logger.error("Error getting user account data: %s", e)
         return None
 
 # AAVEプロトコルを介して、暗号通貨を借り入れるトランザクションを実行するメソッド
@@ -365,7 +479,7 @@ def borrow_crypto(amount: float, asset_address: str, interest_rate_mode: int = 2
     1. Connects to Ethereum network
     2. Initializes AAVE lending pool interface
     3. Executes borrow transaction
-    4. Waits for confirmation
+    4. Returns the hash right away while the receipt is tracked in the background
     
     Parameters:
     amount (float): The amount of cryptocurrency to borrow in human-readable format (e.g., 100 USDC)
@@ -373,7 +487,9 @@ def borrow_crypto(amount: float, asset_address: str, interest_rate_mode: int = 2
     interest_rate_mode (int): Interest rate type (2 for variable). Defaults to 2 (variable) since stable rate is deprecated in AAVE V3.
 
     Returns:
-    Union[str, None]: The transaction hash if successful, None if any step fails
+    Union[str, None]: The transaction hash if successful, None if any step fails, or a message starting with
+    "Rejected before sending:" when the reserve state or a simulation of the transaction shows that Aave would
+    revert it. The transaction may still be pending, use get_transaction_status to check its confirmation.
 
     Interest Rate Modes:
     - Mode 1 (Stable): Fixed interest rate that can change under specific conditions
@@ -384,27 +500,30 @@ def borrow_crypto(amount: float, asset_address: str, interest_rate_mode: int = 2
     --------------------
     1. Initial Setup and Validation:
        - Logs attempt to borrow with amount and asset address
-       - Checks web3 connection to ensure we're connected to Ethereum
-       Why: Ensures we have proper connection before attempting any transactions
+       - Checks the reserve against the reserve index: active, not paused or frozen, borrowing enabled,
+         room under the borrow cap and enough liquidity
+       Why: A borrow Aave would revert is rejected before paying for a reverted transaction and a block wait
 
     2. Contract Setup:
-       - Initializes AAVE lending pool interface
+       - Gets AAVE lending pool interface from the contract cache
        Why: Need interface to interact with AAVE's borrowing functionality
 
     3. Account Setup:
        - Creates account from private key
-       - Gets current nonce (transaction count)
-       - Retrieves current gas price
+       - Reads account data
        Why: Required for transaction signing and gas estimation
 
     4. Amount Conversion:
-       - Converts human-readable amount to token decimals
+       - Converts human-readable amount to token decimals (cached per token, see token_registry.py)
        Why: Smart contracts work with raw numbers, not decimals
 
     5. Borrow from AAVE:
        - Builds borrow transaction with EIP-1559 parameters
+       - Runs the built transaction with eth_call first (see simulation.py), a revert returns
+         "Rejected before sending:" with the decoded Aave error (e.g. not enough collateral) and nothing is signed
+       - Reserves a nonce locally (see nonce_manager.py) right before signing, after the build and the simulation
        - Signs and sends borrow transaction
-       - Waits for confirmation
+       - Hands the transaction to the background receipt watcher (or waits with TX_SUBMIT_MODE=wait)
        Why: Actually borrows the tokens from AAVE's lending pool
 
     Error Handling:
@@ -414,135 +533,127 @@ def borrow_crypto(amount: float, asset_address: str, interest_rate_mode: int = 2
 
     Gas and Transaction Parameters:
     - Uses EIP-1559 transaction type (type 2)
-    - Calculates maxFeePerGas and maxPriorityFeePerGas
-    - Sets appropriate gas limits
+    - maxFeePerGas and maxPriorityFeePerGas from eth_feeHistory, cached for FEE_CACHE_TTL seconds (see fee_oracle.py)
+    - Gas limit from a live estimate_gas batched with the fee read (see fee_oracle.py)
     Why: Ensures reliable transaction processing with optimal gas costs
     """
-    # Initial validation: Log the attempt and verify Ethereum connection
-    logging.info(f"Attempting to borrow {amount} of asset at {asset_address} with interest rate mode {interest_rate_mode}")
-    if not web3.is_connected():
-        logging.error("Unable to connect to Ethereum")
-        return None
+    # Initial validation: Log the attempt
+    logger.info("Attempting to borrow %s of asset at %s with interest rate mode %s", amount, asset_address, interest_rate_mode)
 
     # Validate private key is set
     if _private_key is None:
-        logging.error("Private key not set. Please set private key before attempting transactions.")
+        logger.error("Private key not set. Please set private key before attempting transactions.")
         return None
 
     try:
-        # Log connection details for debugging purposes
-        logging.info("Connected to Ethereum")
-        
-        # Initialize AAVE lending pool interface and token contract
-        # コントラクトを初期化する。
-        lending_pool = web3.eth.contract(address=aave_lending_pool_address, abi=aave_lending_pool_abi)
-        
-        # Define minimal ERC20 ABI for decimals
-        erc20_abi = [
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "type": "function"
-            }
-        ]
-        token_contract = web3.eth.contract(address=asset_address, abi=erc20_abi)
-        logging.info("Contracts initialized successfully")
+        # Reject what Aave would revert before anything is signed (see reserve_index.py)
+        # 凍結・停止中のリザーブや借入上限・流動性を超える借り入れは送信前に拒否する
+        problem = reserve_index.check_borrow(asset_address, amount, interest_rate_mode)
+        if problem:
+            logger.warning("Borrow rejected before sending: %s", problem)
+            return f"Rejected before sending: {problem}"
+
+        # Get AAVE lending pool interface
+        # コントラクトを取得する。
+        lending_pool = contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+        logger.debug("Contracts initialized successfully")
         
         # Setup account
         account = web3.eth.account.from_key(_private_key)
         
         # Check user's borrowing capacity
+        # 借入可能額を取得する。
         account_data = get_user_account_data(account.address)
         if account_data is None:
-            logging.error("Failed to get account data")
+            logger.error("Unable to read account state from Ethereum")
             return None
-            
-        logging.info("Account Data:")
-        logging.info(f"Total Collateral: {account_data['totalCollateralBase']} (base units)")
-        logging.info(f"Total Debt: {account_data['totalDebtBase']} (base units)")
-        logging.info(f"Available Borrows: {account_data['availableBorrowsBase']} (base units)")
-        logging.info(f"Current LTV: {account_data['ltv']}")
-        logging.info(f"Health Factor: {account_data['healthFactor']}")
+        logger.debug("Account data: %s", account_data)
         
         if account_data['totalCollateralBase'] == 0:
-            logging.error("No collateral supplied. Please supply collateral before borrowing.")
+            logger.error("No collateral supplied. Please supply collateral before borrowing.")
             return None
             
         if account_data['availableBorrowsBase'] == 0:
-            logging.error("No borrowing power available. Please supply more collateral.")
+            logger.error("No borrowing power available. Please supply more collateral.")
             return None
         
-        # Get token decimals
-        token_decimals = token_contract.functions.decimals().call()
-        logging.info(f"Token decimals: {token_decimals}")
-        
-        # Get current nonce and gas price
-        nonce = web3.eth.get_transaction_count(account.address)
-        logging.info(f"Account address: {account.address}")
-        logging.info(f"Current nonce: {nonce}")
-        logging.info(f"Current gas price: {web3.eth.gas_price}")
+        # Get token decimals from the metadata cache
+        token_decimals = token_registry.get_decimals(asset_address)
+        logger.debug("Token decimals: %s, account address: %s", token_decimals, account.address)
 
         # Convert human-readable amount to token decimals
         amount_in_wei = int(amount * 10**token_decimals)
-        logging.info(f"Amount in token base units: {amount_in_wei}")
+        logger.debug("Amount in token base units: %s", amount_in_wei)
 
         try:
             # 貸し入れのためのトランザクションを作成する。
             # Build borrow transaction
-            borrow_tx = lending_pool.functions.borrow(
+            borrow_call = lending_pool.functions.borrow(
                 asset_address,          # Token we're borrowing
                 amount_in_wei,          # Amount we're borrowing
                 interest_rate_mode,     # Interest rate type (1=stable, 2=variable)
                 0,                      # Referral code (not used)
                 account.address         # Who will receive the borrowed tokens
-            ).build_transaction({
+            )
+            borrow_tx = borrow_call.build_transaction({
                 'from': account.address,                    # Who is borrowing
                 'chainId': 11155111,                       # Sepolia testnet chain ID
-                'gas': 500000,                             # Maximum gas willing to spend
-                'maxFeePerGas': web3.eth.gas_price * 2,    # Maximum total fee per gas unit
-                'maxPriorityFeePerGas': web3.eth.gas_price,# Tip to miners
-                'nonce': nonce,                            # Transaction count
-                'type': 2                                  # EIP-1559 transaction type
+                'type': 2,                                 # EIP-1559 transaction type
+                # gas, maxFeePerGas and maxPriorityFeePerGas from the fee oracle
+                **fee_oracle.transaction_params(borrow_call, account.address, fallback_gas=500000)
             })
-            logging.info("Borrow transaction built successfully")
-
-            # Sign the borrow transaction
-            logging.info("Attempting to sign borrow transaction...")
-            signed_tx = account.sign_transaction(borrow_tx)
-            logging.info("Borrow transaction signed successfully")
-            
-            # Debug: Inspect SignedTransaction object
-            logging.info("SignedTransaction attributes:")
-            logging.info(f"Hash: {signed_tx.hash.hex()}")
-            logging.info(f"r: {signed_tx.r}")  # Part of transaction signature
-            logging.info(f"s: {signed_tx.s}")  # Part of transaction signature
-            logging.info(f"v: {signed_tx.v}")  # Recovery value for signature
+            logger.debug("Borrow transaction built: %s", borrow_tx)
+
+            # Run the exact transaction before signing it (see simulation.py)
+            # 署名する前にシミュレーションし、リバートする場合は送信しない
+            if simulation_enabled:
+                with get_tracer().span("tx.simulate", label="borrow"):
+                    problem, _ = simulator.preflight(borrow_tx)
+                if problem:
+                    logger.warning("Borrow rejected before sending: %s", problem)
+                    return f"Rejected before sending: {problem}"
+
+            # Reserve the nonce only now, right before signing (see lend_crypto)
+            # ナンスは署名の直前に確保する。
+            nonce, = nonce_manager.allocate(account.address)
+            logger.debug("Allocated nonce: %s", nonce)
+            try:
+                # Sign the borrow transaction
+                borrow_tx['nonce'] = nonce
+                signed_tx = account.sign_transaction(borrow_tx)
+                logger.debug("Borrow transaction signed: %s", LazyHex(signed_tx.hash))
+            except Exception:
+                # Nothing was sent, give the reserved nonce back
+                nonce_manager.release(account.address, [nonce])
+                raise
             
             # Send the borrow transaction to the network
             try:
                 tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
             except Exception as e:
-                logging.error("Failed to send raw transaction")
-                logging.error(f"Raw transaction: {signed_tx.raw_transaction.hex()}")
+                logger.error("Failed to send raw transaction %s", LazyHex(signed_tx.hash))
+                logger.debug("Raw transaction: %s", LazyHex(signed_tx.raw_transaction))
+                nonce_manager.release(account.address, [nonce])
                 raise e
                 
-            logging.info(f"Borrow Transaction Hash: {tx_hash.hex()}")
+            logger.info("Borrow Transaction Hash: %s", web3.to_hex(tx_hash))
             
+            if not wait_for_receipts:
+                # Hand the transaction to the background watcher and return right away
+                receipt_watcher.track(web3.to_hex(tx_hash), f"borrow {amount} of {asset_address}", account.address)
+                return web3.to_hex(tx_hash)
+
             # Wait for borrow transaction to be mined and get receipt
-            receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-            logging.info(f"Borrow transaction mined in block: {receipt['blockNumber']}")
-            logging.info(f"Borrow transaction status: {'Success' if receipt['status'] == 1 else 'Failed'}")
+            with get_tracer().span("tx.wait_receipt", label="borrow"):
+                receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+            logger.info("Borrow transaction mined in block %s, status %s", receipt['blockNumber'], receipt['status'])
             
             return web3.to_hex(tx_hash)
         except Exception as e:
-            logging.error(f"Error in borrow transaction: {str(e)}")
-            logging.error(f"Error type: {type(e)}")
+            logger.error("Error in borrow transaction: %s (%s)", e, type(e).__name__)
             raise e
     except Exception as e:
-        logging.error(f"An error occurred during the borrowing process: {e}")
-        logging.error(f"Error type: {type(e)}")
+        logger.error("An error occurred during the borrowing process: %s (%s)", e, type(e).__name__)
         return None
 
 # トークンの残高を取得するメソッド
@@ -561,89 +672,209 @@ def get_token_balance(
     Returns:
     Union[float, None]: The token balance in human-readable format, None if error occurs
     """
-    logging.info("=== Starting get_token_balance function ===")
-    logging.info(f"Input parameters - token_address: {token_address}, user_address: {user_address}")
+    logger.debug("get_token_balance - token_address: %s, user_address: %s", token_address, user_address)
     
     try:
-        # Check web3 connection
-        logging.info(f"Checking Web3 connection to: {web3.provider.endpoint_uri}")
-        logging.info(f"Checking Web3 connection to: {web3}")
-        if not web3.is_connected():
-            logging.error("Web3 is not connected!")
-            return None
-        logging.info("Web3 connection confirmed")
-
         # Handle user address
         if not user_address:
-            logging.info("No user_address provided, using connected wallet")
             try:
                 if _private_key is None:
-                    logging.error("Private key not set. Please set private key before checking balance.")
+                    logger.error("Private key not set. Please set private key before checking balance.")
                     return None
                 account = web3.eth.account.from_key(_private_key)
                 user_address = account.address
-                logging.info(f"Generated address from private key: {user_address}")
+                logger.debug("No user_address provided, using the connected wallet %s", user_address)
             except Exception as e:
-                logging.error(f"Error creating account from private key: {str(e)}")
+                logger.error("Error creating account from private key: %s (%s)", e, type(e).__name__)
                 return None
+
+        # Get token contract
+        # ECR20トークンを取得する
+        token_contract = contracts.get(token_address, erc20_abi)
         
-        logging.info(f"Using address for balance check: {user_address}")
-
-        # Log token contract setup
-        logging.info("Setting up ERC20 ABI")
-        erc20_abi = [
-            {
-                "constant": True,
-                "inputs": [{"name": "_owner", "type": "address"}],
-                "name": "balanceOf",
-                "outputs": [{"name": "balance", "type": "uint256"}],
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "type": "function"
-            }
-        ]
-
-        # Initialize token contract
-        logging.info(f"Initializing token contract at address: {token_address}")
-        # ECR20トークンを初期化する
-        token_contract = web3.eth.contract(address=token_address, abi=erc20_abi)
-        logging.info("Token contract initialized")
-        
-        # Get token decimals
-        logging.info("Attempting to get token decimals")
+        # Get token decimals from the metadata cache
         try:
-            decimals = token_contract.functions.decimals().call()
-            logging.info(f"Token decimals: {decimals}")
+            decimals = token_registry.get_decimals(token_address)
         except Exception as e:
-            logging.error(f"Error getting token decimals: {str(e)}")
-            logging.error(f"Error type: {type(e)}")
+            logger.error("Error getting token decimals: %s (%s)", e, type(e).__name__)
             return None
         
         # Get balance
-        logging.info(f"Attempting to get balance for address: {user_address}")
         try:
             # 残高を取得する。
             balance_wei = token_contract.functions.balanceOf(user_address).call()
-            logging.info(f"Raw balance (wei): {balance_wei}")
         except Exception as e:
-            logging.error(f"Error getting token balance: {str(e)}")
-            logging.error(f"Error type: {type(e)}")
+            logger.error("Error getting token balance: %s (%s)", e, type(e).__name__)
             return None
         
         # Convert to human readable format
         balance = balance_wei / (10 ** decimals)
-        logging.info(f"Converted balance: {balance}")
-        
-        logging.info("=== get_token_balance function completed successfully ===")
+        logger.debug("Balance of %s: %s (raw %s, decimals %s)", user_address, balance, balance_wei, decimals)
         return balance
     except Exception as e:
-        logging.error("=== get_token_balance function failed ===")
-        logging.error(f"Error type: {type(e)}")
-        logging.error(f"Error message: {str(e)}")
-        logging.error(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No additional details'}")
-        return None
\ No newline at end of file
+        logger.error("get_token_balance failed: %s (%s)", e, type(e).__name__)
+        logger.debug("Error details: %s", getattr(e, '__dict__', None))
+        return None
+
+
+# 対応している全トークンの残高・預入額・負債とアカウントデータを1回で取得するメソッド
+@tool
+def get_portfolio(user_address: str = None) -> Union[Dict, None]:
+    """
+    Get a snapshot of the user's whole AAVE portfolio in one request.
+
+    Use this instead of calling get_token_balance once per token when the user asks for their balances,
+    positions or overall account state.
+
+    Parameters:
+    user_address (str): The user's address. If None, uses the connected wallet.
+
+    Returns:
+    Union[Dict, None]: None if an error occurs, otherwise
+        - tokens: one entry per reserve of the pool with symbol, address, wallet balance, supplied amount
+          (aToken balance) and variable debt, all in human-readable format
+        - account: getUserAccountData (collateral, debt, borrowing power, ltv, health factor)
+
+    Implementation Details:
+    --------------------
+    Every balanceOf read (token, aToken and debt token of each reserve) and getUserAccountData are aggregated
+    into a single Multicall3 call, so the snapshot costs one RPC round trip instead of ~3 per reserve. The
+    reserves with their aToken and debt token addresses and decimals come from the reserve index.
+    """
+    logger.debug("Getting portfolio for %s", user_address or 'the connected wallet')
+    try:
+        if not user_address:
+            if _private_key is None:
+                logger.error("Private key not set. Please set private key before checking balance.")
+                return None
+            user_address = web3.eth.account.from_key(_private_key).address
+
+        reserves = reserve_index.reserves()
+        lending_pool = contracts.get(aave_lending_pool_address, aave_lending_pool_abi)
+
+        # 全ての読み取りを1つのバッチ（マルチコール）にまとめる。
+        batch = ReadBatch(web3)
+        for reserve in reserves:
+            batch.add_call(contracts.get(reserve['address'], erc20_abi).functions.balanceOf(user_address))
+            batch.add_call(contracts.get(reserve['a_token'], erc20_abi).functions.balanceOf(user_address))
+            batch.add_call(contracts.get(reserve['variable_debt_token'], erc20_abi).functions.balanceOf(user_address))
+        batch.add_call(lending_pool.functions.getUserAccountData(user_address))
+        results = batch.execute()
+
+        tokens = []
+        for position, reserve in enumerate(reserves):
+            # aTokens and debt tokens have the decimals of their underlying asset
+            scale = 10 ** reserve['decimals']
+            wallet, supplied, variable_debt = results[3 * position:3 * position + 3]
+            tokens.append({
+                'symbol': reserve['symbol'],
+                'address': reserve['address'],
+                'wallet': wallet / scale,
+                'supplied': supplied / scale,
+                'variable_debt': variable_debt / scale,
+            })
+        portfolio = {'tokens': tokens, 'account': _format_account_data(results[-1])}
+        logger.debug("Portfolio: %s", portfolio)
+        return portfolio
+    except Exception as e:
+        logger.error("Error getting portfolio: %s (%s)", e, type(e).__name__)
+        return None
+
+
+# トランザクションの確定状況を取得するメソッド
+@tool
+def get_transaction_status(tx_hash: str) -> Union[Dict, None]:
+    """
+    Get the confirmation status of a transaction submitted by lend_crypto or borrow_crypto.
+
+    lend_crypto and borrow_crypto return the transaction hash as soon as the transaction is sent. Use this tool
+    when the user asks whether a transaction went through.
+
+    Parameters:
+    tx_hash (str): The transaction hash returned by lend_crypto or borrow_crypto
+
+    Returns:
+    Union[Dict, None]: tx_hash, label, status ('pending', 'success', 'failed' or 'dropped') and block_number,
+    None if the transaction is unknown
+    """
+    record = receipt_watcher.status(tx_hash)
+    if record is not None:
+        return {key: record[key] for key in ('tx_hash', 'label', 'status', 'block_number')}
+
+    # Not submitted by this process, look the receipt up directly
+    try:
+        receipt = web3.eth.get_transaction_receipt(tx_hash)
+    except Exception as e:
+        logger.error("Error getting transaction receipt: %s", e)
+        return None
+    return {
+        'tx_hash': tx_hash,
+        'label': None,
+        'status': 'success' if receipt['status'] == 1 else 'failed',
+        'block_number': receipt['blockNumber'],
+    }
+
+
+# 貸出・借入・返済・引き出し・清算の履歴をローカルのインデックスから取得するメソッド
+@tool
+def get_lending_history(user_address: str = None, days: float = 7, asset_address: str = None) -> Union[Dict, None]:
+    """
+    Get the user's AAVE history (supplies, borrows, repayments, withdrawals and liquidations) of the last days.
+
+    Use this when the user asks what they lent, borrowed, repaid or withdrew in the past, e.g. "what did I supply
+    last week".
+
+    Parameters:
+    user_address (str): The user's address. If None, uses the connected wallet.
+    days (float): How many days back to look (default 7)
+    asset_address (str): Only events of this token. If None, every token.
+
+    Returns:
+    Union[Dict, None]: None if an error occurs, otherwise
+        - totals: amount per event and token symbol over the whole period, in human-readable format
+        - events: the most recent events (time in UTC, event, symbol, amount, tx_hash)
+        - indexed_block / synced: how far the local index goes, synced is False while it is still catching up
+
+    Implementation Details:
+    --------------------
+    The pool events are indexed in the background into a local SQLite file (see event_indexer.py), so this tool
+    does not read the chain: the answer comes from an indexed query in milliseconds.
+    """
+    try:
+        if not user_address:
+            if _private_key is None:
+                logger.error("Private key not set. Please set private key before reading the history.")
+                return None
+            user_address = web3.eth.account.from_key(_private_key).address
+
+        # The indexer thread is started once, later calls only read the local store
+        event_indexer.start()
+        events = event_indexer.history(user_address, since=time.time() - days * 86400, asset=asset_address)
+
+        totals: Dict[str, Dict[str, float]] = {}
+        recent = []
+        for event in events:
+            token = token_registry.get(event['asset'])
+            amount = event['amount'] / 10 ** token['decimals']
+            symbol = token['symbol'] or event['asset']
+            event_totals = totals.setdefault(event['event'], {})
+            event_totals[symbol] = event_totals.get(symbol, 0) + amount
+            if len(recent) < HISTORY_EVENT_LIMIT:
+                recent.append({
+                    'time': datetime.fromtimestamp(event['timestamp'], timezone.utc).strftime('%Y-%m-%d %H:%M'),
+                    'event': event['event'],
+                    'symbol': symbol,
+                    'amount': amount,
+                    'tx_hash': event['tx_hash'],
+                })
+
+        stats = event_indexer.stats()
+        return {
+            'totals': totals,
+            'events': recent,
+            'indexed_block': stats['indexed_block'],
+            'synced': stats['head_lag'] is not None and stats['head_lag'] <= event_indexer.confirmations + 1,
+        }
+    except Exception as e:
+        logger.error("Error getting lending history: %s (%s)", e, type(e).__name__)
+        return None
@@ -0,0 +1,252 @@
+"""
+Transaction Tracker
+-------------------
+What:
+送信したトランザクションのレシートをバックグラウンドで監視します。ツールはトランザクションハッシュをすぐに返し、
+確定状況はバックグラウンドのウォッチャーがまとめてポーリングしてチャットセッションへ通知します。
+
+This script lets the tools submit a transaction and return its hash right away. A single background thread polls
+the receipts of every outstanding transaction in one JSON-RPC batch per cycle and records status updates per chat
+session, which the Streamlit UI drains and shows as they arrive.
+
+Environment:
+    TX_SUBMIT_MODE: "track" to return right after sending (default), "wait" to block until the receipt is mined
+    RECEIPT_POLL_INTERVAL: Seconds between receipt poll cycles (default 3)
+    RECEIPT_TIMEOUT: Seconds after which an unmined transaction is reported as dropped (default 600)
+    RECEIPT_RETENTION: Seconds a finished transaction (and its undrained update) is kept for status lookups
+                       (default 3600), older ones are answered from the chain by get_transaction_status
+
+Functions:
+    get_receipt_watcher
+    set_session
+    wait_for_receipts
+"""
+
+import contextvars
+import logging
+# Built in python imports
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from nonce_manager import get_nonce_manager
+from rpc_pool import get_web3
+from agent_common.tracing import get_tracer
+# Web3 Interactions
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 3
+DEFAULT_RECEIPT_TIMEOUT = 600
+DEFAULT_RETENTION = 3600
+
+# "wait"のときは従来どおりレシートが確定するまでツールがブロックする
+wait_for_receipts = os.getenv("TX_SUBMIT_MODE", "track").lower() == "wait"
+
+# The chat session the current tool call belongs to, set by main.py before invoking the graph.
+# LangChain copies the context into the ToolNode's worker threads, so the tools see the same value.
+_current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tx_session", default=None)
+
+
+# 現在のチャットセッションIDを設定するメソッド
+def set_session(session_id: Optional[str]) -> None:
+    """
+    Set the chat session that transactions submitted from the current context belong to.
+
+    Args:
+        session_id (Optional[str]): The chat session id
+    """
+    _current_session.set(session_id)
+
+
+class ReceiptWatcher:
+    """
+    Background receipt poller for submitted transactions.
+
+    Every tracked transaction is a dict with tx_hash, label, status ('pending', 'success', 'failed' or 'dropped'),
+    block_number and session_id. Status changes are queued per session until the UI drains them. Finished
+    transactions and updates no session drained (e.g. a closed browser tab) are dropped after the retention period,
+    so a long running process does not grow without bound.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        receipt_timeout: float = DEFAULT_RECEIPT_TIMEOUT,
+        retention: float = DEFAULT_RETENTION,
+    ):
+        self.web3 = web3
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.retention = retention
+        self._transactions: Dict[str, Dict[str, Any]] = {}
+        self._updates: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, tx_hash: str, label: str, account: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start watching a submitted transaction.
+
+        Args:
+            tx_hash (str): The transaction hash (0x prefixed)
+            label (str): Short human readable description, e.g. "supply 100 USDC"
+            account (Optional[str]): The sender, its nonce is resynced if the transaction is dropped
+
+        Returns:
+            Dict[str, Any]: The tracked transaction record
+        """
+        record = {
+            'tx_hash': tx_hash,
+            'label': label,
+            'status': 'pending',
+            'block_number': None,
+            'session_id': _current_session.get(),
+            'account': account,
+            'submitted_at': time.time(),
+            'finished_at': None,
+        }
+        with self._wakeup:
+            self._prune(record['submitted_at'])
+            self._transactions[tx_hash] = record
+            self._ensure_thread()
+            self._wakeup.notify()
+        logger.debug("Tracking transaction %s (%s)", tx_hash, label)
+        return dict(record)
+
+    def status(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the latest known record of a tracked transaction, None if it is not tracked."""
+        with self._lock:
+            record = self._transactions.get(tx_hash)
+            return dict(record) if record else None
+
+    def pending(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List the transactions of a session that are not mined yet."""
+        with self._lock:
+            return [
+                dict(record) for record in self._transactions.values()
+                if record['status'] == 'pending' and record['session_id'] == session_id
+            ]
+
+    def drain_updates(self, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Take the status updates queued for a chat session.
+
+        Args:
+            session_id (Optional[str]): The chat session id
+
+        Returns:
+            List[Dict[str, Any]]: Transactions whose status changed since the last call
+        """
+        with self._lock:
+            return self._updates.pop(session_id, [])
+
+    # 保持期間を過ぎた確定済みのトランザクションと未取得の通知を削除するメソッド（ロックを保持した状態で呼ぶ）
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.retention
+        finished = [
+            tx_hash for tx_hash, record in self._transactions.items()
+            if record['finished_at'] is not None and record['finished_at'] < cutoff
+        ]
+        for tx_hash in finished:
+            del self._transactions[tx_hash]
+        for session_id in list(self._updates):
+            updates = [update for update in self._updates[session_id] if update['finished_at'] >= cutoff]
+            if updates:
+                self._updates[session_id] = updates
+            else:
+                del self._updates[session_id]
+        if finished:
+            logger.debug("Pruned %s finished transaction(s)", len(finished))
+
+    # ポーリング用のスレッドを起動するメソッド（ロックを保持した状態で呼ぶ）
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="receipt-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._wakeup:
+                while not any(record['status'] == 'pending' for record in self._transactions.values()):
+                    self._wakeup.wait()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.warning("Receipt poll failed: %s", e)
+            time.sleep(self.poll_interval)
+
+    # 未確定のトランザクションのレシートを1回のバッチリクエストで取得するメソッド
+    def _fetch_receipts(self, tx_hashes: List[str]) -> List[Optional[Dict[str, Any]]]:
+        requests = [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes]
+        try:
+            responses = self.web3.provider.make_batch_request(requests)
+        except Exception as e:
+            logger.warning("Batched receipt poll failed, polling one by one: %s", e)
+            responses = [self.web3.provider.make_request(method, params) for method, params in requests]
+        return [response.get('result') for response in responses]
+
+    def poll_once(self) -> None:
+        """Poll the receipts of every pending transaction once and record status changes."""
+        with self._lock:
+            pending = [tx_hash for tx_hash, record in self._transactions.items() if record['status'] == 'pending']
+        if not pending:
+            return
+
+        receipts = self._fetch_receipts(pending)
+        now = time.time()
+        dropped_accounts = set()
+        with self._lock:
+            for tx_hash, receipt in zip(pending, receipts):
+                record = self._transactions[tx_hash]
+                if receipt is not None:
+                    record['status'] = 'success' if int(receipt['status'], 16) == 1 else 'failed'
+                    record['block_number'] = int(receipt['blockNumber'], 16)
+                elif now - record['submitted_at'] > self.receipt_timeout:
+                    record['status'] = 'dropped'
+                    if record['account']:
+                        dropped_accounts.add(record['account'])
+                else:
+                    continue
+                record['finished_at'] = now
+                logger.info("Transaction %s (%s) is %s", tx_hash, record['label'], record['status'])
+                # Time from submission to the final status, the confirmation latency seen by the user
+                get_tracer().record("tx.confirmation", now - record['submitted_at'], status=record['status'])
+                self._updates.setdefault(record['session_id'], []).append(dict(record))
+            self._prune(now)
+
+        # A dropped transaction leaves a nonce gap, reuse it for the next transaction
+        for account in dropped_accounts:
+            get_nonce_manager().resync(account)
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_receipt_watcher: Optional[ReceiptWatcher] = None
+_receipt_watcher_lock = threading.Lock()
+
+
+# 共有のレシートウォッチャーを取得するメソッド
+def get_receipt_watcher() -> ReceiptWatcher:
+    """
+    Get the process-wide receipt watcher bound to the shared Web3 instance.
+
+    Returns:
+        ReceiptWatcher: The shared receipt watcher
+    """
+    global _receipt_watcher
+    if _receipt_watcher is None:
+        with _receipt_watcher_lock:
+            if _receipt_watcher is None:
+                _receipt_watcher = ReceiptWatcher(
+                    get_web3(),
+                    poll_interval=float(os.getenv("RECEIPT_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+                    receipt_timeout=float(os.getenv("RECEIPT_TIMEOUT", DEFAULT_RECEIPT_TIMEOUT)),
+                    retention=float(os.getenv("RECEIPT_RETENTION", DEFAULT_RETENTION)),
+                )
+    return _receipt_watcher
@@ -5,6 +5,7 @@ from pydantic import SecretStr
 from dotenv import load_dotenv
 import os
 import asyncio
+from agent_common.tracing import get_tracer
 
 # Load environment variables
 load_dotenv()
@@ -27,6 +28,10 @@ def get_llm():
 
 llm = get_llm()
 
+# Latency of the LLM streams and browser runs (see agent_common/tracing.py)
+with st.sidebar.expander("Latency (ms)"):
+    st.dataframe(get_tracer().histograms())
+
 # Toggle for browser automation mode
 st.session_state.browser_mode = st.toggle("Enable Browser Automation", value=st.session_state.browser_mode)
 
@@ -49,7 +54,8 @@ if prompt := st.chat_input("What would you like to do?"):
             # Run browser automation
             async def run_agent():
                 agent = Agent(task=prompt, llm=llm)
-                result = await agent.run()
+                with get_tracer().span("browser.agent_run"):
+                    result = await agent.run()
                 return result
 
             with st.spinner("Running browser automation..."):
@@ -60,9 +66,12 @@ if prompt := st.chat_input("What would you like to do?"):
             # Regular chat response
             with st.spinner("Working..."):
                 full_response = ""
-                for chunk in llm.stream(prompt):
-                    if chunk.content:
-                        full_response += chunk.content
-                        message_placeholder.markdown(full_response + "▌")
+                with get_tracer().span("chat.turn") as span:
+                    for chunk in llm.stream(prompt, {"callbacks": [get_tracer().callback_handler()]}):
+                        if chunk.content:
+                            if "first_token_ms" not in span.attributes:
+                                span.set_attribute("first_token_ms", round(span.elapsed_ms(), 1))
+                            full_response += chunk.content
+                            message_placeholder.markdown(full_response + "▌")
                 message_placeholder.markdown(full_response)
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
\ No newline at end of file
@@ -0,0 +1,80 @@
+#########################################################
+# AI Agentのグラフを組み立てる処理
+#
+# グラフ（ChatGroq・ツールのバインド・ToolNode・コンパイル）は agent_registry.py のレジストリに
+# (APIキー, モデル, ツール) ごとにキャッシュされ、Streamlitの再実行では作り直さない。
+#########################################################
+
+from typing import Annotated  # used to set additional metadata for a variable
+
+from agent_registry import get_agent_registry
+from langchain_groq import ChatGroq
+# Langchain / Langraph
+from langgraph.graph import START, StateGraph
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode, tools_condition
+# Local Imports
+# toots.pyに定義されたツールをインポートする。
+from agent_common.tool_output import ToolOutputCompactor, get_full_tool_output
+from tool_runtime import get_tool_runtime
+from tools import get_trending_tokens, search
+from typing_extensions import \
+    TypedDict  # a type that allows you to define dictionaries with specific key-value types
+
+MODEL = "llama3-70b-8192"
+
+# ツールごとのタイムアウト（秒）。指定の無いツールは TOOL_TIMEOUT を使う
+TOOL_TIMEOUTS = {"get_trending_tokens": 15, "search": 30}
+
+# Network tools run on the shared pool with a concurrency limit and their timeout (see tool_runtime.py)
+# ネットワークを使うツールは並列に、タイムアウト付きで実行する
+tool_runtime = get_tool_runtime(TOOL_TIMEOUTS)
+tools = tool_runtime.wrap([get_trending_tokens, search]) + [get_full_tool_output]
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+# LangGraphのグラフを組み立てる
+def build_graph(groq_api_key: str, model: str = MODEL):
+    # Chatbotと生成
+    llm = ChatGroq(model=model, api_key=groq_api_key)
+    llm_with_tools = llm.bind_tools(tools=tools) # this is to make the LLM aware of the tools it has
+
+    # AI agentの状態を管理するクラス
+    graph_builder = StateGraph(State) # the stategraph controls the structure of what our future chatbot will expect
+
+    # FUNCTIONS
+    def chatbot(state: State):
+        # AIの推論を実行する。
+        return {"messages": [llm_with_tools.invoke(state["messages"])]} # this takes the LAST message as input and returns an updated dict list under the messages within the State class
+
+    # NODES - Unit of work in the graph
+    # AI Agentのグラフを組み立てる。
+    tools_node = ToolNode(tools=tools)
+    # ツールの出力をトークン予算に収まるように圧縮するノード（元の出力はサイドストアに保存する）
+    compact_node = ToolOutputCompactor({"get_trending_tokens": 400, "search": 500})
+    graph_builder.add_node(
+        "chatbot", # name of the node
+        chatbot # function which is called whenever the node is used within the graph
+    )
+    graph_builder.add_node("tools", tools_node)
+    graph_builder.add_node("compact", compact_node)
+    graph_builder.add_conditional_edges(
+        "chatbot",
+        tools_condition,)
+    graph_builder.add_edge("tools", "compact")
+    graph_builder.add_edge("compact", "chatbot")
+    graph_builder.add_edge(START, "chatbot") # START tells the graph where to start
+    return graph_builder.compile() # allows to graph to become runnable
+
+
+# キャッシュされたグラフを取得する（初回だけ組み立てる）
+def get_graph(groq_api_key: str, model: str = MODEL):
+    return get_agent_registry().get(
+        groq_api_key,
+        model,
+        [agent_tool.name for agent_tool in tools],
+        lambda: build_graph(groq_api_key, model),
+    )
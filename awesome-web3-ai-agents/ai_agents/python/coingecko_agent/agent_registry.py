@@ -0,0 +1,94 @@
+#########################################################
+# LLMクライアントとコンパイル済みのグラフをプロセス全体で共有するレジストリ
+#
+# - Streamlitは操作のたびにスクリプトを先頭から再実行するが、グラフは (APIキー, モデル, ツール) ごとに1度だけ作成する
+# - 作成済みのグラフ（ChatGroqのHTTPクライアントを含む）は再実行や他のユーザーでも使い回す
+#
+# The registry key holds only the sha256 fingerprint of the API key, never the key itself.
+# Concurrent first requests for the same key build the agent once.
+#########################################################
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_REGISTRY_SIZE = 32
+
+
+class AgentRegistry:
+    """
+    LRU cache of built agents keyed by (API key fingerprint, model, tool names).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_REGISTRY_SIZE):
+        self.max_size = max_size
+        self._agents: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[Tuple, threading.Lock] = {}
+        self._counters = {'hits': 0, 'builds': 0, 'build_seconds': 0.0}
+
+    @staticmethod
+    def key(api_key: str, model: str, tool_names: Iterable[str]) -> Tuple:
+        return (hashlib.sha256(api_key.encode()).hexdigest(), model, tuple(sorted(tool_names)))
+
+    def get(self, api_key: str, model: str, tool_names: Iterable[str], build: Callable[[], Any]) -> Any:
+        """
+        Get the agent for the API key, model and tool set, building it on first use.
+
+        Args:
+            api_key (str): The LLM API key
+            model (str): The model name
+            tool_names (Iterable[str]): Names of the tools bound to the agent
+            build (Callable[[], Any]): Builds the agent (LLM client, tools, compiled graph) on a cache miss
+
+        Returns:
+            Any: The cached agent
+        """
+        key = self.key(api_key, model, tool_names)
+        with self._lock:
+            if key in self._agents:
+                self._agents.move_to_end(key)
+                self._counters['hits'] += 1
+                return self._agents[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._agents:
+                    self._counters['hits'] += 1
+                    return self._agents[key]
+            start = time.perf_counter()
+            agent = build()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._agents[key] = agent
+                self._build_locks.pop(key, None)
+                self._counters['builds'] += 1
+                self._counters['build_seconds'] += elapsed
+                while len(self._agents) > self.max_size:
+                    self._agents.popitem(last=False)
+        logging.info("Built agent for model %s with tools %s in %.1f ms", model, sorted(tool_names), elapsed * 1000)
+        return agent
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of cached agents, registry hits, builds and total build time."""
+        with self._lock:
+            return dict(self._counters, agents=len(self._agents))
+
+
+# 全セッションで共有するレジストリ
+_agent_registry: Optional[AgentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_agent_registry() -> AgentRegistry:
+    global _agent_registry
+    if _agent_registry is None:
+        with _registry_lock:
+            if _agent_registry is None:
+                _agent_registry = AgentRegistry(int(os.getenv('AGENT_REGISTRY_SIZE', DEFAULT_REGISTRY_SIZE)))
+    return _agent_registry
@@ -0,0 +1,73 @@
+#########################################################
+# トレンドデータの整形処理のベンチマーク
+#
+# 以前の clean_nested_data（ツール呼び出しごとに関数を定義し、再帰で走査する）と
+# projection.py の FieldFilter（ルールをコンパイル済み、スタックで走査する）を比較する。
+# APIへの接続は不要で、bench_data/trending_sample.json のトレンドデータを使う。
+#
+# Usage:
+#     python bench_projection.py [iterations]
+#########################################################
+
+import json
+import os
+import sys
+import timeit
+from typing import Any, Dict, List, Union
+
+from projection import FieldFilter
+
+payload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data', 'trending_sample.json')
+with open(payload_path, 'r') as payload_file:
+    raw_data = json.load(payload_file)
+
+trending_filter = FieldFilter(
+    ['price_change', 'market_cap_1h_change', 'market_cap_change_percentage_24h'],
+    limits={'coins': 1},
+)
+
+
+# 以前の実装: 呼び出しごとに関数を定義し、再帰で走査する
+def legacy_get_trending_tokens() -> Dict[str, Any]:
+    def clean_nested_data(data: Union[Dict, List, Any]) -> Union[Dict, List, Any]:
+        fields_to_exclude = [
+            'price_change',
+            'market_cap_1h_change',
+            'market_cap_change_percentage_24h'
+        ]
+        if isinstance(data, dict):
+            return {
+                key: clean_nested_data(value)
+                for key, value in data.items()
+                if not any(excluded in key.lower() for excluded in fields_to_exclude)
+            }
+        if isinstance(data, list):
+            return [clean_nested_data(item) for item in data]
+        return data
+
+    limited_data = raw_data.copy()
+    if 'coins' in limited_data and isinstance(limited_data['coins'], list):
+        limited_data['coins'] = limited_data['coins'][:1]
+    return clean_nested_data(limited_data)
+
+
+# 新しい実装: コンパイル済みのフィルターを使う
+def filtered_get_trending_tokens() -> Dict[str, Any]:
+    return trending_filter.apply(raw_data)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    # Both implementations must produce exactly the same output
+    assert legacy_get_trending_tokens() == filtered_get_trending_tokens()
+
+    results = {}
+    for label, func in (("legacy", legacy_get_trending_tokens), ("filter", filtered_get_trending_tokens)):
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        results[label] = best / iterations * 1e6
+        print(f"{label:>7}: {results[label]:10.1f} us/call")
+    print(f"speedup: {results['legacy'] / results['filter']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#########################################################
+# CoinGecko APIのレスポンスをキャッシュするクライアント
+#
+# - エンドポイントごとのTTLでレスポンスをキャッシュする
+# - 同じリクエストが同時に来た場合は1回だけAPIを呼び出す（シングルフライト）
+# - TTLが切れた後もしばらくは古い値を返し、裏で更新する（stale-while-revalidate）
+# - 429（レート制限）を受けた場合は指数バックオフの間APIを呼ばない
+#
+# The CoinGecko demo key is rate limited and most endpoints (e.g. trending) only refresh every few minutes, so
+# every chat session shares one cache in front of the CoinGeckoAPI client.
+#########################################################
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from pycoingecko import CoinGeckoAPI
+from agent_common.tracing import get_tracer
+
+# エンドポイントごとのキャッシュ有効期間（秒）
+# Trending is recomputed by CoinGecko roughly every 10 minutes, prices change much faster
+ENDPOINT_TTLS = {
+    'get_search_trending': 300,
+    'get_price': 30,
+    'get_coins_markets': 60,
+    'get_coin_by_id': 120,
+    'get_global': 120,
+}
+DEFAULT_TTL = float(os.getenv('COINGECKO_DEFAULT_TTL', 60))
+# TTLが切れた後に古い値を返してよい期間（秒）
+STALE_TTL = float(os.getenv('COINGECKO_STALE_TTL', 600))
+# 429を受けたときのバックオフ（秒）
+BACKOFF_BASE = float(os.getenv('COINGECKO_BACKOFF_BASE', 5))
+BACKOFF_MAX = float(os.getenv('COINGECKO_BACKOFF_MAX', 120))
+
+
+class CoinGeckoRateLimited(RuntimeError):
+    """Raised when CoinGecko rate limits us and there is no cached value to fall back to."""
+
+
+# 例外がレート制限（HTTP 429）によるものかを判定する
+def _is_rate_limited(error: Exception) -> bool:
+    # pycoingecko raises HTTPError for non-JSON bodies and ValueError(<json body>) otherwise
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429
+    if isinstance(error, ValueError) and error.args and isinstance(error.args[0], dict):
+        status = error.args[0].get('status') or {}
+        return status.get('error_code') == 429
+    return False
+
+
+class CachedCoinGeckoAPI:
+    """
+    Drop-in wrapper around CoinGeckoAPI that caches every endpoint method.
+
+    cg.get_search_trending() and any other CoinGeckoAPI method can be called exactly as before. Responses are
+    cached per (method, arguments) for the endpoint's TTL; concurrent misses for the same key wait for a single
+    upstream request; expired entries are served for STALE_TTL more seconds while one background refresh runs;
+    and after a 429 no request is sent until the backoff has passed.
+    """
+
+    def __init__(
+        self,
+        client: CoinGeckoAPI,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = DEFAULT_TTL,
+        stale_ttl: float = STALE_TTL,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+    ):
+        self.client = client
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # key -> (value, fetched_at)
+        self._entries: Dict[Tuple, Tuple[Any, float]] = {}
+        self._inflight: Dict[Tuple, Future] = {}
+        self._backoff_until = 0.0
+        self._rate_limit_strikes = 0
+        self._counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'errors': 0,
+            'rate_limited': 0,
+        }
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.client, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+        return lambda *args, **kwargs: self._call(name, args, kwargs)
+
+    # キャッシュキーを作成する（リストなどハッシュできない引数はreprで表す）
+    @staticmethod
+    def _key(endpoint: str, args: Tuple, kwargs: Dict) -> Tuple:
+        return (endpoint, repr(args), repr(sorted(kwargs.items())))
+
+    def _ttl(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def _call(self, endpoint: str, args: Tuple, kwargs: Dict) -> Any:
+        key = self._key(endpoint, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry[1]
+                if age < self._ttl(endpoint):
+                    self._counters['hits'] += 1
+                    return entry[0]
+                if age < self._ttl(endpoint) + self.stale_ttl or now < self._backoff_until:
+                    # Serve the stale value and refresh it in the background (once)
+                    self._counters['stale_hits'] += 1
+                    if key not in self._inflight and now >= self._backoff_until:
+                        self._counters['refreshes'] += 1
+                        self._inflight[key] = Future()
+                        threading.Thread(
+                            target=self._fetch,
+                            args=(key, endpoint, args, kwargs),
+                            name=f"coingecko-refresh-{endpoint}",
+                            daemon=True,
+                        ).start()
+                    return entry[0]
+            if now < self._backoff_until:
+                self._counters['rate_limited'] += 1
+                raise CoinGeckoRateLimited(
+                    f"CoinGecko rate limit, retry in {self._backoff_until - now:.0f} seconds"
+                )
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                self._counters['misses'] += 1
+                future = Future()
+                self._inflight[key] = future
+                leader = True
+
+        if leader:
+            self._fetch(key, endpoint, args, kwargs)
+        return future.result()
+
+    # APIを呼び出して結果をキャッシュし、待っているスレッドに結果を渡す
+    def _fetch(self, key: Tuple, endpoint: str, args: Tuple, kwargs: Dict) -> None:
+        with self._lock:
+            future = self._inflight[key]
+        method: Callable = getattr(self.client, endpoint)
+        try:
+            # Only requests that reach CoinGecko are traced, cache hits are not
+            with get_tracer().span(f"coingecko.{endpoint}"):
+                value = method(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._counters['errors'] += 1
+                if _is_rate_limited(e):
+                    self._rate_limit_strikes += 1
+                    backoff = min(self.backoff_base * 2 ** (self._rate_limit_strikes - 1), self.backoff_max)
+                    self._backoff_until = time.monotonic() + backoff
+                    logging.warning("CoinGecko rate limited on %s, backing off for %.0fs", endpoint, backoff)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._inflight.pop(key, None)
+            self._rate_limit_strikes = 0
+        future.set_result(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters of the cache.
+
+        Returns:
+            Dict[str, Any]: hits, stale_hits, misses, coalesced, refreshes, errors, rate_limited, the hit ratio,
+            the number of cached entries and the remaining backoff in seconds
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['hits'] + counters['stale_hits'] + counters['misses'] + counters['coalesced']
+            counters['hit_ratio'] = (
+                (counters['hits'] + counters['stale_hits'] + counters['coalesced']) / lookups if lookups else 0.0
+            )
+            counters['entries'] = len(self._entries)
+            counters['backoff_remaining'] = max(0.0, self._backoff_until - time.monotonic())
+        return counters
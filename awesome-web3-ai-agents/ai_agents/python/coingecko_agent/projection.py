@@ -0,0 +1,96 @@
+#########################################################
+# APIレスポンスから不要なフィールドを取り除くフィルター
+#
+# 除外ルールは1度だけコンパイルし、キーごとの判定結果をキャッシュする。
+# 再帰ではなくスタックを使ってデータを走査するので、深いデータでも関数呼び出しのコストがかからない。
+#
+# Replaces the clean_nested_data helper that used to be rebuilt inside get_trending_tokens on every call.
+#########################################################
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+
+class FieldFilter:
+    """
+    Reusable projection that drops every dict key containing one of the excluded substrings.
+
+    The substring test runs once per distinct key name, the decision is cached, so walking a large payload only
+    costs one dict lookup per key. Lists at the top level of the payload can be truncated with `limits`
+    (e.g. {'coins': 1}); the dropped items are never visited.
+
+    Usage:
+        trending_filter = FieldFilter(['price_change', 'market_cap_1h_change'], limits={'coins': 1})
+        cleaned = trending_filter.apply(raw_data)
+    """
+
+    def __init__(self, exclude: Iterable[str], limits: Optional[Dict[str, int]] = None):
+        self.exclude = tuple(substring.lower() for substring in exclude)
+        self.limits = dict(limits or {})
+        # key -> keep?
+        self._decisions: Dict[str, bool] = {}
+
+    # キーを残すかどうかを判定する（結果はキャッシュする）
+    def keep(self, key: str) -> bool:
+        decision = self._decisions.get(key)
+        if decision is None:
+            lowered = key.lower() if isinstance(key, str) else str(key).lower()
+            decision = not any(substring in lowered for substring in self.exclude)
+            self._decisions[key] = decision
+        return decision
+
+    def apply(self, data: Union[Dict, List, Any]) -> Union[Dict, List, Any]:
+        """
+        Return a filtered copy of the data. The input is not modified.
+
+        Args:
+            data: The data structure to clean (can be a dict, list, or simple value)
+
+        Returns:
+            The cleaned data structure with the excluded fields removed and the limited lists truncated
+        """
+        if isinstance(data, dict):
+            root: Union[Dict, List] = {}
+            # Truncate the limited top level lists before walking so the dropped items are never visited
+            data = {
+                key: value[:self.limits[key]] if key in self.limits and isinstance(value, list) else value
+                for key, value in data.items()
+            }
+        elif isinstance(data, list):
+            root = []
+        else:
+            return data
+
+        decisions = self._decisions
+        keep = self.keep
+        # Each entry is (source container, target container), targets are filled in place
+        stack: List[Tuple[Union[Dict, List], Union[Dict, List]]] = [(data, root)]
+        while stack:
+            source, target = stack.pop()
+            if isinstance(source, dict):
+                for key, value in source.items():
+                    decision = decisions.get(key)
+                    if decision is None:
+                        decision = keep(key)
+                    if not decision:
+                        continue
+                    if isinstance(value, dict):
+                        child: Union[Dict, List] = {}
+                    elif isinstance(value, list):
+                        child = []
+                    else:
+                        target[key] = value
+                        continue
+                    target[key] = child
+                    stack.append((value, child))
+            else:
+                for value in source:
+                    if isinstance(value, dict):
+                        child = {}
+                    elif isinstance(value, list):
+                        child = []
+                    else:
+                        target.append(value)
+                        continue
+                    target.append(child)
+                    stack.append((value, child))
+        return root
@@ -0,0 +1,241 @@
+#########################################################
+# Web検索（Tavily）の結果をSQLiteに保存するキャッシュ
+#
+# - クエリを正規化（小文字化・空白の統一・記号とストップワードの除去）してキーにする
+# - 価格やニュースなど変化の速い話題のクエリは短いTTL、それ以外は長いTTLで保存する
+# - SQLiteファイルに保存するため、アプリを再起動してもキャッシュが残る
+# - SEARCH_CACHE_SEMANTIC=true の場合、ローカルの埋め込みモデル（sentence-transformers）で
+#   意味的にほぼ同じクエリもキャッシュから返す
+#
+# "advanced" Tavily searches are the slowest and most expensive tool call of the agent, and users tend to ask the
+# same market questions again and again. The cache is shared by every chat session of the process.
+#########################################################
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import orjson
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(current_dir, 'search_cache.sqlite3')
+# キャッシュの有効期間（秒）
+DEFAULT_TTL = 6 * 60 * 60
+# 価格・ニュースなど変化の速いクエリの有効期間（秒）
+VOLATILE_TTL = 10 * 60
+# 意味的に同じクエリとみなすコサイン類似度の下限
+SIMILARITY_THRESHOLD = 0.92
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Words that do not change what is searched for
+STOP_WORDS = frozenset(
+    'a an the of for to in on at by with about from and or is are was were be been what whats which who how '
+    'do does did can could please tell me show give find search look up online web i you my your it its '
+    'this that these those there any some'.split()
+)
+# Queries about these topics go stale quickly
+VOLATILE_WORDS = frozenset(
+    'price prices today now current currently latest news live trending pump dump 24h hour hours tonight '
+    '価格 最新 今日 現在 ニュース'.split()
+)
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query to its cache key: NFKC, lower case, words only, stop words removed.
+
+    "What is the Bitcoin price today?" and "bitcoin  PRICE today" share the key "bitcoin price today".
+    Word order is kept, it can change the meaning ("eth to btc" / "btc to eth"), reworded queries are left to
+    the semantic lookup.
+    """
+    words = _TOKEN_PATTERN.findall(unicodedata.normalize('NFKC', query).lower())
+    kept = [word for word in words if word not in STOP_WORDS]
+    # A query made only of stop words keeps them, otherwise it would collide with every other such query
+    return ' '.join(kept or words)
+
+
+# クエリの内容から有効期間を決める
+def ttl_for(normalized_query: str, default_ttl: float = DEFAULT_TTL, volatile_ttl: float = VOLATILE_TTL) -> float:
+    words = set(normalized_query.split())
+    if words & VOLATILE_WORDS or any(word in normalized_query for word in VOLATILE_WORDS if not word.isascii()):
+        return volatile_ttl
+    return default_ttl
+
+
+# ローカルの埋め込みモデルを読み込む（sentence-transformers が無い場合は None）
+def local_embedder(model_name: str = EMBEDDING_MODEL) -> Optional[Callable[[str], Sequence[float]]]:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logging.warning("sentence-transformers is not installed, the semantic search cache is disabled")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text, normalize_embeddings=True).tolist()
+
+
+class SearchCache:
+    """
+    SQLite backed cache of web search results keyed by the normalized query.
+
+    Lookups first try the exact normalized query. If an embedding function is given, a miss then compares the
+    query's embedding with the embeddings of the unexpired entries and returns the closest one above the
+    similarity threshold. Expired rows are deleted when the cache is opened and on every write.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+        default_ttl: float = DEFAULT_TTL,
+        volatile_ttl: float = VOLATILE_TTL,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+    ):
+        self.path = path
+        self.embed = embed
+        self.default_ttl = default_ttl
+        self.volatile_ttl = volatile_ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'semantic_hits': 0, 'misses': 0, 'writes': 0}
+        # One connection shared by the threads of the process, every access holds the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS search_cache ('
+                ' query_key TEXT PRIMARY KEY,'
+                ' query TEXT NOT NULL,'
+                ' results BLOB NOT NULL,'
+                ' embedding BLOB,'
+                ' created_at REAL NOT NULL,'
+                ' expires_at REAL NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS search_cache_expires ON search_cache (expires_at)')
+            self._purge(time.time())
+
+    def _purge(self, now: float) -> None:
+        self._connection.execute('DELETE FROM search_cache WHERE expires_at <= ?', (now,))
+
+    def get(self, query: str) -> Optional[Any]:
+        """
+        Get the cached results for a query.
+
+        Args:
+            query (str): The search query as sent by the LLM
+
+        Returns:
+            Optional[Any]: The cached results, None on a miss
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT results FROM search_cache WHERE query_key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row is not None:
+                self._counters['hits'] += 1
+                return orjson.loads(row[0])
+
+        if self.embed is not None:
+            # Embedding outside the lock, the model is the slow part
+            match = self._nearest(self.embed(key), now)
+            if match is not None:
+                cached_query, results = match
+                logging.info("Search cache: '%s' answered by the similar query '%s'", query, cached_query)
+                with self._lock:
+                    self._counters['semantic_hits'] += 1
+                return results
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    # 埋め込みが最も近いキャッシュを探す
+    def _nearest(self, embedding: Sequence[float], now: float) -> Optional[Tuple[str, Any]]:
+        import numpy as np  # installed with sentence-transformers
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT query, results, embedding FROM search_cache WHERE embedding IS NOT NULL AND expires_at > ?',
+                (now,),
+            ).fetchall()
+        if not rows:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        # Embeddings are stored normalized, the dot product is the cosine similarity
+        similarities = matrix @ (vector / (np.linalg.norm(vector) or 1.0))
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return rows[best][0], orjson.loads(rows[best][1])
+
+    def put(self, query: str, results: Any) -> None:
+        """
+        Store the results of a query with the TTL of its topic.
+
+        Args:
+            query (str): The search query as sent by the LLM
+            results (Any): JSON serializable search results
+        """
+        key = normalize_query(query)
+        now = time.time()
+        embedding = None
+        if self.embed is not None:
+            import numpy as np
+
+            vector = np.asarray(self.embed(key), dtype=np.float32)
+            embedding = (vector / (np.linalg.norm(vector) or 1.0)).tobytes()
+        with self._lock, self._connection:
+            self._purge(now)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO search_cache (query_key, query, results, embedding, created_at, expires_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (key, query, orjson.dumps(results), embedding, now,
+                 now + ttl_for(key, self.default_ttl, self.volatile_ttl)),
+            )
+            self._counters['writes'] += 1
+
+    def get_or_search(self, query: str, search: Callable[[str], Any]) -> Any:
+        """
+        Return the cached results for the query, or run the search and cache its results.
+
+        Results that are not a list (Tavily returns an error string on failure) are passed through uncached.
+        """
+        results = self.get(query)
+        if results is not None:
+            return results
+        results = search(query)
+        if isinstance(results, list):
+            self.put(query, results)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connection.execute('SELECT COUNT(*) FROM search_cache').fetchone()[0]
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['semantic_hits'] + counters['misses']
+        counters['hit_ratio'] = round((counters['hits'] + counters['semantic_hits']) / lookups, 3) if lookups else 0.0
+        counters['entries'] = entries
+        counters['semantic'] = self.embed is not None
+        return counters
+
+
+# 環境変数の設定からキャッシュを作成する（.env の読み込み後に呼び出す）
+def search_cache_from_env() -> SearchCache:
+    embed = None
+    if os.getenv('SEARCH_CACHE_SEMANTIC', 'false').lower() == 'true':
+        embed = local_embedder(os.getenv('SEARCH_CACHE_EMBEDDING_MODEL') or EMBEDDING_MODEL)
+    return SearchCache(
+        path=os.getenv('SEARCH_CACHE_PATH') or DEFAULT_CACHE_PATH,
+        embed=embed,
+        default_ttl=float(os.getenv('SEARCH_CACHE_TTL', DEFAULT_TTL)),
+        volatile_ttl=float(os.getenv('SEARCH_CACHE_VOLATILE_TTL', VOLATILE_TTL)),
+        similarity_threshold=float(os.getenv('SEARCH_CACHE_SIMILARITY', SIMILARITY_THRESHOLD)),
+    )
@@ -0,0 +1,179 @@
+#########################################################
+# ツールを並列に実行するための実行環境
+#
+# - ツールはプロセス共通のスレッドプールで実行し、同時に実行するツールの数を TOOL_MAX_CONCURRENCY で制限する
+# - ツールごとにタイムアウトを設定し、時間内に終わらないツールはエラーとしてLLMに返す
+# - ツールごとの所要時間（平均・p95・最大）、エラー数、タイムアウト数を記録する
+#
+# get_trending_tokens (pycoingecko / requests) and search (Tavily) are blocking network calls. When the LLM asks
+# for both in one message, ToolNode fans the calls out (a thread per call for invoke, gather for ainvoke) and the
+# turn waits for the slowest call instead of the sum. The wrapper keeps the tool's name, description and args
+# schema, so the LLM sees exactly the same tools.
+#########################################################
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30.0
+# 所要時間の統計に使う直近の呼び出し数
+LATENCY_WINDOW = 200
+
+
+class ToolTimeout(TimeoutError):
+    """Raised when a tool does not finish within its timeout, ToolNode turns it into an error ToolMessage."""
+
+
+class ToolLatency:
+    """
+    Per tool record of the latency of the recent calls, errors and timeouts.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, outcome: str = 'ok') -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            counters = self._counters.setdefault(name, {'calls': 0, 'errors': 0, 'timeouts': 0})
+            counters['calls'] += 1
+            if outcome != 'ok':
+                counters[f"{outcome}s"] += 1
+        logging.info("Tool %s finished in %.0f ms (%s)", name, seconds * 1000, outcome)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """One row per tool: calls, errors, timeouts and avg/p95/max latency (ms) of the recent calls."""
+        with self._lock:
+            snapshot = {name: (sorted(samples), dict(self._counters[name])) for name, samples in self._samples.items()}
+        rows = []
+        for name, (samples, counters) in snapshot.items():
+            rows.append(dict(
+                tool=name,
+                **counters,
+                avg_ms=round(sum(samples) / len(samples) * 1000, 1),
+                p95_ms=round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                max_ms=round(samples[-1] * 1000, 1),
+            ))
+        return rows
+
+
+class ToolRuntime:
+    """
+    Runs tools on a bounded thread pool with per tool timeouts and latency recording.
+
+    Usage:
+        runtime = ToolRuntime(max_concurrency=4, timeouts={"search": 20})
+        tools = runtime.wrap([get_trending_tokens, search])
+        ToolNode(tools=tools)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeouts: Optional[Dict[str, float]] = None,
+        default_timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.latency = ToolLatency()
+        # The pool size is the concurrency limit, calls beyond it wait in the pool's queue
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='tool')
+
+    def timeout_for(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    # ツールを実行して所要時間を記録する（スレッドプール上で実行される）
+    def _run(self, agent_tool: BaseTool, kwargs: Dict[str, Any], call: Dict[str, Any]) -> Any:
+        try:
+            result = agent_tool.invoke(kwargs)
+        except Exception:
+            self._finish(agent_tool, call, 'error')
+            raise
+        self._finish(agent_tool, call, 'ok')
+        return result
+
+    # 1回の呼び出しにつき1度だけ記録する（タイムアウト後に終わった呼び出しは記録しない）
+    def _finish(self, agent_tool: BaseTool, call: Dict[str, Any], outcome: str) -> None:
+        with call['lock']:
+            if call['done']:
+                return
+            call['done'] = True
+        self.latency.record(agent_tool.name, time.perf_counter() - call['submitted_at'], outcome)
+
+    def _submit(self, agent_tool: BaseTool, kwargs: Dict[str, Any]):
+        call = {'submitted_at': time.perf_counter(), 'done': False, 'lock': threading.Lock()}
+        return self._executor.submit(self._run, agent_tool, kwargs, call), call
+
+    def _timed_out(self, agent_tool: BaseTool, call: Dict[str, Any], timeout: float) -> ToolTimeout:
+        # The worker thread cannot be stopped, its late result is dropped
+        self._finish(agent_tool, call, 'timeout')
+        logging.warning("Tool %s timed out after %ss", agent_tool.name, timeout)
+        return ToolTimeout(f"{agent_tool.name} did not respond within {timeout} seconds, try again later")
+
+    def wrap_tool(self, agent_tool: BaseTool) -> StructuredTool:
+        """
+        Build a tool with the same name, description and args schema that runs on the pool with its timeout.
+
+        Args:
+            agent_tool (BaseTool): The tool from tools.py
+
+        Returns:
+            StructuredTool: A tool whose invoke() and ainvoke() both run the original on the pool
+        """
+        timeout = self.timeout_for(agent_tool.name)
+
+        def func(**kwargs: Any) -> Any:
+            future, call = self._submit(agent_tool, kwargs)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise self._timed_out(agent_tool, call, timeout) from None
+
+        async def coroutine(**kwargs: Any) -> Any:
+            future, call = self._submit(agent_tool, kwargs)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out(agent_tool, call, timeout) from None
+
+        return StructuredTool(
+            name=agent_tool.name,
+            description=agent_tool.description,
+            args_schema=agent_tool.args_schema,
+            func=func,
+            coroutine=coroutine,
+        )
+
+    def wrap(self, agent_tools: Iterable[BaseTool]) -> List[StructuredTool]:
+        return [self.wrap_tool(agent_tool) for agent_tool in agent_tools]
+
+
+# 全セッションで共有する実行環境（.env の読み込み後に作成する）
+_tool_runtime: Optional[ToolRuntime] = None
+_tool_runtime_lock = threading.Lock()
+
+
+def get_tool_runtime(timeouts: Optional[Dict[str, float]] = None) -> ToolRuntime:
+    global _tool_runtime
+    if _tool_runtime is None:
+        with _tool_runtime_lock:
+            if _tool_runtime is None:
+                _tool_runtime = ToolRuntime(
+                    max_concurrency=int(os.getenv('TOOL_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)),
+                    timeouts=timeouts,
+                    default_timeout=float(os.getenv('TOOL_TIMEOUT', DEFAULT_TIMEOUT)),
+                )
+    return _tool_runtime
@@ -3,20 +3,44 @@
 #########################################################
 
 import os
-from typing import Any, Dict, List, Union
+from typing import Any, Dict
 
+from coingecko_cache import CachedCoinGeckoAPI
 from dotenv import load_dotenv
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.tools import tool
+from projection import FieldFilter
 from pycoingecko import CoinGeckoAPI
+from search_cache import search_cache_from_env
+from agent_common.tracing import get_tracer
 
 load_dotenv()
 
 # CoinGecko APIを使うためのクライアントインスタンスの定義
-cg = CoinGeckoAPI(demo_api_key=os.getenv('coingecko_api_key'))
+# 全セッションで共有するキャッシュ付きクライアント（TTL・シングルフライト・429バックオフ）
+cg = CachedCoinGeckoAPI(CoinGeckoAPI(demo_api_key=os.getenv('coingecko_api_key')))
 # TavilySearchResultsクラスのインスタンスを作成
 os.environ["TAVILY_API_KEY"] = os.getenv('TAVILY_API_KEY')
 tavily_client = TavilySearchResults(max_results=2, search_depth="advanced")
+# 検索結果のキャッシュ（SQLiteファイルに保存し、再起動後も使う）
+search_cache = search_cache_from_env()
+
+# トレンドデータから取り除くフィールド（除外ルールは起動時に1度だけコンパイルする）
+# Drops any field containing 'price_change' plus the market cap change fields, and keeps only the first coin
+trending_filter = FieldFilter(
+    [
+        'price_change',
+        'market_cap_1h_change',
+        'market_cap_change_percentage_24h',
+    ],
+    limits={'coins': 1},
+)
+
+# Tavilyで検索する（キャッシュに無い場合だけ呼ばれる）
+def _tavily_search(query: str) -> Any:
+    with get_tracer().span("tavily.search", search_depth="advanced"):
+        return tavily_client.invoke({"query": query})
+
 
 # 検索ツール
 # ユーザーからの検索クエリを受け取り、Web検索を行い、その結果を辞書形式で返します。
@@ -33,7 +57,9 @@ def search(user_query: str) -> Dict:
     Returns:
         Dict[str, Any]: Responses to the user quesry which contains multiple web search results.
     """
-    return tavily_client.invoke({"query": user_query})
+    # Identical (after normalization) or, if enabled, similar queries are answered from the cache
+    # 同じ（または意味的に近い）クエリはキャッシュから返す
+    return search_cache.get_or_search(user_query, _tavily_search)
 
 # トレンドトークンを取得するツール
 # CoinGecko APIを使って、24時間でトレンドとなっている暗号通貨を取得します。
@@ -54,55 +80,10 @@ def get_trending_tokens() -> Dict[str, Any]:
         with specified fields removed.
     """
 
-    # データクリーニング関数
-    # 再帰的に辞書やリストの中身を処理する。
-    def clean_nested_data(data: Union[Dict, List, Any]) -> Union[Dict, List, Any]:
-        """
-        Recursively cleans nested data structures by removing specified fields.
-        
-        This function removes:
-        - Any field containing 'price_change' in its name
-        - The 'market_cap_1h_change' field
-        
-        Args:
-            data: The data structure to clean (can be a dict, list, or simple value)
-            
-        Returns:
-            The cleaned data structure with specified fields removed
-        """
-        # Create a list of fields we want to exclude
-        fields_to_exclude = [
-            'price_change',
-            'market_cap_1h_change',
-            'market_cap_change_percentage_24h'
-        ]
-        
-        # Handle dictionaries
-        if isinstance(data, dict):
-            return {
-                key: clean_nested_data(value)
-                for key, value in data.items()
-                if not any(excluded in key.lower() for excluded in fields_to_exclude)
-            }
-        
-        # Handle lists
-        if isinstance(data, list):
-            return [clean_nested_data(item) for item in data]
-        
-        # Return unchanged data for other types
-        return data
-
-    # Get raw data from CoinGecko
+    # Get raw data from CoinGecko (cached, see coingecko_cache.py)
     # トレンドデータ取得と整形
     raw_data = cg.get_search_trending()
-    
-    # Create a new dictionary with only the top 3 coins
-    limited_data = raw_data.copy()
-    
-    # Limit the coins list to the first 3 entries while preserving other data
-    if 'coins' in limited_data and isinstance(limited_data['coins'], list):
-        limited_data['coins'] = limited_data['coins'][:1] # Only returns the "coins" section of the API
-    
-    # Clean the limited data and return it
+
+    # Only the first entry of "coins" is kept, the excluded fields are removed everywhere
     # データをスクリーニングして返却する。
-    return clean_nested_data(limited_data)
\ No newline at end of file
+    return trending_filter.apply(raw_data)
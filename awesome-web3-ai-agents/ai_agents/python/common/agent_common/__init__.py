@@ -0,0 +1,13 @@
+"""
+Agent Common
+-------------------
+What:
+複数のエージェントで共有するモジュールです。各アプリの requirements.txt から `-e ../common` でインストールされます。
+
+Modules shared by the Python agents, so that a fix lands once instead of in every app.
+
+Modules:
+    streaming: Rendering of the streamed graph output (LLM tokens and tool progress)
+    tool_output: Compaction of oversized tool outputs and the get_full_tool_output side store
+    tracing: Spans, latency histograms and the LangChain callback handler
+"""
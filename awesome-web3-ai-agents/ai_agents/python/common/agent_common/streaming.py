@@ -0,0 +1,80 @@
+"""
+Streaming
+-------------------
+What:
+グラフの実行結果をストリーミングで画面に表示します。LLMのトークンは生成されるたびに表示し、
+ツールの呼び出しと完了は進捗として表示するため、エージェントの処理がすべて終わるのを待つ必要がありません。
+
+The graph is streamed with stream_mode=["messages", "updates"]:
+    - "messages" yields (message chunk, metadata) for every token the LLM produces, only the chunks of the
+      chatbot node are rendered (the summary call of the memory policy is not shown)
+    - "updates" yields {node: update} after every node, used for the tool progress (tool calls requested by the
+      chatbot node, ToolMessages returned by the tools node) and for the final answer
+
+Usage:
+    chunks = graph.stream(inputs, config, stream_mode=STREAM_MODES)
+    answer = render_stream(chunks, placeholder, status)
+
+render_stream takes any iterable of chunks, aave_agent passes stream_async(graph.astream(...)) to run the graph
+on its event loop.
+
+Functions:
+    render_stream
+"""
+
+from typing import Any, Iterable, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+STREAM_MODES = ["messages", "updates"]
+# Shown after the text while the LLM is still generating
+CURSOR = "▌"
+
+
+# ストリーミングの出力を画面に描画するメソッド
+def render_stream(chunks: Iterable[Tuple[str, Any]], placeholder: Any, status: Any) -> str:
+    """
+    Render a graph stream incrementally and return the final answer.
+
+    Args:
+        chunks (Iterable[Tuple[str, Any]]): (mode, payload) pairs of graph.stream/astream with STREAM_MODES
+        placeholder: Receives the answer text via markdown(), e.g. st.empty()
+        status: Receives the tool progress via write() and update(), e.g. st.status()
+
+    Returns:
+        str: The content of the last message of the chatbot node
+    """
+    text = ""
+    answer = ""
+    tool_calls = 0
+    for mode, payload in chunks:
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "chatbot" or not isinstance(chunk, AIMessageChunk):
+                continue
+            if isinstance(chunk.content, str) and chunk.content:
+                text += chunk.content
+                placeholder.markdown(text + CURSOR)
+            continue
+
+        for node, update in payload.items():
+            for message in (update or {}).get("messages", []):
+                if node == "chatbot" and isinstance(message, AIMessage):
+                    if message.tool_calls:
+                        # Any text before the tool calls is not the answer, the next LLM call starts a new one
+                        text = ""
+                        placeholder.markdown("")
+                        for tool_call in message.tool_calls:
+                            tool_calls += 1
+                            status.update(label=f"Running {tool_call['name']}...", state="running")
+                            status.write(f"🔧 `{tool_call['name']}` {tool_call['args']}")
+                    else:
+                        answer = message.content
+                elif node == "tools" and isinstance(message, ToolMessage):
+                    icon = "❌" if message.status == "error" else "✅"
+                    status.write(f"{icon} `{message.name}` finished")
+
+    status.update(label=f"Done ({tool_calls} tool call(s))", state="complete", expanded=False)
+    answer = answer or text
+    placeholder.markdown(answer)
+    return answer
@@ -0,0 +1,241 @@
+"""
+Tool Output
+-------------------
+What:
+ツールの出力をLLMに渡す前に圧縮します。ツールごとのトークン予算を超えた出力は、ネストしたJSONではなく
+表形式（CSV）の要約に変換し、元の出力はサイドストアに保存して get_full_tool_output ツールで取り出せるようにします。
+
+Tool outputs are stringified whole into ToolMessages and re-sent to the LLM on every later step of the turn.
+The ToolOutputCompactor node runs right after the ToolNode and replaces every oversized ToolMessage with a
+compact summary plus a reference into the side store.
+
+Environment:
+    TOOL_OUTPUT_TOKEN_BUDGET: Default token budget per tool output (default 300)
+    TOOL_OUTPUT_STORE_SIZE: Number of full outputs kept in the side store (default 256)
+    TOOL_OUTPUT_FULL_LIMIT: Token cap of get_full_tool_output (default 2000)
+
+Functions:
+    get_full_tool_output
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import tool
+
+# Rough estimate for Llama style tokenizers, good enough to enforce a budget
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.getenv('TOOL_OUTPUT_TOKEN_BUDGET', 300))
+# サイドストアに保存する出力の最大数
+STORE_SIZE = int(os.getenv('TOOL_OUTPUT_STORE_SIZE', 256))
+# get_full_tool_output の出力の上限（トークン）
+FULL_OUTPUT_TOKEN_LIMIT = int(os.getenv('TOOL_OUTPUT_FULL_LIMIT', 2000))
+
+
+# 文字列のおおよそのトークン数を計算する
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class ToolOutputStore:
+    """
+    Bounded side store (LRU) for the full tool outputs that were compacted.
+    """
+
+    def __init__(self, max_size: int = STORE_SIZE):
+        self.max_size = max_size
+        self._outputs: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, payload: Any) -> str:
+        ref = uuid.uuid4().hex[:10]
+        with self._lock:
+            self._outputs[ref] = payload
+            while len(self._outputs) > self.max_size:
+                self._outputs.popitem(last=False)
+        return ref
+
+    def get(self, ref: str) -> Optional[Any]:
+        with self._lock:
+            if ref not in self._outputs:
+                return None
+            self._outputs.move_to_end(ref)
+            return self._outputs[ref]
+
+
+# 全セッションで共有するサイドストア
+store = ToolOutputStore()
+
+
+# 値を短い文字列に変換する（浮動小数点は有効数字6桁に丸める）
+def _scalar(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if value is None:
+        return ""
+    return str(value)
+
+
+# ネストした辞書を "a.b" 形式のキーを持つ1階層の辞書に変換する
+def _flatten(value: Dict, prefix: str = "") -> Dict[str, str]:
+    flat: Dict[str, str] = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict):
+            flat.update(_flatten(item, f"{name}."))
+        elif isinstance(item, list):
+            if all(not isinstance(element, (dict, list)) for element in item):
+                flat[name] = "|".join(_scalar(element) for element in item)
+            else:
+                flat[name] = f"[{len(item)} items]"
+        else:
+            flat[name] = _scalar(item)
+    return flat
+
+
+# 辞書のリストをCSVに変換する
+def _table(rows: List[Dict]) -> str:
+    flat_rows = [_flatten(row) for row in rows]
+    columns: List[str] = []
+    for row in flat_rows:
+        columns.extend(column for column in row if column not in columns)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(flat_rows)
+    return buffer.getvalue().rstrip("\n")
+
+
+def to_compact_text(payload: Any) -> str:
+    """
+    Render a tool output as compact text: lists of records become CSV tables, nested dicts become key=value lines.
+
+    Args:
+        payload: The tool output (already parsed from JSON if possible)
+
+    Returns:
+        str: The compact rendering
+    """
+    if isinstance(payload, list):
+        if payload and all(isinstance(item, dict) for item in payload):
+            return _table(payload)
+        return "\n".join(_scalar(item) if not isinstance(item, (dict, list)) else json.dumps(item) for item in payload)
+    if isinstance(payload, dict):
+        lines = []
+        scalars = {}
+        for key, value in payload.items():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                lines.append(f"{key}:")
+                lines.append(_table(value))
+            elif isinstance(value, dict):
+                scalars.update(_flatten(value, f"{key}."))
+            else:
+                scalars.update(_flatten({key: value}))
+        return "\n".join([f"{key}={value}" for key, value in scalars.items()] + lines)
+    return _scalar(payload)
+
+
+# 予算に収まるように行単位で切り詰める
+def _truncate(text: str, budget: int, note: str) -> str:
+    limit = budget * CHARS_PER_TOKEN - len(note) - 1
+    if len(text) <= limit:
+        return text
+    lines = text.split("\n")
+    kept, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > limit:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    omitted = len(lines) - len(kept)
+    return "\n".join(kept + [note.format(omitted=omitted)])
+
+
+class ToolOutputCompactor:
+    """
+    LangGraph node that compacts the ToolMessages produced by the preceding ToolNode.
+
+    Outputs within their tool's budget are passed through unchanged. Larger outputs are stored in the side
+    store and replaced (same message id) by a compact rendering truncated to the budget, ending with the
+    reference to pass to get_full_tool_output.
+
+    Usage:
+        graph_builder.add_node("compact", ToolOutputCompactor({"search": 500}))
+        graph_builder.add_edge("tools", "compact")
+        graph_builder.add_edge("compact", "chatbot")
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, default_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+
+    def compact(self, message: ToolMessage) -> Optional[ToolMessage]:
+        """Return the compacted replacement of a ToolMessage, None if it already fits its budget."""
+        if message.name == get_full_tool_output.name or not isinstance(message.content, str):
+            return None
+        budget = self.budgets.get(message.name, self.default_budget)
+        if estimate_tokens(message.content) <= budget:
+            return None
+        try:
+            payload = json.loads(message.content)
+        except ValueError:
+            payload = message.content
+        ref = store.put(payload)
+        note = f"... [{{omitted}} more lines, full output: get_full_tool_output(ref=\"{ref}\")]"
+        compact_text = to_compact_text(payload)
+        content = _truncate(compact_text, budget, note)
+        if content == compact_text:
+            content += f"\n[full output: get_full_tool_output(ref=\"{ref}\")]"
+        return ToolMessage(
+            content=content,
+            tool_call_id=message.tool_call_id,
+            name=message.name,
+            id=message.id,
+        )
+
+    def __call__(self, state: Dict) -> Dict:
+        replacements = []
+        # Only the ToolMessages of the last tool step, i.e. the trailing ones
+        for message in reversed(state["messages"]):
+            if not isinstance(message, ToolMessage):
+                break
+            compacted = self.compact(message)
+            if compacted is not None:
+                replacements.append(compacted)
+        return {"messages": replacements}
+
+
+# 圧縮前のツールの出力を取得するツール
+@tool
+def get_full_tool_output(ref: str, path: str = "") -> Any:
+    """
+    Fetch the full output of an earlier tool call that was shortened to save space.
+
+    Only use this if the shortened output does not contain what the user asked for.
+
+    Args:
+        ref: The reference shown at the end of the shortened tool output
+        path: Optional dot separated path into the output, e.g. "coins.0.item" to fetch only that part
+
+    Returns:
+        The full (or selected part of the) tool output, or an error message if the reference is unknown
+    """
+    payload = store.get(ref)
+    if payload is None:
+        return f"Unknown or expired reference: {ref}"
+    for part in filter(None, path.split(".")):
+        try:
+            payload = payload[int(part)] if isinstance(payload, list) else payload[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            return f"Path {path} not found in the output"
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    if estimate_tokens(text) > FULL_OUTPUT_TOKEN_LIMIT:
+        text = text[:FULL_OUTPUT_TOKEN_LIMIT * CHARS_PER_TOKEN] + "... [cut, use a narrower path]"
+    return text
@@ -0,0 +1,373 @@
+"""
+Tracing
+-------------------
+What:
+処理時間を計測するための軽量なトレーシングです（OpenTelemetryのスパンに近い形式）。
+LLMの呼び出し、ツール、RPC、トランザクションの確定待ちなどをスパンとして記録し、スパン名ごとのヒストグラムを集計します。
+記録したスパンはファイル（JSON Lines）またはコンソールに出力できます。
+
+A span has a name, trace/span/parent ids, a start time, a duration, attributes and a status. Spans nest through a
+context variable, so a span opened inside another one (also across awaits) becomes its child. Every finished span
+is added to the latency histogram of its name and handed to the exporter:
+
+    with get_tracer().span("rpc.eth_call", endpoint=url):
+        ...
+
+    @traced("tool.get_portfolio")
+    def get_portfolio(...): ...
+
+LLM and tool calls of LangChain / LangGraph are traced by passing TracingCallbackHandler in the run config:
+
+    graph.invoke(inputs, {"callbacks": [get_tracer().callback_handler()]})
+
+Environment:
+    TRACE_EXPORTER: "none" (default, histograms only), "console" or "file"
+    TRACE_FILE: Path of the JSON Lines file of the file exporter (default traces.jsonl)
+
+Shared by every agent (aave_agent, coingecko_agent, browser_use_agent and gaia/cdp-sample), each app imports it
+from the agent_common package: from agent_common.tracing import get_tracer
+
+Functions:
+    get_tracer
+    traced
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+# Built in python imports
+import os
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in milliseconds, the same as the OpenTelemetry default for durations
+DEFAULT_BUCKETS = (5, 10, 25, 50, 75, 100, 250, 500, 750, 1000, 2500, 5000, 7500, 10000)
+# 画面表示用に保持する直近のスパン数
+RECENT_SPANS = 200
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_time', 'duration_ms', 'attributes', 'status',
+                 'error', '_start')
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the span started, e.g. for a time-to-first-token attribute."""
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'status': self.status,
+            'error': self.error,
+        }
+
+
+class Histogram:
+    """
+    Fixed bucket latency histogram (milliseconds) with count, sum, min and max.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One more bucket for the values above the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.errors = 0
+
+    def record(self, value_ms: float, error: bool = False) -> None:
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+        if error:
+            self.errors += 1
+
+    # バケットからパーセンタイルを推定する（バケット内は線形補間）
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(max(estimate, self.min), self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5), 2),
+            'p95_ms': round(self.percentile(0.95), 2),
+            'p99_ms': round(self.percentile(0.99), 2),
+            'max_ms': round(self.max, 2),
+        }
+
+
+class ConsoleExporter:
+    """Prints one line per finished span to stderr."""
+
+    def export(self, span: Span) -> None:
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        status = "" if span.status == 'ok' else f" ERROR {span.error}"
+        print(f"[trace] {span.name} {span.duration_ms:.1f}ms {attributes}{status}", file=sys.stderr)
+
+
+class FileExporter:
+    """Appends every finished span as one JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, 'a') as trace_file:
+                trace_file.write(line + "\n")
+
+
+class Tracer:
+    """
+    Creates spans, aggregates their durations into per name histograms and exports them.
+    """
+
+    def __init__(self, exporter: Optional[Any] = None, recent: int = RECENT_SPANS):
+        self.exporter = exporter
+        self._histograms: Dict[str, Histogram] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+        """Start a span without making it current, end it with end_span(). Used by callbacks."""
+        return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.duration_ms = span.elapsed_ms()
+        if error is not None:
+            span.status = 'error'
+            span.error = f"{type(error).__name__}: {error}"
+        self._finish(span)
+
+    def record(self, name: str, duration_seconds: float, **attributes: Any) -> None:
+        """Record an operation measured elsewhere, e.g. the time from submission to confirmation of a tx."""
+        span = Span(name, _current_span.get(), attributes)
+        span.duration_ms = duration_seconds * 1000
+        span.start_time = time.time() - duration_seconds
+        self._finish(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Time the enclosed block as a span, nested under the current span.
+
+        Args:
+            name (str): Span name, also the histogram name, e.g. "rpc.eth_call"
+            **attributes: Attributes of the span, more can be added with span.set_attribute()
+
+        Yields:
+            Span: The span
+        """
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _current_span.reset(token)
+            self.end_span(span, e)
+            raise
+        _current_span.reset(token)
+        self.end_span(span)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = Histogram()
+            histogram.record(span.duration_ms, span.status == 'error')
+            self._recent.append(span.to_dict())
+        if self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.warning("Span export failed: %s", e)
+
+    def histograms(self) -> List[Dict[str, Any]]:
+        """One row per span name: count, errors, avg/p50/p95/p99/max in milliseconds."""
+        with self._lock:
+            return [dict(name=name, **histogram.summary()) for name, histogram in sorted(self._histograms.items())]
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """The most recent finished spans, newest first."""
+        with self._lock:
+            return list(self._recent)[::-1][:limit]
+
+    def callback_handler(self) -> "TracingCallbackHandler":
+        return TracingCallbackHandler(self)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler recording a span per LLM call ("llm.<model>") and per tool call ("tool.<name>").
+
+    Spans of nested runs are linked through the run ids, e.g. a tool span is a child of the graph run that
+    started it when the graph run is traced as well.
+    """
+
+    # Cheap and thread safe, no need to run it in an executor from async runs
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Span] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, **attributes: Any) -> None:
+        with self._lock:
+            parent = self._spans.get(parent_run_id) if parent_run_id else None
+        span = self.tracer.start_span(name, parent=parent, **attributes)
+        with self._lock:
+            self._spans[run_id] = span
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        span.attributes.update({key: value for key, value in attributes.items() if value is not None})
+        self.tracer.end_span(span, error)
+
+    @staticmethod
+    def _model_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+        params = kwargs.get('invocation_params') or {}
+        return params.get('model') or params.get('model_name') or (serialized or {}).get('name') or 'unknown'
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, f"llm.{self._model_name(serialized, kwargs)}",
+                    messages=sum(len(batch) for batch in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, f"llm.{self._model_name(serialized, kwargs)}", prompts=len(prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        self._end(run_id, input_tokens=usage.get('prompt_tokens'), output_tokens=usage.get('completion_tokens'))
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, f"tool.{(serialized or {}).get('name', 'unknown')}")
+
+    def on_tool_end(self, output: Any, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+
+"""
+Shared instance -> GLOBAL VARIABLES
+"""
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+# 環境変数の設定からエクスポーターを作成するメソッド
+def _exporter_from_env() -> Optional[Any]:
+    exporter = os.getenv("TRACE_EXPORTER", "none").lower()
+    if exporter == "console":
+        return ConsoleExporter()
+    if exporter == "file":
+        return FileExporter(os.getenv("TRACE_FILE") or "traces.jsonl")
+    return None
+
+
+# 共有のトレーサーを取得するメソッド
+def get_tracer() -> Tracer:
+    """
+    Get the process-wide tracer, its exporter is configured by TRACE_EXPORTER.
+
+    Returns:
+        Tracer: The shared tracer
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(_exporter_from_env())
+    return _tracer
+
+
+# 関数の処理時間をスパンとして記録するデコレーター
+def traced(name: str, **attributes: Any) -> Callable:
+    """
+    Decorator recording every call of a sync or async function as a span.
+
+    Args:
+        name (str): Span name
+        **attributes: Attributes added to every span
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with get_tracer().span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_tracer().span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -10,6 +10,7 @@ from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
+from agent_common.tracing import get_tracer
 
 # **.envの読み込み**
 load_dotenv()
@@ -54,7 +55,11 @@ def initialize_agent():
 
     # Store buffered conversation history in memory.
     memory = MemorySaver()
-    config = {"configurable": {"thread_id": "CDP Agentkit Chatbot Example!"}}
+    # The callback handler records a span per LLM call and per tool call (see agent_common/tracing.py)
+    config = {
+        "configurable": {"thread_id": "CDP Agentkit Chatbot Example!"},
+        "callbacks": [get_tracer().callback_handler()],
+    }
 
     # Create ReAct Agent using the LLM and CDP Agentkit tools.
     return create_react_agent(
@@ -76,6 +81,20 @@ def initialize_agent():
     ), config
 
 
+# 処理時間の集計を表示するメソッド
+def print_latency_summary():
+    """Print the latency histograms of the session (LLM calls, tools and turns)."""
+    rows = get_tracer().histograms()
+    if not rows:
+        return
+    print("\nLatency (ms):")
+    for row in rows:
+        print(
+            f"  {row['name']:<40} count={row['count']:<5} avg={row['avg_ms']:<10} "
+            f"p95={row['p95_ms']:<10} max={row['max_ms']}"
+        )
+
+
 # Autonomous Mode
 def run_autonomous_mode(agent_executor, config, interval=10):
     """Run the agent autonomously with specified intervals."""
@@ -89,19 +108,21 @@ def run_autonomous_mode(agent_executor, config, interval=10):
             )
 
             # Run agent in autonomous mode
-            for chunk in agent_executor.stream(
-                {"messages": [HumanMessage(content=thought)]}, config
-            ):
-                if "agent" in chunk:
-                    print(chunk["agent"]["messages"][0].content)
-                elif "tools" in chunk:
-                    print(chunk["tools"]["messages"][0].content)
-                print("-------------------")
+            with get_tracer().span("agent.turn", mode="auto"):
+                for chunk in agent_executor.stream(
+                    {"messages": [HumanMessage(content=thought)]}, config
+                ):
+                    if "agent" in chunk:
+                        print(chunk["agent"]["messages"][0].content)
+                    elif "tools" in chunk:
+                        print(chunk["tools"]["messages"][0].content)
+                    print("-------------------")
 
             # Wait before the next action
             time.sleep(interval)
 
         except KeyboardInterrupt:
+            print_latency_summary()
             print("Goodbye Agent!")
             sys.exit(0)
 
@@ -114,20 +135,23 @@ def run_chat_mode(agent_executor, config):
         try:
             user_input = input("\nPrompt: ")
             if user_input.lower() == "exit":
+                print_latency_summary()
                 break
 
             # Run agent with the user's input in chat mode
             # AI Agent経由でAIのAPIを呼び出す。
-            for chunk in agent_executor.stream(
-                {"messages": [HumanMessage(content=user_input)]}, config
-            ):
-                if "agent" in chunk:
-                    print(chunk["agent"]["messages"][0].content)
-                elif "tools" in chunk:
-                    print(chunk["tools"]["messages"][0].content)
-                print("-------------------")
+            with get_tracer().span("agent.turn", mode="chat"):
+                for chunk in agent_executor.stream(
+                    {"messages": [HumanMessage(content=user_input)]}, config
+                ):
+                    if "agent" in chunk:
+                        print(chunk["agent"]["messages"][0].content)
+                    elif "tools" in chunk:
+                        print(chunk["tools"]["messages"][0].content)
+                    print("-------------------")
 
         except KeyboardInterrupt:
+            print_latency_summary()
             print("Goodbye Agent!")
             sys.exit(0)
 